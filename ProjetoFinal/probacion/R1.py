@@ -1,59 +1,46 @@
 # requests: Sends HTTP requests to get webpage content (used for static sites).
 # beautifulsoup4: Parses and extracts HTML content (like tags, text, links).
 
+import sys
 import numpy as np
-import csv
-from funciones import formatar_numero, file_csv, file_saida_R1, anos
-
-def main():
-    print("A iniciar o processamento R1...")
-
-    # dicionario para guardar séries temporais por província
-    dados_prov = {}
-
-    try:
-        with open(file_csv, 'r', encoding='utf-8') as f:
-            leitor = csv.reader(f, delimiter=';')
-
-            # Saltar cabeçalhos (normalmente 2 linhas são suficientes neste CSV)
-            for _ in range(2): 
-                next(leitor, None)
-
-            for linha in leitor:
-                # Ignorar linhas vazias ou notas de rodapé
-                if not linha or len(linha) < 2 or "Notas" in linha[0]:
-                    continue
-
-                nome_completo = linha[0]
-
-                if "Total Nacional" in nome_completo:
-                    cod_prov = "00"
-                    nome_prov = "Total Nacional"
-                else:
-                    partes = nome_completo.split(" ", 1)
-                    cod_prov = partes[0].strip()
-                    nome_prov = partes[1].strip() if len(partes) > 1 else cod_prov
-
-                try:
-                    valores = []
-                    for x in linha[1:9]:
-                        x = x.strip().replace(".", "")
-                        if x == "": x = "0"
-                        valores.append(float(x))
-                    
-                    if len(valores) == 8:
-                        dados_prov[cod_prov] = {
-                            "nome": nome_prov,
-                            "totais": np.array(valores, dtype=float)
-                        }
-                except ValueError:
-                    continue
-
-    except FileNotFoundError:
-        print(f"ERRO: ficheiro CSV não encontrado em {file_csv}")
-        return
-
-    loop_anos = range(2017, 2010, -1) 
+from instrumentacao import medir
+from exportar import Resultados, exportar, formatos_pedidos
+from paginacao import escritor_relatorio
+from funciones import formatar_numeros, carregar_dados, variacao, file_csv, file_saida_R1, cod_nacional
+
+def calcular(dados, linhas=None):
+    """
+    Variação (absoluta, relativa) da população total de todas as províncias
+    e anos (ou só das `linhas` dadas).
+    """
+    #variação de todas as províncias e anos numa só operação
+    total = dados.bloco("Total")
+    if linhas is not None:
+        total = total[linhas]
+    return variacao(total)
+
+def formatar(var_abs, var_rel):
+    """
+    Células do R1 já formatadas: uma linha por região, (Abs, Rel) por ano.
+    """
+    #formatar todas as células de uma vez, intercalando (Abs, Rel) por ano
+    celulas = np.empty((len(var_abs), 2 * var_abs.shape[1]), dtype=object)
+    celulas[:, 0::2] = formatar_numeros(var_abs)
+    celulas[:, 1::2] = formatar_numeros(var_rel)
+    return celulas
+
+def escrever(dados, var_abs, var_rel, destino=file_saida_R1, celulas=None):
+    """
+    Grava a tabela HTML do R1 em `destino`, linha a linha (com as `celulas`
+    já formatadas, se dadas). Devolve o EscritorRelatorio (com o número
+    de linhas e células escritas).
+    """
+    #anos com variação: todos menos o mais antigo
+    anos_variacion = dados.anos[:-1]
+    periodo = f"({min(anos_variacion)}-{max(anos_variacion)})"
+
+    if celulas is None:
+        celulas = formatar(var_abs, var_rel)
 
     html_header = """
 <!DOCTYPE html>
@@ -70,7 +57,7 @@ def main():
     </style>
 </head>
 <body>
-    <h2>Variación de la Población por Provincias (2011-2017)</h2>
+    <h2>Variación de la Población por Provincias """ + periodo + """</h2>
 
     <table>
         <thead>
@@ -78,53 +65,14 @@ def main():
                 <th rowspan="2" class="titulo">Provincia</th>
 """
     # Gerar cabeçalhos dos Anos
-    for ano in loop_anos:
-        html_header += f'<th colspan="2" class="titulo">{ano}</th>'
+    html_header += "".join(f'<th colspan="2" class="titulo">{ano}</th>' for ano in anos_variacion)
     html_header += "</tr>\n<tr>"
 
     # Gerar sub-cabeçalhos (Abs/Rel)
-    for ano in loop_anos:
-        html_header += "<th>Abs</th><th>Rel (%)</th>"
+    html_header += "<th>Abs</th><th>Rel (%)</th>" * len(anos_variacion)
 
     html_header += "</tr></thead><tbody>\n"
 
-    html_body = ""
-
-    # Ordenar por código 
-    for cod in sorted(dados_prov.keys()):
-        nome = dados_prov[cod]["nome"]
-        serie = dados_prov[cod]["totais"] 
-
-        # Formatar o nome da primeira coluna
-        display_nome = nome if cod == "00" else f"{cod} {nome}"
-
-        html_body += f"<tr><td style='text-align:left; font-weight:bold;'>{display_nome}</td>"
-
-        for ano in loop_anos:
-            # Encontrar índices correspondentes na lista de dados original
-            idx_atual = anos.index(ano)
-            idx_anterior = idx_atual + 1 
-
-            if idx_anterior < len(serie):
-                val_atual = serie[idx_atual]
-                val_anterior = serie[idx_anterior]
-                
-                #var = ano_atual - ano_anterior
-                abs_v = val_atual - val_anterior
-                
-                #rel = (abs/ant) * 100
-                if val_anterior != 0:
-                    rel_v = (abs_v / val_anterior) * 100
-                else:
-                    rel_v = 0.0
-                
-                html_body += f"<td>{formatar_numero(abs_v)}</td>"
-                html_body += f"<td>{formatar_numero(rel_v)}</td>"
-            else:
-                html_body += "<td>-</td><td>-</td>"
-
-        html_body += "</tr>\n"
-
     html_footer = """
         </tbody>
     </table>
@@ -132,13 +80,72 @@ def main():
 </html>
 """
 
-    # gravar Ficheiro
+    # uma célula de nome + (Abs, Rel) por ano
+    modelo_linha = ("<tr><td style='text-align:left; font-weight:bold;'>{}</td>"
+                    + "<td>{}</td><td>{}</td>" * len(anos_variacion) + "</tr>\n")
+
+    # gravar Ficheiro, linha a linha
+    with escritor_relatorio(destino, html_header, html_footer, modelo_linha) as relatorio:
+        # Ordenar por código 
+        for cod in sorted(dados.indice):
+            nome = dados.nome(cod)
+            i = dados.indice[cod]
+
+            # Formatar o nome da primeira coluna
+            display_nome = nome if cod == cod_nacional else f"{cod} {nome}"
+
+            relatorio.linha(display_nome, *celulas[i])
+    return relatorio
+
+def resultados(dados, var_abs, var_rel):
+    """
+    Variações do R1 para exportar: região x ano, pela ordem do código.
+    """
+    ordem = np.argsort(dados.codigos, kind="stable")
+    return Resultados(np.asarray(dados.codigos)[ordem], np.asarray(dados.nomes)[ordem],
+                      [("ano", dados.anos[:-1])],
+                      {"variacao_absoluta": var_abs[ordem], "variacao_relativa": var_rel[ordem]})
+
+def main():
+    print("A iniciar o processamento R1...")
+
+    try:
+        with medir("R1", "entradas_csv") as m:
+            #cada ano é comparado com o anterior
+            dados = carregar_dados(file_csv, minimo_anos=2)
+            m.contar(linhas=len(dados), celulas=dados.matriz.size)
+    except FileNotFoundError:
+        print(f"ERRO: ficheiro CSV não encontrado em {file_csv}")
+        return 1
+    except ValueError as e:
+        print(f"ERRO: {e}")
+        return 1
+
+    with medir("R1", "variacao") as m:
+        var_abs, var_rel = calcular(dados)
+        m.contar(linhas=len(var_abs), celulas=var_abs.size)
+
+    estado = 0
     try:
-        with open(file_saida_R1, "w", encoding="utf-8") as f:
-            f.write(html_header + html_body + html_footer)
+        with medir("R1", "html") as m:
+            relatorio = escrever(dados, var_abs, var_rel)
+            m.contar(linhas=relatorio.linhas, celulas=relatorio.celulas)
         print(f"SUCESSO! Ficheiro gerado em: {file_saida_R1}")
     except Exception as e:
         print(f"ERRO: Não consegui gravar o ficheiro HTML: {e}")
+        estado = 1
+
+    formatos = formatos_pedidos()
+    if formatos:
+        try:
+            with medir("R1", "exportacao") as m:
+                gravados = exportar("R1", resultados(dados, var_abs, var_rel), formatos)
+                m.contar(linhas=len(var_abs), celulas=2 * var_abs.size)
+            print(f"SUCESSO! Dados exportados: {', '.join(gravados)}")
+        except OSError as e:
+            print(f"ERRO: Não consegui exportar os dados: {e}")
+            estado = 1
+    return estado
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,72 +1,33 @@
-import numpy as np
-import csv
-from funciones import file_comunidades, file_relacao, file_csv, file_saida_R2, ler_comunidades, ler_relacao_prov_cca, formatar_numero
+import sys
+from instrumentacao import medir
+from exportar import Resultados, exportar, formatos_pedidos
+from paginacao import escritor_relatorio
+from funciones import file_comunidades, file_relacao, file_csv, file_saida_R2, carregar_comunidades, carregar_relacao, formatar_numeros, carregar_dados, agregacao_ccaa
 
-def main():
-    print("A iniciar o processamento R2...")
-
-    #carregar os Dicionários 
-    try:
-        dic_ccaa = ler_comunidades(file_comunidades)
-        dic_mapa = ler_relacao_prov_cca(file_relacao)
-        print(f"Dicionários carregados. {len(dic_ccaa)} Comunidades encontradas.")
-    except FileNotFoundError as e:
-        print(f"ERRO CRÍTICO: Não foi possível encontrar um ficheiro: {e}")
-        print("Verifica se a pasta 'entradas' existe e se os ficheiros têm a extensão correta (.htm).")
-        return
-
-    # 24 colunas de dados (8 anos total + 8 anos homens + 8 anos mulheres)
-    dados_agregados = {}
-    
-    #inicializar arrays a zeros para cada CCAA
-    for cod_ccaa in dic_ccaa:
-        dados_agregados[cod_ccaa] = np.zeros(24, dtype=float)
+#rótulos das colunas de sexo na tabela
+rotulos_sexo = {"Hombres": "Hombre", "Mujeres": "Mujer"}
 
-    #ler CSV e Somar
-    try:
-        with open(file_csv, 'r', encoding='utf-8') as f:
-            leitor = csv.reader(f, delimiter=';')
-            # Saltar linhas de cabeçalho irrelevantes (2 linhas)
-            for _ in range(2): 
-                next(leitor, None)
-            
-            for linha in leitor:
-                #verificar se a linha tem dados suficientes, não é rodapé nem cabeçalho extra
-                if not linha or len(linha) < 2 or "Notas" in linha[0]:
-                    continue
-                
-                nome_completo = linha[0]
-                #ignorar o Total Nacional neste exercício
-                if "Total Nacional" in nome_completo:
-                    continue
-                
-                #cod provincia (tipo 00)
-                partes = nome_completo.split(" ")
-                cod_prov = partes[0].strip()
-                
-                #somar as prov q encontramos a comunidade correta
-                if cod_prov in dic_mapa:
-                    cod_ccaa = dic_mapa[cod_prov]
-                    
-                    valores = []
-                    try:
-                        for x in linha[1:25]:
-                            #tirar o . dos milhares e vazio por 0 antes de converter
-                            val_limpo = x.replace(".", "")
-                            if val_limpo.strip() == "": 
-                                val_limpo = 0
-                            valores.append(float(val_limpo))
-                        
-                        #passar para array e somar ao acumulador CCAA correspondente 
-                        if cod_ccaa in dados_agregados:
-                            dados_agregados[cod_ccaa] += np.array(valores, dtype=float)
-                    except ValueError:
-                        continue #ignora linhas com erros de conversão
+def agregar(dados, dic_ccaa, dic_mapa):
+    """
+    Soma as províncias por CCAA. Devolve (codigos_ccaa, matriz CCAA x (sexo x ano)).
+    """
+    # Ordenar pelas chaves (códigos) para manter a ordem oficial (01, 02, 03...)
+    chaves_ordenadas = sorted(dic_ccaa.keys())
 
-    except FileNotFoundError:
-        print(f"ERRO: Não encontrei o ficheiro CSV em {file_csv}")
-        return
+    #somar todas as províncias na sua CCAA de uma vez
+    #colunas por CCAA: todos os anos de cada sexo (8 anos total + 8 homens + 8 mulheres)
+    agregacao = agregacao_ccaa(dados, dic_mapa, chaves_ordenadas)
+    dados_agregados, _ = agregacao.somar(dados.matriz)
+    return chaves_ordenadas, dados_agregados
 
+def escrever(dados, dic_ccaa, chaves_ordenadas, dados_agregados, destino=file_saida_R2, celulas=None,
+             grafico="../imagenes/R3.png"):
+    """
+    Grava a tabela HTML do R2 em `destino`, linha a linha (com as `celulas`
+    já formatadas, se dadas), com o gráfico do R3 de `grafico`. Devolve o
+    EscritorRelatorio (com o número de linhas e células escritas).
+    """
+    periodo = f"({min(dados.anos)}-{max(dados.anos)})"
     html_header = """
 <!DOCTYPE html>
 <html lang="es">
@@ -84,36 +45,22 @@ def main():
     </style>
 </head>
 <body>
-    <h2>Población por Comunidades Autónomas (2010-2017)</h2>
+    <h2>Población por Comunidades Autónomas """ + periodo + """</h2>
     <table>
         <thead>
             <tr>
                 <th rowspan="2" class="titulo">CCAA</th>
-                <th colspan="8" class="titulo">Total</th>
-                <th colspan="8" class="titulo">Hombre</th>
-                <th colspan="8" class="titulo">Mujer</th>
-            </tr>
-            <tr>
-                <th>2017</th><th>2016</th><th>2015</th><th>2014</th><th>2013</th><th>2012</th><th>2011</th><th>2010</th>
-                <th>2017</th><th>2016</th><th>2015</th><th>2014</th><th>2013</th><th>2012</th><th>2011</th><th>2010</th>
-                <th>2017</th><th>2016</th><th>2015</th><th>2014</th><th>2013</th><th>2012</th><th>2011</th><th>2010</th>
-            </tr>
+"""
+    #um grupo de colunas por sexo, com todos os anos
+    for sexo in dados.sexos:
+        html_header += f'                <th colspan="{len(dados.anos)}" class="titulo">{rotulos_sexo.get(sexo, sexo)}</th>\n'
+    html_header += "            </tr>\n            <tr>\n"
+    linha_anos = "".join(f"<th>{ano}</th>" for ano in dados.anos)
+    html_header += f"                {linha_anos}\n" * len(dados.sexos)
+    html_header += """            </tr>
         </thead>
         <tbody>
 """
-    
-    html_body = ""
-    # Ordenar pelas chaves (códigos) para manter a ordem oficial (01, 02, 03...)
-    chaves_ordenadas = sorted(dic_ccaa.keys())
-
-    for cod in chaves_ordenadas:
-        nome = dic_ccaa[cod]
-        dados = dados_agregados[cod]
-        
-        html_body += f"<tr>\n<td style='text-align:left; font-weight:bold;'>{cod} {nome}</td>"
-        for val in dados:
-            html_body += f"<td>{formatar_numero(val)}</td>"
-        html_body += "\n</tr>"
 
     #rodapé com a imagem do R3 incorporada
     html_footer = """
@@ -123,21 +70,87 @@ def main():
     <hr>
     
     <div class="grafico-container">
-        <h3>Gráfico R3: Población por sexo en 2017 (Top 10 CCAA)</h3>
-        <img src="../imagenes/R3.png" alt="Gráfico de Población R3">
+        <h3>Gráfico R3: Población por sexo en """ + str(dados.anos[0]) + """ (Top 10 CCAA)</h3>
+        <img src=\"""" + grafico + """\" alt="Gráfico de Población R3">
     </div>
 
 </body>
 </html>
 """
 
-    #gravar o ficheiro
+    #nome da CCAA + 24 valores
+    modelo_linha = ("<tr>\n<td style='text-align:left; font-weight:bold;'>{}</td>"
+                    + "<td>{}</td>" * dados_agregados.shape[1] + "\n</tr>")
+
+    #gravar o ficheiro, linha a linha
+    with escritor_relatorio(destino, html_header, html_footer, modelo_linha) as relatorio:
+        if celulas is None:
+            celulas = formatar_numeros(dados_agregados)
+        for cod, valores in zip(chaves_ordenadas, celulas):
+            nome = dic_ccaa[cod]
+            relatorio.linha(f"{cod} {nome}", *valores)
+    return relatorio
+
+def resultados(dados, dic_ccaa, chaves_ordenadas, dados_agregados):
+    """
+    População do R2 para exportar: CCAA x sexo x ano.
+    """
+    return Resultados(chaves_ordenadas, [dic_ccaa[cod] for cod in chaves_ordenadas],
+                      [("sexo", dados.sexos), ("ano", dados.anos)],
+                      {"poblacion": dados_agregados})
+
+def main():
+    print("A iniciar o processamento R2...")
+
+    #carregar os Dicionários 
+    try:
+        with medir("R2", "entradas_html") as m:
+            dic_ccaa = carregar_comunidades(file_comunidades)
+            dic_mapa = carregar_relacao(file_relacao)
+            m.contar(linhas=len(dic_ccaa) + len(dic_mapa))
+        print(f"Dicionários carregados. {len(dic_ccaa)} Comunidades encontradas.")
+    except FileNotFoundError as e:
+        print(f"ERRO CRÍTICO: Não foi possível encontrar um ficheiro: {e}")
+        print("Verifica se a pasta 'entradas' existe e se os ficheiros têm a extensão correta (.htm).")
+        return 1
+
+    #ler CSV (partilhado entre relatórios)
+    try:
+        with medir("R2", "entradas_csv") as m:
+            dados = carregar_dados(file_csv)
+            m.contar(linhas=len(dados), celulas=dados.matriz.size)
+    except FileNotFoundError:
+        print(f"ERRO: Não encontrei o ficheiro CSV em {file_csv}")
+        return 1
+    except ValueError as e:
+        print(f"ERRO: {e}")
+        return 1
+
+    with medir("R2", "agregacao") as m:
+        chaves_ordenadas, dados_agregados = agregar(dados, dic_ccaa, dic_mapa)
+        m.contar(linhas=len(dados), celulas=dados.matriz.size)
+
+    estado = 0
     try:
-        with open(file_saida_R2, "w", encoding="utf-8") as f:
-            f.write(html_header + html_body + html_footer)
+        with medir("R2", "html") as m:
+            relatorio = escrever(dados, dic_ccaa, chaves_ordenadas, dados_agregados)
+            m.contar(linhas=relatorio.linhas, celulas=relatorio.celulas)
         print(f"SUCESSO! Ficheiro gerado em: {file_saida_R2}")
     except FileNotFoundError:
         print("ERRO: Não consegui gravar o ficheiro. Verifica se a pasta 'resultados' existe.")
+        estado = 1
+
+    formatos = formatos_pedidos()
+    if formatos:
+        try:
+            with medir("R2", "exportacao") as m:
+                gravados = exportar("R2", resultados(dados, dic_ccaa, chaves_ordenadas, dados_agregados), formatos)
+                m.contar(linhas=len(dados_agregados), celulas=dados_agregados.size)
+            print(f"SUCESSO! Dados exportados: {', '.join(gravados)}")
+        except OSError as e:
+            print(f"ERRO: Não consegui exportar os dados: {e}")
+            estado = 1
+    return estado
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,119 +1,50 @@
-import csv
+import sys
 import numpy as np
-from funciones import ler_comunidades, ler_relacao_prov_cca, formatar_numero, file_comunidades,file_csv, file_relacao, anos, anos_variacion, file_saida_R4
+from instrumentacao import medir
+from exportar import Resultados, exportar, formatos_pedidos
+from paginacao import escritor_relatorio
+from funciones import carregar_comunidades, carregar_relacao, formatar_numeros, carregar_dados, variacao, agregacao_ccaa, file_comunidades,file_csv, file_relacao, file_saida_R4
 
-def limpar_valor(x):
+def agregar(dados, dic_ccaa, dic_mapa):
     """
-    Converte string para float tratando separadores e notação científica.
+    Soma homens e mulheres por CCAA. Devolve (codigos_ccaa, array CCAA x 2 x anos),
+    só com as CCAA que têm pelo menos uma província nos dados.
     """
-    x = x.strip()
-    if x == "":
-        return 0.0
-    if 'E' in x or 'e' in x:
-        try:
-            return float(x)
-        except:
-            return 0.0
-    x = x.replace(".", "")
-    x = x.replace(",", ".")
-    try:
-        return float(x)
-    except:
-        return 0.0
+    #somar Hombres e Mujeres de todas as províncias por CCAA -> (CCAA x 2 x anos)
+    codigos_todos = sorted(dic_ccaa)
+    agregacao = agregacao_ccaa(dados, dic_mapa, codigos_todos)
+    sexo_h, sexo_m = dados.sexos.index("Hombres"), dados.sexos.index("Mujeres")
+    por_sexo, _ = agregacao.somar(dados.cubo()[:, [sexo_h, sexo_m]])
 
-def main():
-    print("A iniciar o processamento R4...")
+    #só as CCAA com pelo menos uma província nos dados, ordenadas por codigo
+    com_dados = agregacao.membros > 0
+    codigos_ccaa = [cod for cod, tem in zip(codigos_todos, com_dados) if tem]
 
-    try:
-        dic_ccaa = ler_comunidades(file_comunidades)
-        dic_mapa = ler_relacao_prov_cca(file_relacao)
-    except FileNotFoundError as e:
-        print("ERRO: ficheiro HTML não encontrado:", e)
-        return
-
-    #inicializar dict de CCAA
-    comunidades = {}
-    for cod in dic_ccaa.keys():
-        comunidades[cod] = {
-            "nome": dic_ccaa[cod],
-            "Hombres": np.zeros(8, dtype=float), # 8 anos (2017..2010)
-            "Mujeres": np.zeros(8, dtype=float),
-            "_has": False
-        }
+    return codigos_ccaa, por_sexo[com_dados]
 
-    try:
-        with open(file_csv, 'r', encoding='utf-8') as f:
-            leitor = csv.reader(f, delimiter=';')
-
-            for _ in range(4):
-                next(leitor, None)
-
-            for linha in leitor:
-                if not linha or len(linha) < 2 or "Notas" in linha[0]:
-                    continue
-
-                nome_completo = linha[0].strip()
-                if "Total Nacional" in nome_completo:
-                    continue
-
-                partes = nome_completo.split(" ", 1)
-                cod_prov = partes[0].strip()
-                
-                #normalizar codigo (com zero à esquerda se necessário)
-                cod_prov_z = cod_prov.zfill(2)
-
-                homem_vals = [limpar_valor(x) for x in linha[9:17]]
-                mulher_vals = [limpar_valor(x) for x in linha[17:25]]
-
-                if not (len(homem_vals) == 8 and len(mulher_vals) == 8):
-                    continue
-
-                #identificar CCAA
-                if cod_prov_z in dic_mapa:
-                    cod_ccaa = dic_mapa[cod_prov_z]
-                elif cod_prov in dic_mapa:
-                    cod_ccaa = dic_mapa[cod_prov]
-                elif cod_prov.lstrip("0") in dic_mapa:
-                    cod_ccaa = dic_mapa[cod_prov.lstrip("0")]
-                else:
-                    continue
-
-                if cod_ccaa in comunidades:
-                    comunidades[cod_ccaa]["Hombres"] += np.array(homem_vals, dtype=float)
-                    comunidades[cod_ccaa]["Mujeres"] += np.array(mulher_vals, dtype=float)
-                    comunidades[cod_ccaa]["_has"] = True
+def calcular(por_sexo):
+    """
+    Variação (absoluta, relativa) de todas as células numa só operação.
+    """
+    return variacao(por_sexo)
 
-    except FileNotFoundError:
-        print("ERRO: ficheiro CSV não encontrado:", file_csv)
-        return
-
-    vari_abs = {}
-    vari_rel = {}
-
-    for cod, info in comunidades.items():
-        if not info["_has"]: continue
-        
-        vari_abs[cod] = {"Hombres": [], "Mujeres": []}
-        vari_rel[cod] = {"Hombres": [], "Mujeres": []}
-
-        for sexo in ["Hombres", "Mujeres"]:
-            arr = info[sexo]
-            for Y in anos_variacion:
-                idx = anos.index(Y)
-                prev_idx = idx + 1
-                
-                if prev_idx < len(arr):
-                    atual = float(arr[idx])
-                    anterior = float(arr[prev_idx])
-                    
-                    abs_v = atual - anterior
-                    rel_v = (abs_v / anterior * 100.0) if anterior != 0 else 0.0
-                    
-                    vari_abs[cod][sexo].append(abs_v)
-                    vari_rel[cod][sexo].append(rel_v)
-                else:
-                    vari_abs[cod][sexo].append(0.0)
-                    vari_rel[cod][sexo].append(0.0)
+def formatar(vari_abs, vari_rel):
+    """
+    Células do R4 já formatadas: (CCAA x [Abs-Hom, Abs-Mul, Rel-Hom, Rel-Mul]).
+    """
+    forma = (len(vari_abs), vari_abs.shape[1] * vari_abs.shape[2])
+    return np.concatenate([formatar_numeros(vari_abs).reshape(forma),
+                           formatar_numeros(vari_rel).reshape(forma)], axis=1)
+
+def escrever(dados, dic_ccaa, codigos_ccaa, vari_abs, vari_rel, destino=file_saida_R4, celulas=None,
+             grafico="../imagenes/R5.png"):
+    """
+    Grava a tabela HTML do R4 em `destino`, linha a linha (com as `celulas`
+    já formatadas, se dadas), com o gráfico do R5 de `grafico`. Devolve o
+    EscritorRelatorio (com o número de linhas e células escritas).
+    """
+    anos_variacion = dados.anos[:-1]
+    n = len(anos_variacion)
 
     html = []
     html.append("<!DOCTYPE html>")
@@ -135,7 +66,7 @@ def main():
     """)
     html.append("</head><body>")
     html.append("<div class='container'>")
-    html.append("<h2>Variación de población por Comunidades Autónomas (2011-2017)</h2>")
+    html.append(f"<h2>Variación de población por Comunidades Autónomas ({min(anos_variacion)}-{max(anos_variacion)})</h2>")
 
     #tabela
     html.append("<table>")
@@ -144,16 +75,15 @@ def main():
     #linha 1: CCAA + Grandes Grupos
     html.append("<tr>")
     html.append("<th rowspan='3'>CCAA</th>")
-    html.append("<th colspan='14'>Variación Absoluta</th>")
-    html.append("<th colspan='14'>Variación Relativa (%)</th>")
+    html.append(f"<th colspan='{2 * n}'>Variación Absoluta</th>")
+    html.append(f"<th colspan='{2 * n}'>Variación Relativa (%)</th>")
     html.append("</tr>")
 
     #linha 2: Sexo
     html.append("<tr>")
-    html.append("<th colspan='7'>Hombres</th>")
-    html.append("<th colspan='7'>Mujeres</th>")
-    html.append("<th colspan='7'>Hombres</th>")
-    html.append("<th colspan='7'>Mujeres</th>")
+    for _ in range(2):
+        html.append(f"<th colspan='{n}'>Hombres</th>")
+        html.append(f"<th colspan='{n}'>Mujeres</th>")
     html.append("</tr>")
 
     #linha 3: Anos
@@ -167,45 +97,94 @@ def main():
     html.append("</thead>")
     html.append("<tbody>")
 
-    #ordenar por codigo
-    codigos_ccaa = sorted([c for c in comunidades.keys() if comunidades[c]["_has"]])
-
-    for cod in codigos_ccaa:
-        nome = comunidades[cod]["nome"]
-        
-        #recuperar listas de valores
-        vh_abs = vari_abs[cod]["Hombres"]
-        vm_abs = vari_abs[cod]["Mujeres"]
-        vh_rel = vari_rel[cod]["Hombres"]
-        vm_rel = vari_rel[cod]["Mujeres"]
+    rodape = []
+    rodape.append("</tbody></table>")
 
-        html.append(f"<tr><td class='left'>{cod} {nome}</td>")
+    #adicionar grafico 5
+    rodape.append("<hr>")
+    rodape.append("<h3>Evolución de la Población Total (Top 10 CCAA)</h3>")
+    #por omissão ../imagenes/R5.png porque o HTML está na pasta 'resultados'
+    rodape.append(f"<img src='{grafico}' alt='Gráfico R5'>")
+    rodape.append("<br><br>")
+
+    rodape.append("</div></body></html>")
+
+    #nome + 4 blocos (Abs-Hom, Abs-Mul, Rel-Hom, Rel-Mul) de anos, uma célula por linha
+    n_celulas = 4 * len(anos_variacion)
+    modelo_linha = "<tr><td class='left'>{}</td>\n" + "<td>{}</td>\n" * n_celulas + "</tr>\n"
+
+    #formatar todas as células de uma vez: (CCAA x [Abs-Hom, Abs-Mul, Rel-Hom, Rel-Mul])
+    if celulas is None:
+        celulas = formatar(vari_abs, vari_rel)
+
+    #gravar ficheiro, linha a linha
+    with escritor_relatorio(destino, "\n".join(html) + "\n", "\n".join(rodape), modelo_linha) as relatorio:
+        for k, cod in enumerate(codigos_ccaa):
+            nome = dic_ccaa[cod]
+            relatorio.linha(f"{cod} {nome}", *celulas[k])
+    return relatorio
+
+def resultados(dados, dic_ccaa, codigos_ccaa, vari_abs, vari_rel):
+    """
+    Variações do R4 para exportar: CCAA x sexo (Hombres, Mujeres) x ano.
+    """
+    return Resultados(codigos_ccaa, [dic_ccaa[cod] for cod in codigos_ccaa],
+                      [("sexo", ["Hombres", "Mujeres"]), ("ano", dados.anos[:-1])],
+                      {"variacao_absoluta": vari_abs, "variacao_relativa": vari_rel})
 
-        for v in vh_abs: html.append(f"<td>{formatar_numero(v)}</td>")
-        for v in vm_abs: html.append(f"<td>{formatar_numero(v)}</td>")
-        for v in vh_rel: html.append(f"<td>{formatar_numero(v)}</td>")
-        for v in vm_rel: html.append(f"<td>{formatar_numero(v)}</td>")
+def main():
+    print("A iniciar o processamento R4...")
 
-        html.append("</tr>")
+    try:
+        with medir("R4", "entradas_html") as m:
+            dic_ccaa = carregar_comunidades(file_comunidades)
+            dic_mapa = carregar_relacao(file_relacao)
+            m.contar(linhas=len(dic_ccaa) + len(dic_mapa))
+    except FileNotFoundError as e:
+        print("ERRO: ficheiro HTML não encontrado:", e)
+        return 1
 
-    html.append("</tbody></table>")
+    try:
+        with medir("R4", "entradas_csv") as m:
+            #cada ano é comparado com o anterior
+            dados = carregar_dados(file_csv, minimo_anos=2)
+            m.contar(linhas=len(dados), celulas=dados.matriz.size)
+    except FileNotFoundError:
+        print("ERRO: ficheiro CSV não encontrado:", file_csv)
+        return 1
+    except ValueError as e:
+        print(f"ERRO: {e}")
+        return 1
 
-    #adicionar grafico 5
-    html.append("<hr>")
-    html.append("<h3>Evolución de la Población Total (Top 10 CCAA)</h3>")
-    #o caminho é ../imagenes/R5.png porque o HTML está na pasta 'resultados'
-    html.append("<img src='../imagenes/R5.png' alt='Gráfico R5'>")
-    html.append("<br><br>")
+    with medir("R4", "agregacao") as m:
+        codigos_ccaa, por_sexo = agregar(dados, dic_ccaa, dic_mapa)
+        m.contar(linhas=len(dados), celulas=dados.matriz.size)
 
-    html.append("</div></body></html>")
+    with medir("R4", "variacao") as m:
+        vari_abs, vari_rel = calcular(por_sexo)
+        m.contar(linhas=len(vari_abs), celulas=vari_abs.size)
 
-    #gravar ficheiro
+    estado = 0
     try:
-        with open(file_saida_R4, "w", encoding="utf-8") as f:
-            f.write("\n".join(html))
+        with medir("R4", "html") as m:
+            relatorio = escrever(dados, dic_ccaa, codigos_ccaa, vari_abs, vari_rel)
+            m.contar(linhas=relatorio.linhas, celulas=relatorio.celulas)
         print("SUCESSO! Ficheiro gerado:", file_saida_R4)
     except Exception as e:
         print("ERRO ao gravar HTML:", e)
+        estado = 1
+
+    formatos = formatos_pedidos()
+    if formatos:
+        try:
+            with medir("R4", "exportacao") as m:
+                gravados = exportar("R4", resultados(dados, dic_ccaa, codigos_ccaa, vari_abs, vari_rel), formatos)
+                m.contar(linhas=len(vari_abs), celulas=2 * vari_abs.size)
+            print("SUCESSO! Dados exportados:", ", ".join(gravados))
+        except OSError as e:
+            print("ERRO ao exportar os dados:", e)
+            estado = 1
+    return estado
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,81 +1,81 @@
-import numpy as np
-import matplotlib.pyplot as plt
-import csv
-from funciones import file_comunidades, file_relacao, file_csv, file_saida_R5, ler_comunidades, ler_relacao_prov_cca, anos
+import sys
+from consultas import Consulta
+from graficos import renderizar
+from instrumentacao import medir
+from funciones import file_comunidades, file_relacao, file_csv, file_saida_R5, carregar_comunidades, carregar_relacao, carregar_dados
+
+def agregar(dados, dic_ccaa, dic_mapa):
+    """
+    Soma as províncias por CCAA. Devolve uma Selecao (CCAA x sexo x ano).
+    """
+    return Consulta(dados, dic_ccaa, dic_mapa).selecionar().agrupar("ccaa")
+
+def calcular(dados, dic_ccaa, por_ccaa):
+    """
+    Top 10 das CCAA pela média da população total.
+    Devolve as séries [(nome, valores de 2010->2017)] para o gráfico.
+    """
+    i_total = por_ccaa.sexos.index("Total")
+
+    #linha para cada comunidade no top 10 (pela media)
+    series = []
+    for cod, nome, _ in por_ccaa.top_k(10, "media", sexo="Total"):
+        valores_total = por_ccaa.linha(cod)[i_total] #usar apenas TOTAL
+
+        #inverter a ordem 2010->2017 (igual aos anos)
+        series.append((nome, valores_total[::-1]))
+    return series
+
+def desenhar(dados, series, destino=file_saida_R5):
+    """
+    Grava o gráfico de linhas do R5 em `destino`.
+    """
+    #anos do mais antigo ao mais recente (2010->2017)
+    anos_cronologicos = dados.anos[::-1]
+
+    #grafico
+    renderizar(("linhas", destino, {
+        "anos": anos_cronologicos,
+        "series": series,
+        "titulo": f"Población total en {min(dados.anos)}-{max(dados.anos)} (CCAA)",
+    }))
 
 def main():
     print("A iniciar R5 (Gráfico de Linhas)...")
 
     try:
-        dic_ccaa = ler_comunidades(file_comunidades)
-        dic_mapa = ler_relacao_prov_cca(file_relacao)
+        with medir("R5", "entradas_html") as m:
+            dic_ccaa = carregar_comunidades(file_comunidades)
+            dic_mapa = carregar_relacao(file_relacao)
+            m.contar(linhas=len(dic_ccaa) + len(dic_mapa))
     except FileNotFoundError:
         print("ERRO: Ficheiros HTML em falta.")
-        return
+        return 1
 
     #ler csv
-    dados_agregados = {cod: np.zeros(24, dtype=float) for cod in dic_ccaa}
-
     try:
-        with open(file_csv, 'r', encoding='utf-8') as f:
-            leitor = csv.reader(f, delimiter=';')
-            for _ in range(2): next(leitor, None)
-            
-            for linha in leitor:
-                if not linha or len(linha) < 2 or "Total Nacional" in linha[0] or "Notas" in linha[0]:
-                    continue
-                
-                cod_prov = linha[0].split(" ")[0].strip()
-                if cod_prov in dic_mapa:
-                    cod_ccaa = dic_mapa[cod_prov]
-                    try:
-                        vals = []
-                        for x in linha[1:25]:
-                            limpo = x.replace(".", "")
-                            if not limpo: limpo = 0
-                            vals.append(float(limpo))
-                        dados_agregados[cod_ccaa] += np.array(vals)
-                    except ValueError:
-                        continue
+        with medir("R5", "entradas_csv") as m:
+            dados = carregar_dados(file_csv)
+            m.contar(linhas=len(dados), celulas=dados.matriz.size)
     except FileNotFoundError:
         print("ERRO: CSV não encontrado.")
-        return
-
-    #top 10 a partir da media 
-    ranking = []
-    for cod, valores in dados_agregados.items():
-        media = np.mean(valores[0:8])
-        ranking.append((cod, media))
-    
-    #prdenar top 10
-    top_10 = sorted(ranking, key=lambda x: x[1], reverse=True)[:10]
-
-    #grafico
-    plt.figure(figsize=(10, 6))
+        return 1
+    except ValueError as e:
+        print(f"ERRO: {e}")
+        return 1
 
-    #linha para cada comunidade nno top 10
-    for cod, _ in top_10:
-        nome = dic_ccaa[cod]
-        valores_total = dados_agregados[cod][0:8] #usar apenas TOTAL
-        
-        #inverter a ordem 2010->2017
-        valores_cronologicos = valores_total[::-1]
-        
-        #plotar a linha com marcadores ("o-")
-        plt.plot(anos, valores_cronologicos, marker='o', label=nome)
+    with medir("R5", "agregacao") as m:
+        dados_agregados = agregar(dados, dic_ccaa, dic_mapa)
+        m.contar(linhas=len(dados), celulas=dados.matriz.size)
 
-    #configuração visual
-    plt.title("Población total en 2010-2017 (CCAA)")
-    plt.ylabel("1e6") 
-    plt.grid(True, linestyle='--', alpha=0.5)
-    
-    plt.legend(bbox_to_anchor=(1.02, 1), loc='upper left', borderaxespad=0.)
-    
-    plt.tight_layout()
+    with medir("R5", "ranking") as m:
+        series = calcular(dados, dic_ccaa, dados_agregados)
+        m.contar(linhas=len(dados_agregados))
 
-    #guardar
-    plt.savefig(file_saida_R5)
+    with medir("R5", "grafico"):
+        desenhar(dados, series)
     print(f"SUCESSO: Gráfico gerado em {file_saida_R5}")
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
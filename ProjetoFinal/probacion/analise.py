@@ -0,0 +1,211 @@
+import argparse
+import sys
+import time
+import numpy as np
+from funciones import carregar_comunidades, carregar_relacao, carregar_poblacion, formatar_numero
+from caminhos import ler_janela, resolver_formatos
+from consultas import NIVEIS, Consulta
+from exportar import Resultados, exportar
+
+#indicadores de séries temporais para todas as regiões de uma vez: crescimento
+#anual composto (CAGR), médias móveis, evolução da razão entre sexos e
+#tendência linear com projeções. Cada indicador é uma operação sobre o array
+#(regiões x sexos x anos) inteiro, sem ciclos por região nem por indicador
+
+JANELA = 3
+
+def cagr(serie, anos):
+    """
+    Crescimento anual composto (%) entre o primeiro e o último ano de
+    `serie` (... x anos, por ordem cronológica). 0 quando o primeiro ano é 0.
+    """
+    periodo = anos[-1] - anos[0]
+    primeiro, ultimo = serie[..., 0], serie[..., -1]
+    razao = np.ones_like(primeiro)
+    np.divide(ultimo, primeiro, out=razao, where=(primeiro > 0) & (ultimo >= 0))
+    if periodo <= 0:
+        return np.zeros_like(primeiro)
+    return (razao ** (1.0 / periodo) - 1) * 100
+
+def medias_moveis(serie, janela):
+    """
+    Médias de `janela` colunas seguidas ao longo do último eixo, com somas
+    acumuladas (uma passagem, qualquer que seja a janela).
+    """
+    acumulada = np.zeros(serie.shape[:-1] + (serie.shape[-1] + 1,))
+    np.cumsum(serie, axis=-1, out=acumulada[..., 1:])
+    return (acumulada[..., janela:] - acumulada[..., :-janela]) / janela
+
+def tendencia(serie, anos):
+    """
+    Reta dos mínimos quadrados de cada série: (inclinação, ordenada na origem),
+    com um só produto matricial sobre o eixo dos anos.
+    """
+    x = np.asarray(anos, dtype=np.float64)
+    centrado = x - x.mean()
+    sxx = centrado @ centrado
+    if sxx == 0:
+        inclinacao = np.zeros(serie.shape[:-1])
+    else:
+        inclinacao = (serie @ centrado) / sxx
+    ordenada = serie.mean(axis=-1) - inclinacao * x.mean()
+    return inclinacao, ordenada
+
+class Indicadores:
+    """
+    Indicadores de uma Selecao (ver consultas.py), para todas as suas regiões:
+    - `cagr`, `inclinacao`, `ordenada`: (regiões x sexos)
+    - `medias`: (regiões x sexos x anos_medias), média dos `janela` anos até cada um
+    - `projecao`: (regiões x sexos x anos_projecao), pela tendência linear
+    - `razao_sexos`: (regiões x anos), homens por 100 mulheres (None sem esses sexos)
+    Os anos vão do mais antigo para o mais recente. `linha(cod)` dá tudo de uma região.
+    """
+    def __init__(self, selecao, janela=JANELA, anos_projecao=()):
+        if janela < 1:
+            raise ValueError("a janela das médias móveis tem de ser pelo menos 1 ano")
+        self.codigos = list(selecao.codigos)
+        self.nomes = list(selecao.nomes)
+        self.sexos = list(selecao.sexos)
+        self.indice = {cod: i for i, cod in enumerate(self.codigos)}
+
+        #a Selecao tem o ano mais recente primeiro; aqui ordem cronológica, em float
+        self.anos = list(selecao.anos[::-1])
+        serie = np.asarray(selecao.valores[..., ::-1], dtype=np.float64)
+
+        self.cagr = cagr(serie, self.anos)
+        self.inclinacao, self.ordenada = tendencia(serie, self.anos)
+        self.anos_projecao = list(anos_projecao)
+        futuros = np.asarray(self.anos_projecao, dtype=np.float64)
+        self.projecao = self.ordenada[..., None] + self.inclinacao[..., None] * futuros
+
+        self.janela = min(janela, len(self.anos))
+        self.anos_medias = self.anos[self.janela - 1:]
+        self.medias = medias_moveis(serie, self.janela)
+
+        self.razao_sexos = None
+        if "Hombres" in self.sexos and "Mujeres" in self.sexos:
+            homens = serie[:, self.sexos.index("Hombres")]
+            mulheres = serie[:, self.sexos.index("Mujeres")]
+            self.razao_sexos = np.zeros_like(homens)
+            np.divide(homens * 100, mulheres, out=self.razao_sexos, where=mulheres != 0)
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def linha(self, cod):
+        """
+        Indicadores da região com o código `cod`: {sexo: {...}} e a razão entre sexos.
+        """
+        i = self.indice[cod]
+        resultado = {"nome": self.nomes[i], "sexos": {}}
+        for s, sexo in enumerate(self.sexos):
+            resultado["sexos"][sexo] = {
+                "cagr": float(self.cagr[i, s]),
+                "inclinacao": float(self.inclinacao[i, s]),
+                "medias": dict(zip(self.anos_medias, self.medias[i, s].tolist())),
+                "projecao": dict(zip(self.anos_projecao, self.projecao[i, s].tolist())),
+            }
+        if self.razao_sexos is not None:
+            resultado["razao_sexos"] = dict(zip(self.anos, self.razao_sexos[i].tolist()))
+        return resultado
+
+    def resultados(self):
+        """
+        Os indicadores como Resultados (um por forma), para o exportar.py.
+        """
+        tabelas = {
+            "analise": Resultados(self.codigos, self.nomes, [("sexo", self.sexos)],
+                                  {"cagr": self.cagr, "inclinacao": self.inclinacao,
+                                   "ordenada": self.ordenada}),
+            "analise_medias": Resultados(self.codigos, self.nomes,
+                                         [("sexo", self.sexos), ("ano", self.anos_medias)],
+                                         {"media_movel": self.medias}),
+        }
+        if self.anos_projecao:
+            tabelas["analise_projecao"] = Resultados(self.codigos, self.nomes,
+                                                     [("sexo", self.sexos), ("ano", self.anos_projecao)],
+                                                     {"projecao": self.projecao})
+        if self.razao_sexos is not None:
+            tabelas["analise_razao_sexos"] = Resultados(self.codigos, self.nomes, [("ano", self.anos)],
+                                                        {"razao_sexos": self.razao_sexos})
+        return tabelas
+
+def _com_sinal(valor):
+    #formato europeu com o sinal, como nas variações: +1.234,50
+    return ("+" if valor >= 0 else "") + formatar_numero(valor)
+
+def _lista_anos(texto):
+    #"2020,2025" -> [2020, 2025]
+    return [int(a) for a in texto.split(",") if a.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CAGR, médias móveis, razão entre sexos e projeções por região.")
+    parser.add_argument("--nivel", choices=NIVEIS, default="provincia")
+    parser.add_argument("--anos", type=ler_janela, default=None, help="intervalo, ex: 2010-2017")
+    parser.add_argument("--ccaa", default=None, help="só as províncias destas CCAA (ex: 01,13)")
+    parser.add_argument("--codigos", default=None, help="regiões a mostrar (ex: 28,08); por omissão o top pelo CAGR")
+    parser.add_argument("--sexo", default="Total", help="sexo mostrado")
+    parser.add_argument("--janela", type=int, default=JANELA, help="anos de cada média móvel")
+    parser.add_argument("--projetar", type=_lista_anos, default=[], help="anos a projetar (ex: 2020,2025)")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--exportar", default=None, metavar="FORMATOS",
+                        help="grava todos os indicadores em resultados/dados (ver main.py --exportar)")
+    args = parser.parse_args(argv)
+
+    try:
+        dic_ccaa = carregar_comunidades()
+        dic_mapa = carregar_relacao()
+        dados = carregar_poblacion()
+    except FileNotFoundError as e:
+        print(f"ERRO: ficheiro de entrada em falta: {e}")
+        return 1
+
+    inicio = time.perf_counter()
+    try:
+        ccaa = args.ccaa.split(",") if args.ccaa else None
+        selecao = Consulta(dados, dic_ccaa, dic_mapa).selecionar(ccaa=ccaa, anos=args.anos).agrupar(args.nivel)
+        indicadores = Indicadores(selecao, args.janela, args.projetar)
+        if args.sexo not in indicadores.sexos:
+            raise ValueError(f"sexo desconhecido: {args.sexo}")
+        formatos = []
+        if args.exportar:
+            formatos = resolver_formatos(args.exportar)
+    except ValueError as e:
+        print(f"ERRO: {e}")
+        return 2
+    segundos = time.perf_counter() - inicio
+
+    s = indicadores.sexos.index(args.sexo)
+    if args.codigos:
+        codigos = [c.strip() for c in args.codigos.split(",") if c.strip()]
+        em_falta = [c for c in codigos if c not in indicadores.indice]
+        if em_falta:
+            print(f"ERRO: região(ões) sem dados neste nível: {', '.join(em_falta)}")
+            return 2
+        linhas = [indicadores.indice[c] for c in codigos]
+    else:
+        linhas = np.argsort(-indicadores.cagr[:, s], kind="stable")[:args.top].tolist()
+
+    anos = indicadores.anos
+    print(f"{args.sexo}, {anos[0]}-{anos[-1]}, nível {args.nivel} "
+          f"(médias de {indicadores.janela} anos, último {indicadores.anos_medias[-1]}):")
+    for i in linhas:
+        texto = (f"{indicadores.codigos[i]} {indicadores.nomes[i]}: CAGR {_com_sinal(indicadores.cagr[i, s])}%, "
+                 f"tendência {_com_sinal(indicadores.inclinacao[i, s])}/ano, "
+                 f"média móvel {formatar_numero(indicadores.medias[i, s, -1])}")
+        if indicadores.razao_sexos is not None:
+            texto += (f", homens/100 mulheres {formatar_numero(indicadores.razao_sexos[i, 0])}"
+                      f" -> {formatar_numero(indicadores.razao_sexos[i, -1])}")
+        for ano, valor in zip(indicadores.anos_projecao, indicadores.projecao[i, s]):
+            texto += f", {ano}: {formatar_numero(valor)}"
+        print(texto)
+    print(f"({len(indicadores)} regiões em {segundos * 1000:.1f} ms)")
+
+    if formatos:
+        for nome, resultados in indicadores.resultados().items():
+            for ficheiro in exportar(nome, resultados, formatos):
+                print(f"SUCESSO! {ficheiro}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
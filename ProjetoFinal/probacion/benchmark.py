@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import cache
+import funciones
+import sintetico
+from funciones import base_dir, ler_comunidades, ler_relacao_prov_cca, ler_poblacion, carregar_poblacion
+import R1
+import R2
+import R3
+import R4
+import R5
+
+#mede cada etapa dos relatórios (leitura das tabelas HTML, leitura do CSV,
+#agregação, variação, escrita do HTML e gráficos) sobre dados sintéticos
+#e grava os tempos em JSON para comparar entre commits; não precisa de rede
+
+def cronometrar(funcao, repeticoes, preparar=None):
+    """
+    Corre `funcao` `repeticoes` vezes (chamando `preparar` antes de cada uma,
+    fora do tempo medido). Devolve (último resultado, lista de tempos).
+    """
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        if preparar is not None:
+            preparar()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return resultado, tempos
+
+def medir(ficheiros, pasta_saida, repeticoes=3):
+    """
+    Mede todas as etapas sobre os ficheiros gerados por sintetico.gerar_dados.
+    As saídas (HTML e PNG) vão para `pasta_saida`.
+    Devolve uma lista de {"relatorio", "etapa", "min", "mediana", "tempos"}.
+    """
+    resultados = []
+
+    def registar(relatorio, etapa, funcao, preparar=None):
+        valor, tempos = cronometrar(funcao, repeticoes, preparar)
+        resultados.append({"relatorio": relatorio, "etapa": etapa, "min": min(tempos),
+                           "mediana": statistics.median(tempos), "tempos": tempos})
+        return valor
+
+    def saida(nome):
+        return os.path.join(pasta_saida, nome)
+
+    #entradas partilhadas por todos os relatórios
+    dic_ccaa = registar("comum", "html_comunidades", lambda: ler_comunidades(ficheiros["comunidades"]))
+    dic_mapa = registar("comum", "html_relacao", lambda: ler_relacao_prov_cca(ficheiros["relacao"]))
+    dados = registar("comum", "csv", lambda: ler_poblacion(ficheiros["csv"]))
+    #a primeira leitura grava a cache; só as seguintes são medidas,
+    #sem a memória do processo para obrigar a ler o .npz
+    carregar_poblacion(ficheiros["csv"], usar_cache=True)
+    registar("comum", "csv_cache", lambda: carregar_poblacion(ficheiros["csv"], usar_cache=True),
+             funciones._entradas_lidas.clear)
+
+    #a agregação fica memorizada nos dados; esquecê-la para medir o cálculo completo
+    def sem_memo():
+        dados._agregacoes.clear()
+
+    var_abs, var_rel = registar("R1", "variacao", lambda: R1.calcular(dados))
+    registar("R1", "html", lambda: R1.escrever(dados, var_abs, var_rel, saida("R1.html")))
+
+    codigos, agregados = registar("R2", "agregacao", lambda: R2.agregar(dados, dic_ccaa, dic_mapa), sem_memo)
+    registar("R2", "html", lambda: R2.escrever(dados, dic_ccaa, codigos, agregados, saida("R2.html")))
+
+    agregados = registar("R3", "agregacao", lambda: R3.agregar(dados, dic_ccaa, dic_mapa), sem_memo)
+    top = registar("R3", "ranking", lambda: R3.calcular(dados, dic_ccaa, agregados))
+    registar("R3", "grafico", lambda: R3.desenhar(dados, *top, saida("R3.png")))
+
+    codigos, por_sexo = registar("R4", "agregacao", lambda: R4.agregar(dados, dic_ccaa, dic_mapa), sem_memo)
+    vari_abs, vari_rel = registar("R4", "variacao", lambda: R4.calcular(por_sexo))
+    registar("R4", "html", lambda: R4.escrever(dados, dic_ccaa, codigos, vari_abs, vari_rel, saida("R4.html")))
+
+    agregados = registar("R5", "agregacao", lambda: R5.agregar(dados, dic_ccaa, dic_mapa), sem_memo)
+    series = registar("R5", "ranking", lambda: R5.calcular(dados, dic_ccaa, agregados))
+    registar("R5", "grafico", lambda: R5.desenhar(dados, series, saida("R5.png")))
+
+    return resultados
+
+def versao_codigo():
+    """
+    Commit atual do repositório (ou None fora de um repositório git).
+    """
+    try:
+        saida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=base_dir,
+                               capture_output=True, text=True, check=True)
+        return saida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def comparar(anteriores, resultados):
+    """
+    Imprime o tempo mínimo de cada etapa face a um ficheiro de resultados anterior.
+    """
+    antes = {(r["relatorio"], r["etapa"]): r["min"] for r in anteriores["resultados"]}
+    print(f"\n{'etapa':<22}{'antes':>10}{'agora':>10}{'razão':>8}")
+    for r in resultados:
+        chave = (r["relatorio"], r["etapa"])
+        if chave in antes and antes[chave] > 0:
+            print(f"{r['relatorio'] + '.' + r['etapa']:<22}{antes[chave] * 1000:>8.1f}ms"
+                  f"{r['min'] * 1000:>8.1f}ms{r['min'] / antes[chave]:>8.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o desempenho de cada etapa dos relatórios R1-R5.")
+    parser.add_argument("--escala", choices=sorted(sintetico.ESCALAS), default="provincias")
+    parser.add_argument("--regioes", type=int, default=None, help="número de regiões (substitui a escala)")
+    parser.add_argument("--anos", type=int, default=None, help="número de anos (substitui a escala)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--saida", default=None,
+                        help="ficheiro JSON dos resultados (por omissão benchmark-<escala>.json)")
+    parser.add_argument("--comparar", default=None, help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args(argv)
+
+    n_regioes, n_anos = sintetico.ESCALAS[args.escala]
+    n_regioes = args.regioes or n_regioes
+    n_anos = args.anos or n_anos
+    saida = args.saida or f"benchmark-{args.escala}.json"
+
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as pasta:
+        print(f"A gerar dados sintéticos: {n_regioes} regiões x {n_anos} anos...")
+        ficheiros = sintetico.gerar_dados(os.path.join(pasta, "entradas"), n_regioes, n_anos)
+        os.makedirs(os.path.join(pasta, "saidas"))
+        #cache própria para não misturar com a do projeto
+        cache.pasta_cache = os.path.join(pasta, "cache")
+
+        resultados = medir(ficheiros, os.path.join(pasta, "saidas"), args.repeticoes)
+        tamanho_csv = os.path.getsize(ficheiros["csv"])
+
+    relatorio = {
+        "meta": {
+            "commit": versao_codigo(),
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "plataforma": platform.platform(),
+            "escala": args.escala,
+            "regioes": n_regioes,
+            "anos": n_anos,
+            "bytes_csv": tamanho_csv,
+            "repeticoes": args.repeticoes,
+        },
+        "resultados": resultados,
+    }
+
+    print(f"\n{'etapa':<22}{'mín':>10}{'mediana':>10}")
+    for r in resultados:
+        print(f"{r['relatorio'] + '.' + r['etapa']:<22}{r['min'] * 1000:>8.1f}ms{r['mediana'] * 1000:>8.1f}ms")
+
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=1)
+    print(f"\nResultados gravados em {saida}")
+
+    if args.comparar:
+        try:
+            with open(args.comparar, "r", encoding="utf-8") as f:
+                comparar(json.load(f), resultados)
+        except (OSError, ValueError) as e:
+            print(f"ERRO: não consegui ler {args.comparar}: {e}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
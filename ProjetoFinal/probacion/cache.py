@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import sys
+import zipfile
+import numpy as np
+from caminhos import pasta_cache
+
+#aumentar sempre que mudar o formato dos dados guardados ou a forma de os ler
+VERSAO_CACHE = 2
+
+def cache_ativa():
+    """
+    A cache pode ser desligada com a variável de ambiente PTC_SEM_CACHE=1.
+    """
+    return os.environ.get("PTC_SEM_CACHE", "") in ("", "0")
+
+def hash_ficheiro(ficheiro):
+    """
+    Devolve o sha256 do conteúdo do ficheiro (lido em blocos).
+    """
+    h = hashlib.sha256()
+    with open(ficheiro, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+def caminho_cache(ficheiro, tipo):
+    """
+    Um ficheiro .npz por (ficheiro de entrada, tipo de leitura).
+    """
+    chave = hashlib.sha1(os.path.abspath(ficheiro).encode("utf-8")).hexdigest()[:12]
+    nome = os.path.splitext(os.path.basename(ficheiro))[0]
+    return os.path.join(pasta_cache, f"{tipo}-{nome}-{chave}.npz")
+
+def ler_cache(ficheiro, tipo):
+    """
+    Devolve o dicionário de arrays guardado para o ficheiro, ou None
+    se não existir ou já não corresponder ao ficheiro de entrada.
+    O tamanho e o mtime são verificados primeiro; se só o mtime mudou,
+    o conteúdo é comparado pelo hash antes de descartar a cache.
+    """
+    destino = caminho_cache(ficheiro, tipo)
+    if not os.path.exists(destino):
+        return None
+
+    try:
+        with np.load(destino, allow_pickle=False) as npz:
+            meta = json.loads(str(npz["__meta__"]))
+            if meta.get("versao") != VERSAO_CACHE or meta.get("tipo") != tipo:
+                return None
+
+            st = os.stat(ficheiro)
+            if st.st_size != meta["tamanho"]:
+                return None
+
+            arrays = {k: npz[k] for k in npz.files if k != "__meta__"}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+    if st.st_mtime_ns != meta["mtime_ns"]:
+        if hash_ficheiro(ficheiro) != meta["sha256"]:
+            return None
+        #mesmo conteúdo: atualizar o mtime para não voltar a calcular o hash
+        gravar_cache(ficheiro, tipo, arrays)
+
+    return arrays
+
+def gravar_cache(ficheiro, tipo, arrays):
+    """
+    Guarda os arrays num .npz junto com a assinatura do ficheiro de entrada.
+    A escrita é feita num ficheiro temporário e depois renomeada.
+    """
+    st = os.stat(ficheiro)
+    meta = {
+        "versao": VERSAO_CACHE,
+        "tipo": tipo,
+        "ficheiro": os.path.abspath(ficheiro),
+        "tamanho": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": hash_ficheiro(ficheiro),
+    }
+
+    os.makedirs(pasta_cache, exist_ok=True)
+    destino = caminho_cache(ficheiro, tipo)
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    try:
+        with open(temporario, "wb") as f:
+            np.savez(f, __meta__=np.array(json.dumps(meta)), **arrays)
+        os.replace(temporario, destino)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+def obter(ficheiro, tipo, ler, para_arrays, de_arrays, usar_cache=None):
+    """
+    Lê `ficheiro` através da cache em disco.
+    `ler(ficheiro)` só é chamado quando a cache não é válida;
+    `para_arrays`/`de_arrays` convertem o resultado de/para um dict de arrays.
+    Com usar_cache=False a cache é ignorada (nem lida nem escrita).
+    """
+    if usar_cache is None:
+        usar_cache = cache_ativa()
+
+    if usar_cache:
+        arrays = ler_cache(ficheiro, tipo)
+        if arrays is not None:
+            return de_arrays(arrays)
+
+    valor = ler(ficheiro)
+
+    if usar_cache:
+        try:
+            gravar_cache(ficheiro, tipo, para_arrays(valor))
+        except OSError as e:
+            print(f"AVISO: não foi possível gravar a cache de {ficheiro}: {e}")
+    return valor
+
+def limpar_cache():
+    """
+    Apaga todos os ficheiros da cache e devolve quantos foram apagados.
+    """
+    if not os.path.isdir(pasta_cache):
+        return 0
+    apagados = 0
+    for nome in os.listdir(pasta_cache):
+        if nome.endswith(".npz"):
+            os.remove(os.path.join(pasta_cache, nome))
+            apagados += 1
+    return apagados
+
+if __name__ == "__main__":
+    if "--limpar" in sys.argv[1:]:
+        print(f"Cache limpa: {limpar_cache()} ficheiro(s) apagado(s) em {pasta_cache}")
+    else:
+        print("Uso: python cache.py --limpar")
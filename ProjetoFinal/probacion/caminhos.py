@@ -0,0 +1,94 @@
+import os
+
+#caminhos do projeto, sem dependências pesadas:
+#o main.py importa daqui para que --help e --list não carreguem numpy/matplotlib
+
+#base directory = folder where the report modules are located
+base_dir = os.path.dirname(os.path.abspath(__file__))
+projeto_dir = os.path.dirname(base_dir)
+
+def caminho(rel_path):
+    return os.path.join(projeto_dir, rel_path)
+
+#ficheiros de entrada
+file_csv = caminho("entradas/poblacionProvinciasHM2010-17.csv")
+file_comunidades = caminho("entradas/comunidadesAutonomas.htm")
+file_relacao = caminho("entradas/comunidadAutonoma-Provincia.htm")
+
+#ficheiros de saida
+file_saida_R1 = caminho("resultados/variacionProvincias.html")
+file_saida_R2 = caminho("resultados/poblacionComAutonomas.html")
+file_saida_R3 = caminho("imagenes/R3.png")
+file_saida_R4 = caminho("resultados/variacionComAutonomas.html")
+file_saida_R5 = caminho("imagenes/R5.png")
+
+#a cache fica em ProjetoFinal/.cache (ou na pasta indicada em PTC_CACHE_DIR)
+pasta_cache = os.environ.get("PTC_CACHE_DIR") or os.path.join(projeto_dir, ".cache")
+
+#histórico das publicações do INE (ver historico.py)
+pasta_historico = os.environ.get("PTC_HISTORICO_DIR") or caminho("historico")
+
+def ler_janela(texto):
+    """
+    Janela de anos: "2012-2017" -> (2012, 2017); "2015" -> (2015, 2015); "" ou None -> None.
+    """
+    if not texto:
+        return None
+    partes = texto.split("-")
+    try:
+        inicio, fim = int(partes[0]), int(partes[-1])
+    except ValueError:
+        raise ValueError(f"janela de anos inválida: {texto} (ex: 2012-2017)") from None
+    return min(inicio, fim), max(inicio, fim)
+
+#exportações dos resultados numéricos (R1, R2, R4) para outros programas
+pasta_exportacao = caminho("resultados/dados")
+
+#formato -> extensão ("npy" é uma pasta com um .npy por array, para np.load(mmap_mode="r"))
+FORMATOS_EXPORTACAO = {
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+    "npz": ".npz",
+    "npy": "",
+    "csv": ".csv",
+    "jsonl": ".jsonl",
+}
+
+#como os relatórios HTML (R1, R2, R4) são escritos (ver paginacao.py)
+MODOS_HTML = ("completo", "paginado", "estatico")
+
+def indice_paginas(destino):
+    """
+    Índice (JSON) das páginas que os modos paginado e estatico geram ao lado
+    de um relatório HTML; o número de páginas só se sabe ao escrever.
+    """
+    return os.path.splitext(destino)[0] + ".paginas.json"
+
+def resolver_formatos(texto):
+    """
+    "parquet,csv" -> ["parquet", "csv"]. "auto" escolhe Parquet se o pyarrow
+    estiver instalado e senão .npz + CSV. Levanta ValueError para formatos
+    desconhecidos ou Parquet/Arrow sem pyarrow.
+    """
+    import importlib.util
+    tem_pyarrow = importlib.util.find_spec("pyarrow") is not None
+
+    formatos = []
+    for nome in (p.strip().lower() for p in texto.split(",")):
+        if not nome:
+            continue
+        if nome == "auto":
+            formatos += ["parquet"] if tem_pyarrow else ["npz", "csv"]
+        elif nome not in FORMATOS_EXPORTACAO:
+            raise ValueError(f"formato desconhecido: {nome} (use auto, {', '.join(FORMATOS_EXPORTACAO)})")
+        elif nome in ("parquet", "arrow") and not tem_pyarrow:
+            raise ValueError(f"o formato {nome} precisa do pyarrow (pip install pyarrow)")
+        else:
+            formatos.append(nome)
+    return list(dict.fromkeys(formatos))
+
+def ficheiros_exportacao(relatorio, formatos, pasta=pasta_exportacao):
+    """
+    Caminho de cada formato exportado de um relatório: {formato: caminho}.
+    """
+    return {f: os.path.join(pasta, relatorio + FORMATOS_EXPORTACAO[f]) for f in formatos}
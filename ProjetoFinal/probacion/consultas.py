@@ -0,0 +1,246 @@
+import argparse
+import time
+import numpy as np
+from caminhos import ler_janela
+from funciones import (carregar_comunidades, carregar_relacao, carregar_poblacion, agregacao_ccaa, ordem_grupos,
+                       somar_grupos, formatar_numero, cod_nacional)
+
+#consultas sobre os dados já carregados: escolher regiões, anos e sexos,
+#agrupar por província, CCAA ou total nacional e obter o top-k de uma métrica,
+#tudo com operações sobre a matriz (sem voltar a ler ficheiros)
+
+NIVEIS = ("provincia", "ccaa", "nacional")
+
+#métricas por região; `v` é (... x anos) com o ano mais recente primeiro
+def _media(v):
+    return v.mean(axis=-1)
+
+def _soma(v):
+    return v.sum(axis=-1)
+
+def _ultimo(v):
+    return v[..., 0].astype(np.float64)
+
+def _crescimento(v):
+    return (v[..., 0] - v[..., -1]).astype(np.float64)
+
+def _crescimento_relativo(v):
+    #em %, 0 quando o primeiro ano do intervalo é 0
+    base = v[..., -1].astype(np.float64)
+    relativo = np.zeros_like(base)
+    np.divide(v[..., 0] - base, base, out=relativo, where=base != 0)
+    return relativo * 100
+
+METRICAS = {
+    "media": _media,
+    "soma": _soma,
+    "ultimo": _ultimo,
+    "crescimento": _crescimento,
+    "crescimento_relativo": _crescimento_relativo,
+}
+
+class Consulta:
+    """
+    Índices sobre um objeto Poblacion, calculados uma vez:
+    código -> linha, ano -> coluna, sexo -> bloco e província -> CCAA.
+    `selecionar` devolve uma Selecao ao nível das províncias.
+    """
+    def __init__(self, dados, dic_ccaa, dic_mapa):
+        self.dados = dados
+        self.dic_ccaa = dic_ccaa
+        self.codigos_ccaa = sorted(dic_ccaa)
+        self.agregacao = agregacao_ccaa(dados, dic_mapa, self.codigos_ccaa)
+
+        self.indice_anos = {ano: j for j, ano in enumerate(dados.anos)}
+        self.indice_sexos = {sexo: s for s, sexo in enumerate(dados.sexos)}
+        #todas as linhas menos a do Total Nacional
+        self.provincias = np.flatnonzero(np.asarray(dados.codigos) != cod_nacional)
+        #linhas de cada CCAA (pela posição em codigos_ccaa)
+        ordem, grupos, inicios = ordem_grupos(self.agregacao.indices)
+        self.linhas_ccaa = {cod: np.zeros(0, dtype=np.intp) for cod in self.codigos_ccaa}
+        for g, linhas in zip(grupos, np.split(ordem, inicios[1:])):
+            self.linhas_ccaa[self.codigos_ccaa[g]] = linhas
+
+    def _colunas_anos(self, anos):
+        if anos is None:
+            return list(range(len(self.dados.anos)))
+        if isinstance(anos, tuple) and len(anos) == 2:
+            inicio, fim = sorted(anos)
+            colunas = [j for ano, j in self.indice_anos.items() if inicio <= ano <= fim]
+        else:
+            em_falta = [ano for ano in anos if ano not in self.indice_anos]
+            if em_falta:
+                raise ValueError(f"ano(s) sem dados: {', '.join(map(str, em_falta))}")
+            colunas = sorted(self.indice_anos[ano] for ano in anos)
+        if not colunas:
+            raise ValueError(f"nenhum ano com dados em {anos}")
+        return colunas
+
+    def _blocos_sexos(self, sexos):
+        if sexos is None:
+            return list(range(len(self.dados.sexos)))
+        if isinstance(sexos, str):
+            sexos = [sexos]
+        em_falta = [s for s in sexos if s not in self.indice_sexos]
+        if em_falta:
+            raise ValueError(f"sexo(s) desconhecido(s): {', '.join(em_falta)}")
+        return [self.indice_sexos[s] for s in sexos]
+
+    def _linhas(self, codigos, ccaa):
+        linhas = self.provincias
+        if ccaa is not None:
+            desconhecidas = [c for c in ccaa if c not in self.linhas_ccaa]
+            if desconhecidas:
+                raise ValueError(f"CCAA desconhecida(s): {', '.join(desconhecidas)}")
+            linhas = np.intersect1d(linhas, np.concatenate([self.linhas_ccaa[c] for c in ccaa]))
+        if codigos is not None:
+            em_falta = [c for c in codigos if c not in self.dados.indice]
+            if em_falta:
+                raise ValueError(f"região(ões) sem dados: {', '.join(em_falta)}")
+            linhas = np.intersect1d(linhas, [self.dados.indice[c] for c in codigos])
+        return linhas
+
+    def selecionar(self, codigos=None, ccaa=None, anos=None, sexos=None):
+        """
+        Províncias escolhidas por código (`codigos`) e/ou pela CCAA a que
+        pertencem (`ccaa`), nos anos pedidos (lista ou intervalo (inicio, fim))
+        e para os sexos pedidos (nome ou lista). None = tudo.
+        """
+        linhas = self._linhas(codigos, ccaa)
+        blocos = self._blocos_sexos(sexos)
+        colunas = self._colunas_anos(anos)
+
+        #só indexar os eixos que são de facto filtrados (np.ix_ copia tudo)
+        valores = self.dados.cubo()[linhas]
+        if len(blocos) != len(self.dados.sexos):
+            valores = valores[:, blocos]
+        if len(colunas) != len(self.dados.anos):
+            valores = valores[:, :, colunas]
+        return Selecao(self, "provincia",
+                       np.asarray(self.dados.codigos)[linhas].tolist(),
+                       np.asarray(self.dados.nomes)[linhas].tolist(),
+                       [self.dados.anos[j] for j in colunas],
+                       [self.dados.sexos[s] for s in blocos],
+                       valores, linhas)
+
+class Selecao:
+    """
+    Resultado de uma consulta: `valores` é um array (regiões x sexos x anos)
+    com os anos do mais recente para o mais antigo, e `codigos`/`nomes`
+    identificam cada região ao `nivel` atual.
+    """
+    def __init__(self, consulta, nivel, codigos, nomes, anos, sexos, valores, linhas=None):
+        self.consulta = consulta
+        self.nivel = nivel
+        self.codigos = codigos
+        self.nomes = nomes
+        self.anos = anos
+        self.sexos = sexos
+        self.valores = valores
+        self._linhas = linhas #linhas originais (só ao nível das províncias)
+        self.indice = {cod: i for i, cod in enumerate(codigos)}
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def linha(self, cod):
+        """
+        Array (sexos x anos) da região com o código `cod`.
+        """
+        return self.valores[self.indice[cod]]
+
+    def agrupar(self, nivel):
+        """
+        Soma as províncias da seleção por CCAA ("ccaa") ou num total ("nacional").
+        """
+        if nivel not in NIVEIS:
+            raise ValueError(f"nível desconhecido: {nivel} (use {', '.join(NIVEIS)})")
+        if nivel == self.nivel:
+            return self
+        if self.nivel != "provincia" or nivel == "provincia":
+            raise ValueError(f"não é possível passar de {self.nivel} para {nivel}")
+
+        consulta = self.consulta
+        if nivel == "nacional":
+            valores = self.valores.sum(axis=0, keepdims=True)
+            return Selecao(consulta, nivel, [cod_nacional], ["Total Nacional"],
+                           self.anos, self.sexos, valores)
+
+        grupos = consulta.agregacao.indices[self._linhas]
+        valores = somar_grupos(self.valores, ordem_grupos(grupos), len(consulta.codigos_ccaa))
+        return Selecao(consulta, nivel, list(consulta.codigos_ccaa),
+                       [consulta.dic_ccaa[c] for c in consulta.codigos_ccaa],
+                       self.anos, self.sexos, valores)
+
+    def metrica(self, nome="media", sexo=None):
+        """
+        Valor da métrica (nome de METRICAS ou função sobre (regiões x anos))
+        de cada região, para um sexo (por omissão o primeiro da seleção).
+        """
+        funcao = METRICAS.get(nome, nome) if isinstance(nome, str) else nome
+        if not callable(funcao):
+            raise ValueError(f"métrica desconhecida: {nome} (use {', '.join(METRICAS)})")
+        if sexo is not None and sexo not in self.sexos:
+            raise ValueError(f"sexo fora da seleção: {sexo}")
+        s = self.sexos.index(sexo) if sexo is not None else 0
+        return funcao(self.valores[:, s])
+
+    def top_k(self, k, metrica="media", sexo=None, maiores=True):
+        """
+        As `k` regiões com maior (ou menor) valor da métrica, com np.argpartition
+        (sem ordenar todas). Devolve [(codigo, nome, valor)] por ordem; em caso de
+        empate fica primeiro a região que vem primeiro na seleção.
+        """
+        valores = np.asarray(self.metrica(metrica, sexo), dtype=np.float64)
+        chave = -valores if maiores else valores
+        n = len(chave)
+        k = min(k, n)
+        if k <= 0:
+            return []
+
+        if k < n:
+            #os empatados com o k-ésimo também entram, para o desempate ser pela posição
+            limiar = chave[np.argpartition(chave, k - 1)[:k]].max()
+            candidatos = np.flatnonzero(chave <= limiar)
+        else:
+            candidatos = np.arange(n)
+        ordem = candidatos[np.lexsort((candidatos, chave[candidatos]))][:k]
+        return [(self.codigos[i], self.nomes[i], valores[i]) for i in ordem]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Top-k de regiões por uma métrica da população.")
+    parser.add_argument("--nivel", choices=NIVEIS, default="provincia")
+    parser.add_argument("--anos", type=ler_janela, default=None, help="intervalo, ex: 2013-2016")
+    parser.add_argument("--sexo", default="Total")
+    parser.add_argument("--ccaa", default=None, help="só as províncias destas CCAA (ex: 01,13)")
+    parser.add_argument("--metrica", choices=sorted(METRICAS), default="media")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--menores", action="store_true", help="as de menor valor em vez das de maior")
+    args = parser.parse_args(argv)
+
+    try:
+        dic_ccaa = carregar_comunidades()
+        dic_mapa = carregar_relacao()
+        dados = carregar_poblacion()
+    except FileNotFoundError as e:
+        print(f"ERRO: ficheiro de entrada em falta: {e}")
+        return
+
+    inicio = time.perf_counter()
+    try:
+        consulta = Consulta(dados, dic_ccaa, dic_mapa)
+        ccaa = args.ccaa.split(",") if args.ccaa else None
+        selecao = consulta.selecionar(ccaa=ccaa, anos=args.anos, sexos=args.sexo).agrupar(args.nivel)
+        resultado = selecao.top_k(args.top, args.metrica, maiores=not args.menores)
+    except ValueError as e:
+        print(f"ERRO: {e}")
+        return
+    segundos = time.perf_counter() - inicio
+
+    print(f"{args.metrica} ({args.sexo}, {min(selecao.anos)}-{max(selecao.anos)}), nível {args.nivel}:")
+    for posicao, (cod, nome, valor) in enumerate(resultado, 1):
+        print(f"{posicao:>3}. {cod} {nome}: {formatar_numero(valor)}")
+    print(f"({segundos * 1000:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
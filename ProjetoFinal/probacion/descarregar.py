@@ -0,0 +1,271 @@
+import argparse
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+from caminhos import pasta_cache, file_comunidades, file_relacao
+
+#descarrega as páginas e CSV do INE em paralelo: uma ligação keep-alive por
+#servidor em cada thread, pedidos condicionais (ETag / Last-Modified) e uma
+#cache em disco das respostas. Só o documento pedido é gravado (sem os
+#_files com jquery, css e imagens que o browser guarda)
+
+#páginas de códigos usadas pelos relatórios: (url, destino)
+PAGINAS_INE = [
+    ("https://www.ine.es/daco/daco42/codmun/cod_ccaa.htm", file_comunidades),
+    ("https://www.ine.es/daco/daco42/codmun/cod_ccaa_provincia.htm", file_relacao),
+]
+
+pasta_cache_http = os.path.join(pasta_cache, "http")
+
+def _gravar(destino, conteudo):
+    #temporário na mesma pasta e os.replace: quem lê nunca vê um ficheiro a meio
+    #(sem o funciones, que traria o numpy para um simples cliente HTTP)
+    temporario = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporario, "wb") as f:
+            f.write(conteudo)
+        os.replace(temporario, destino)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+MAX_REDIRECIONAMENTOS = 5
+AGENTE = "probacion/1.0 (+descarregar.py)"
+
+class Resultado:
+    """
+    Resultado de um pedido: `estado` é "novo" (200), "nao_modificado"
+    (304, vem da cache) ou "erro" (com a mensagem em `erro`).
+    """
+    def __init__(self, url, destino, estado, tamanho=0, segundos=0.0, erro=None):
+        self.url = url
+        self.destino = destino
+        self.estado = estado
+        self.tamanho = tamanho
+        self.segundos = segundos
+        self.erro = erro
+
+    def __repr__(self):
+        return f"Resultado({self.url}, {self.estado})"
+
+class CacheHTTP:
+    """
+    Respostas guardadas em disco por URL: o corpo e um .json com o ETag
+    e o Last-Modified usados no pedido condicional seguinte.
+    """
+    def __init__(self, pasta=pasta_cache_http):
+        self.pasta = pasta
+
+    def _base(self, url):
+        return os.path.join(self.pasta, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def ler_meta(self, url):
+        try:
+            with open(self._base(url) + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        #sem o corpo a resposta guardada não serve
+        return meta if os.path.exists(self._base(url) + ".corpo") else None
+
+    def ler_corpo(self, url):
+        with open(self._base(url) + ".corpo", "rb") as f:
+            return f.read()
+
+    def gravar(self, url, corpo, cabecalhos):
+        os.makedirs(self.pasta, exist_ok=True)
+        base = self._base(url)
+        meta = {
+            "url": url,
+            "etag": cabecalhos.get("ETag"),
+            "last_modified": cabecalhos.get("Last-Modified"),
+            "tamanho": len(corpo),
+            "data": time.time(),
+        }
+        #o corpo primeiro: um .json nunca aponta para um corpo incompleto
+        _gravar(base + ".corpo", corpo)
+        _gravar(base + ".json", json.dumps(meta).encode("utf-8"))
+
+class Sessao:
+    """
+    Ligações HTTP(S) reutilizadas (keep-alive): uma por servidor em cada thread,
+    porque uma http.client.HTTPConnection não pode ser partilhada entre threads.
+    """
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._todas = []
+        self._trinco = threading.Lock()
+
+    def _ligacao(self, esquema, servidor):
+        ligacoes = getattr(self._local, "ligacoes", None)
+        if ligacoes is None:
+            ligacoes = self._local.ligacoes = {}
+        chave = (esquema, servidor)
+        if chave not in ligacoes:
+            classe = http.client.HTTPSConnection if esquema == "https" else http.client.HTTPConnection
+            ligacoes[chave] = classe(servidor, timeout=self.timeout)
+            with self._trinco:
+                self._todas.append(ligacoes[chave])
+        return ligacoes[chave]
+
+    def get(self, url, cabecalhos):
+        """
+        Faz um GET e devolve (status, cabeçalhos, corpo já descomprimido).
+        Se o servidor fechou a ligação entretanto, volta a tentar numa nova.
+        """
+        partes = urlsplit(url)
+        caminho = partes.path or "/"
+        if partes.query:
+            caminho += "?" + partes.query
+
+        for tentativa in range(2):
+            ligacao = self._ligacao(partes.scheme, partes.netloc)
+            try:
+                ligacao.request("GET", caminho, headers=cabecalhos)
+                resposta = ligacao.getresponse()
+                #ler tudo antes de reutilizar a ligação
+                corpo = resposta.read()
+                break
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    BrokenPipeError, ConnectionResetError):
+                ligacao.close()
+                if tentativa:
+                    raise
+            except Exception:
+                #uma ligação a meio de uma resposta não pode ser reutilizada
+                ligacao.close()
+                raise
+
+        if resposta.getheader("Content-Encoding", "").lower() == "gzip":
+            corpo = gzip.decompress(corpo)
+        if resposta.will_close:
+            ligacao.close()
+        return resposta.status, resposta.headers, corpo
+
+    def fechar(self):
+        with self._trinco:
+            for ligacao in self._todas:
+                ligacao.close()
+            self._todas.clear()
+
+def _descarregar_um(sessao, cache, url, destino):
+    inicio = time.perf_counter()
+    pedido_url = url
+    meta = cache.ler_meta(url) if cache is not None else None
+
+    for _ in range(MAX_REDIRECIONAMENTOS + 1):
+        cabecalhos = {"User-Agent": AGENTE, "Accept-Encoding": "gzip"}
+        if meta is not None:
+            if meta.get("etag"):
+                cabecalhos["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                cabecalhos["If-Modified-Since"] = meta["last_modified"]
+
+        status, resposta, corpo = sessao.get(pedido_url, cabecalhos)
+        if status in (301, 302, 303, 307, 308) and resposta.get("Location"):
+            pedido_url = urljoin(pedido_url, resposta["Location"])
+            continue
+        break
+    else:
+        return Resultado(url, destino, "erro", erro="demasiados redirecionamentos")
+
+    if status == 304 and meta is not None:
+        corpo = cache.ler_corpo(url)
+        estado = "nao_modificado"
+    elif status == 200:
+        if cache is not None:
+            cache.gravar(url, corpo, resposta)
+        estado = "novo"
+    else:
+        return Resultado(url, destino, "erro", segundos=time.perf_counter() - inicio,
+                         erro=f"HTTP {status}")
+
+    #só reescrever o destino quando o conteúdo mudou (não mexe no mtime do pipeline)
+    if not _igual(destino, corpo):
+        os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+        _gravar(destino, corpo)
+    return Resultado(url, destino, estado, len(corpo), time.perf_counter() - inicio)
+
+def _igual(ficheiro, corpo):
+    try:
+        if os.path.getsize(ficheiro) != len(corpo):
+            return False
+        with open(ficheiro, "rb") as f:
+            return f.read() == corpo
+    except OSError:
+        return False
+
+def descarregar(pedidos, jobs=8, cache=None, timeout=30):
+    """
+    Descarrega cada (url, destino) de `pedidos` com `jobs` threads.
+    Com uma CacheHTTP os pedidos são condicionais e um 304 reutiliza
+    o corpo guardado. Devolve a lista de Resultado pela ordem dos pedidos.
+    """
+    pedidos = list(pedidos)
+    sessao = Sessao(timeout)
+
+    def um(pedido):
+        url, destino = pedido
+        try:
+            return _descarregar_um(sessao, cache, url, destino)
+        except (OSError, http.client.HTTPException) as e:
+            return Resultado(url, destino, "erro", erro=str(e) or type(e).__name__)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(pedidos) or 1))) as pool:
+            return list(pool.map(um, pedidos))
+    finally:
+        sessao.fechar()
+
+def _pedido_csv(texto, pasta):
+    #"URL" ou "URL=nome.csv" -> (url, caminho em `pasta`)
+    url, _, nome = texto.partition("=")
+    if not nome:
+        nome = os.path.basename(urlsplit(url).path) or "dados.csv"
+    return url, os.path.join(pasta, nome)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Descarrega as páginas de códigos e os CSV do INE.")
+    parser.add_argument("--csv", action="append", default=[], metavar="URL[=NOME]",
+                        help="CSV exportado do INE a descarregar (pode repetir)")
+    parser.add_argument("--pasta", default=os.path.dirname(file_comunidades),
+                        help="pasta onde gravar os CSV (por omissão 'entradas')")
+    parser.add_argument("--base", default=None,
+                        help="servidor a usar em vez de https://www.ine.es (ex: um servidor local de teste)")
+    parser.add_argument("--sem-paginas", action="store_true", help="não descarrega as páginas de códigos")
+    parser.add_argument("--jobs", "-j", type=int, default=8)
+    parser.add_argument("--sem-cache", action="store_true", help="não usa a cache HTTP (pedidos completos)")
+    args = parser.parse_args(argv)
+
+    pedidos = [] if args.sem_paginas else list(PAGINAS_INE)
+    if args.base:
+        pedidos = [(urljoin(args.base, urlsplit(url).path), destino) for url, destino in pedidos]
+    pedidos += [_pedido_csv(c, args.pasta) for c in args.csv]
+    if not pedidos:
+        print("Nada para descarregar.")
+        return 0
+
+    inicio = time.perf_counter()
+    resultados = descarregar(pedidos, jobs=args.jobs, cache=None if args.sem_cache else CacheHTTP())
+    total = time.perf_counter() - inicio
+
+    erros = 0
+    for r in resultados:
+        if r.estado == "erro":
+            erros += 1
+            print(f"ERRO: {r.url}: {r.erro}")
+        else:
+            print(f"{r.estado:<15}{r.tamanho:>10} B {r.segundos:>6.2f} s  {r.url} -> {r.destino}")
+    print(f"{len(resultados)} pedido(s) em {total:.2f} s")
+    return 1 if erros else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import csv
+import json
+import os
+import numpy as np
+from caminhos import pasta_exportacao, ficheiros_exportacao
+from funciones import escrita_atomica
+
+#exporta os resultados numéricos dos relatórios diretamente dos arrays
+#(sem passar pelo texto formatado "1.234,56" do HTML): Parquet/Arrow com o
+#pyarrow, .npz / .npy (np.load, com mmap no .npy) e CSV / JSON lines
+
+#formatos pedidos pelo main.py --exportar (chega também aos processos do pool)
+VAR_EXPORTAR = "PTC_EXPORTAR"
+
+def formatos_pedidos():
+    """
+    Formatos a exportar nesta execução (lista vazia = não exportar).
+    """
+    return [f for f in os.environ.get(VAR_EXPORTAR, "").split(",") if f]
+
+class Resultados:
+    """
+    Resultados de um relatório: uma entrada por região (`codigos`, `nomes`),
+    os eixos restantes com os seus rótulos, ex: [("sexo", [...]), ("ano", [...])],
+    e as medidas, arrays (regiões x eixo1 x eixo2 ...).
+    """
+    def __init__(self, codigos, nomes, eixos, medidas):
+        self.codigos = np.asarray(codigos, dtype=str)
+        self.nomes = np.asarray(nomes, dtype=str)
+        self.eixos = [(nome, np.asarray(rotulos)) for nome, rotulos in eixos]
+        forma = (len(self.codigos),) + tuple(len(r) for _, r in self.eixos)
+        self.medidas = {nome: np.asarray(m).reshape(forma) for nome, m in medidas.items()}
+
+    def arrays(self):
+        """
+        Os arrays tal como estão (para .npz / .npy).
+        """
+        arrays = {"codigos": self.codigos, "nomes": self.nomes}
+        for nome, rotulos in self.eixos:
+            arrays[f"eixo_{nome}"] = rotulos
+        arrays.update(self.medidas)
+        return arrays
+
+    def colunas(self):
+        """
+        Tabela longa em colunas: uma linha por (região, eixo1, eixo2, ...),
+        montada com np.repeat / np.tile sobre os arrays.
+        """
+        tamanhos = [len(r) for _, r in self.eixos]
+        por_regiao = int(np.prod(tamanhos))
+        colunas = {
+            "codigo": np.repeat(self.codigos, por_regiao),
+            "nome": np.repeat(self.nomes, por_regiao),
+        }
+        for k, (nome, rotulos) in enumerate(self.eixos):
+            dentro = int(np.prod(tamanhos[k + 1:]))
+            fora = len(self.codigos) * int(np.prod(tamanhos[:k]))
+            colunas[nome] = np.tile(np.repeat(rotulos, dentro), fora)
+        for nome, valores in self.medidas.items():
+            colunas[nome] = valores.reshape(-1)
+        return colunas
+
+def _tabela_arrow(resultados):
+    import pyarrow as pa
+    return pa.table(resultados.colunas())
+
+def _gravar_parquet(resultados, destino):
+    import pyarrow.parquet as pq
+    with escrita_atomica(destino, "wb") as f:
+        pq.write_table(_tabela_arrow(resultados), f)
+
+def _gravar_arrow(resultados, destino):
+    #ficheiro IPC sem compressão: pode ser lido com memory map (pa.memory_map)
+    import pyarrow.feather as feather
+    with escrita_atomica(destino, "wb") as f:
+        feather.write_feather(_tabela_arrow(resultados), f, compression="uncompressed")
+
+def _gravar_npz(resultados, destino):
+    with escrita_atomica(destino, "wb") as f:
+        np.savez(f, **resultados.arrays())
+
+def _gravar_npy(resultados, pasta):
+    os.makedirs(pasta, exist_ok=True)
+    for nome, array in resultados.arrays().items():
+        with escrita_atomica(os.path.join(pasta, f"{nome}.npy"), "wb") as f:
+            np.save(f, array)
+
+def _gravar_csv(resultados, destino):
+    colunas = resultados.colunas()
+    with escrita_atomica(destino, newline="") as f:
+        escritor = csv.writer(f, lineterminator="\n")
+        escritor.writerow(colunas)
+        escritor.writerows(zip(*(c.tolist() for c in colunas.values())))
+
+def _gravar_jsonl(resultados, destino):
+    colunas = resultados.colunas()
+    nomes = list(colunas)
+    with escrita_atomica(destino) as f:
+        for linha in zip(*(c.tolist() for c in colunas.values())):
+            f.write(json.dumps(dict(zip(nomes, linha)), ensure_ascii=False))
+            f.write("\n")
+
+_escritores = {
+    "parquet": _gravar_parquet,
+    "arrow": _gravar_arrow,
+    "npz": _gravar_npz,
+    "npy": _gravar_npy,
+    "csv": _gravar_csv,
+    "jsonl": _gravar_jsonl,
+}
+
+def exportar(relatorio, resultados, formatos=None, pasta=pasta_exportacao):
+    """
+    Grava os Resultados de `relatorio` em cada formato (por omissão os
+    pedidos em PTC_EXPORTAR). Devolve a lista de ficheiros gravados.
+    """
+    if formatos is None:
+        formatos = formatos_pedidos()
+    os.makedirs(pasta, exist_ok=True)
+    gravados = []
+    for formato, destino in ficheiros_exportacao(relatorio, formatos, pasta).items():
+        _escritores[formato](resultados, destino)
+        gravados.append(destino)
+    return gravados
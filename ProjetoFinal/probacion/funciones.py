@@ -1,28 +1,545 @@
 import csv
-from bs4 import BeautifulSoup
+import numpy as np
+import operator
 import os
+import re
+from contextlib import contextmanager
+import cache
+import tabelas_html
+from caminhos import (base_dir, projeto_dir, caminho, ler_janela, file_csv, file_comunidades, file_relacao,
+                      file_saida_R1, file_saida_R2, file_saida_R3, file_saida_R4, file_saida_R5)
 
-#base directory = folder where funciones.py is located
-base_dir = os.path.dirname(os.path.abspath(__file__))
-projeto_dir = os.path.dirname(base_dir)
+@contextmanager
+def escrita_atomica(ficheiro, modo="w", encoding="utf-8", buffering=-1, newline=None):
+    """
+    Abre um ficheiro temporário na mesma pasta e só o renomeia para
+    `ficheiro` quando o bloco termina sem erro. Quem lê o ficheiro
+    nunca vê uma saída a meio nem fica com uma saída truncada.
+    """
+    temporario = f"{ficheiro}.{os.getpid()}.tmp"
+    if "b" in modo:
+        encoding = None
+    try:
+        with open(temporario, modo, encoding=encoding, buffering=buffering, newline=newline) as f:
+            yield f
+        os.replace(temporario, ficheiro)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
 
-def caminho(rel_path):
-    return os.path.join(projeto_dir, rel_path)
+#anos e sexos do CSV fornecido; só usados se o CSV não tiver cabeçalho
+#(os dados lidos trazem os seus próprios em Poblacion.anos / Poblacion.sexos)
+anos = [2017, 2016, 2015, 2014, 2013, 2012, 2011, 2010]
+anos_variacion = anos[:-1]
+sexos = ["Total", "Hombres", "Mujeres"]
 
-#ficheiros de entrada
-file_csv = caminho("entradas/poblacionProvinciasHM2010-17.csv")
-file_comunidades = caminho("entradas/comunidadesAutonomas.htm")
-file_relacao = caminho("entradas/comunidadAutonoma-Provincia.htm")
+#linhas de dados lidas de cada vez pelo leitor por blocos
+TAMANHO_BLOCO_CSV = 10000
 
-#ficheiros de saida
-file_saida_R1 = caminho("resultados/variacionProvincias.html")
-file_saida_R2 = caminho("resultados/poblacionComAutonomas.html")
-file_saida_R3 = caminho("imagenes/R3.png")
-file_saida_R4 = caminho("variacionComAutonomas.html")
-file_saida_R5 = caminho("imagenes/R5.png")
+#codigo usado para a linha "Total Nacional" do CSV
+cod_nacional = "00"
 
-anos = [2017, 2016, 2015, 2014, 2013, 2012, 2011, 2010]
-anos_variacion = anos[:-1]
+class Poblacion:
+    """
+    Dados do CSV em formato colunar: uma matriz int64 contígua
+    (regiões x (sexo x ano)), os códigos e nomes das regiões
+    e um índice {codigo: linha}.
+    As colunas seguem a ordem do CSV: um bloco por sexo (Total, Hombres,
+    Mujeres), cada um com os anos do cabeçalho (mais recente primeiro).
+    """
+    def __init__(self, codigos, nomes, matriz, anos_dados=anos, sexos_dados=sexos):
+        self.codigos = np.asarray(codigos)
+        self.nomes = np.asarray(nomes)
+        self.matriz = np.ascontiguousarray(matriz, dtype=np.int64)
+        self.anos = list(anos_dados)
+        self.sexos = list(sexos_dados)
+        self.indice = {cod: i for i, cod in enumerate(self.codigos.tolist())}
+        self._agregacoes = {}
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def bloco(self, sexo="Total"):
+        """
+        Devolve a vista (regiões x anos) de um sexo, sem copiar a matriz.
+        """
+        n = len(self.anos)
+        i = self.sexos.index(sexo)
+        return self.matriz[:, i * n:(i + 1) * n]
+
+    def cubo(self):
+        """
+        Devolve a matriz como vista (regiões x sexo x ano).
+        """
+        return self.matriz.reshape(len(self), len(self.sexos), len(self.anos))
+
+    def linha(self, cod):
+        """
+        Devolve a linha completa (sexo x ano) da região com o código dado.
+        """
+        return self.matriz[self.indice[cod]]
+
+    def nome(self, cod):
+        return str(self.nomes[self.indice[cod]])
+
+    def recortar(self, linhas=None, anos_escolhidos=None):
+        """
+        Novo Poblacion só com as `linhas` (posições) e os anos pedidos,
+        pela ordem original. None = todas as linhas / todos os anos.
+        """
+        cubo = self.cubo()
+        codigos, nomes = self.codigos, self.nomes
+        if linhas is not None:
+            linhas = np.asarray(linhas, dtype=np.intp)
+            cubo, codigos, nomes = cubo[linhas], codigos[linhas], nomes[linhas]
+        anos_dados = self.anos
+        if anos_escolhidos is not None:
+            escolhidos = set(anos_escolhidos)
+            colunas = [j for j, ano in enumerate(self.anos) if ano in escolhidos]
+            cubo = cubo[:, :, colunas]
+            anos_dados = [self.anos[j] for j in colunas]
+        return Poblacion(codigos, nomes, cubo.reshape(len(codigos), -1), anos_dados, self.sexos)
+
+def procurar_ccaa(cod_prov, dic_mapa):
+    """
+    Devolve o código da CCAA de uma província, aceitando códigos
+    com ou sem zero à esquerda ("4" / "04"). None se não existir.
+    """
+    for cod in (cod_prov.zfill(2), cod_prov, cod_prov.lstrip("0")):
+        if cod in dic_mapa:
+            return dic_mapa[cod]
+    return None
+
+def ordem_grupos(indices):
+    """
+    Prepara a soma por grupos: devolve (ordem, grupos, inicios), onde `ordem`
+    são as linhas com grupo (>= 0) ordenadas por grupo, `grupos` os grupos
+    com pelo menos uma linha e `inicios` onde cada um começa em `ordem`.
+    """
+    validos = np.flatnonzero(indices >= 0)
+    ordem = validos[np.argsort(indices[validos], kind="stable")]
+    grupos, inicios = np.unique(indices[ordem], return_index=True)
+    return ordem, grupos, inicios
+
+def somar_grupos(matriz, preparado, n_grupos):
+    """
+    Soma as linhas de `matriz` por grupo (com o resultado de ordem_grupos).
+    Com as linhas já ordenadas basta um np.add.reduceat, bem mais rápido
+    que np.add.at; grupos sem linhas ficam a 0.
+    """
+    ordem, grupos, inicios = preparado
+    matriz = np.asarray(matriz)
+    por_grupo = np.zeros((n_grupos,) + matriz.shape[1:], dtype=matriz.dtype)
+    if len(ordem):
+        por_grupo[grupos] = np.add.reduceat(matriz[ordem], inicios, axis=0)
+    return por_grupo
+
+class Agregacao:
+    """
+    Mapa província -> CCAA compilado num array de índices:
+    indices[linha] é a posição da CCAA em `grupos`, ou -1 se a linha
+    não pertence a nenhuma (Total Nacional ou província desconhecida).
+    """
+    def __init__(self, codigos_linhas, dic_mapa, codigos_grupos):
+        self.grupos = list(codigos_grupos)
+        posicao = {cod: k for k, cod in enumerate(self.grupos)}
+
+        self.indices = np.full(len(codigos_linhas), -1, dtype=np.intp)
+        self.sem_grupo = [] #províncias que não pertencem a nenhuma CCAA
+        for i, cod in enumerate(codigos_linhas):
+            k = posicao.get(procurar_ccaa(cod, dic_mapa))
+            if k is not None:
+                self.indices[i] = k
+            elif cod != cod_nacional:
+                self.sem_grupo.append(cod)
+        self._preparar()
+
+    @classmethod
+    def de_indices(cls, codigos_grupos, indices, sem_grupo=()):
+        """
+        Agregacao a partir de `indices` já compilados (ex: em memória partilhada).
+        """
+        agregacao = cls.__new__(cls)
+        agregacao.grupos = list(codigos_grupos)
+        agregacao.indices = indices
+        agregacao.sem_grupo = list(sem_grupo)
+        agregacao._preparar()
+        return agregacao
+
+    def _preparar(self):
+        self.validos = self.indices >= 0
+        #número de províncias em cada CCAA
+        self.membros = np.bincount(self.indices[self.validos], minlength=len(self.grupos))
+        self._preparado = ordem_grupos(self.indices)
+
+    def somar(self, matriz):
+        """
+        Soma as linhas de `matriz` (primeiro eixo = linhas dos dados) por CCAA.
+        Devolve (por_grupo, nacional), onde nacional é a soma de todas as CCAA.
+        """
+        por_grupo = somar_grupos(matriz, self._preparado, len(self.grupos))
+        return por_grupo, por_grupo.sum(axis=0)
+
+def agregacao_ccaa(dados, dic_mapa, codigos_ccaa):
+    """
+    Devolve a Agregacao das linhas de `dados` pelas CCAA dadas,
+    compilada só na primeira vez para cada (mapa, lista de CCAA).
+    As províncias sem CCAA são avisadas nessa altura.
+    """
+    chave = (id(dic_mapa), tuple(codigos_ccaa))
+    mapa, agregacao = dados._agregacoes.get(chave, (None, None))
+    if mapa is not dic_mapa:
+        agregacao = Agregacao(dados.codigos.tolist(), dic_mapa, codigos_ccaa)
+        dados._agregacoes[chave] = (dic_mapa, agregacao)
+        if agregacao.sem_grupo:
+            print(f"AVISO: {len(agregacao.sem_grupo)} província(s) sem CCAA: {', '.join(agregacao.sem_grupo)}")
+    return agregacao
+
+#entradas já lidas nesta execução, por (tipo, caminho do ficheiro)
+_entradas_lidas = {}
+
+#formatos dos números nas células do CSV do INE
+FORMATO_DECIMAL = "decimal"   #"390032.0", "4.6572132E7"
+FORMATO_ESPANHOL = "espanhol" #"1.234.567", "1.234,5"
+FORMATO_MISTO = "misto"       #os dois no mesmo bloco: decidido célula a célula
+
+#células usadas para detetar o formato antes de converter um bloco
+AMOSTRA_FORMATO = 1000
+
+#separador usado para juntar as células (nunca aparece num número)
+_SEP = "\x1f"
+_re_espanhol = re.compile(r",|\.\d*\.")                       #vírgula ou dois pontos na mesma célula
+_re_decimal = re.compile(r"[eE]|\.(?!\d{3}(?:[.,\s\x1f]|$))") #expoente ou ponto sem 3 dígitos depois
+
+def detetar_formato(celulas):
+    """
+    Formato dos números de um conjunto de células (lista de textos).
+    Um ponto seguido de exatamente 3 dígitos ("390.032") é ambíguo e conta
+    como separador de milhares, a não ser que haja outras células em formato
+    decimal: as populações são inteiras. None se só houver inteiros simples
+    (os dois formatos dão o mesmo).
+    """
+    texto = _SEP.join(celulas)
+    espanhol = _re_espanhol.search(texto) is not None
+    decimal = _re_decimal.search(texto) is not None
+    if espanhol and decimal:
+        return FORMATO_MISTO
+    if decimal:
+        return FORMATO_DECIMAL
+    if espanhol or "." in texto:
+        return FORMATO_ESPANHOL
+    return None
+
+def _converter_texto(texto, formato):
+    #uma célula (caminho lento, só para blocos mistos ou com células inválidas)
+    texto = texto.strip()
+    if not texto:
+        return 0.0
+    #num bloco misto só as células sem ambiguidade ("1.234.567", "1,5") são espanholas
+    if formato == FORMATO_ESPANHOL or (formato == FORMATO_MISTO and _re_espanhol.search(texto)):
+        texto = texto.replace(".", "").replace(",", ".")
+    return float(texto)
+
+def converter_celulas(celulas, formato=None):
+    """
+    Converte de uma vez uma lista de células do CSV (textos) para int64.
+    Devolve (valores, validos): `validos` é False nas células que não são
+    números (que ficam a 0), em vez de as trocar por 0 em silêncio.
+    Vazio vale 0 e é válido. `formato` é FORMATO_DECIMAL, FORMATO_ESPANHOL
+    ou None para o detetar (ver detetar_formato).
+    A conversão é feita por float() em C (map + np.fromiter), sem um ciclo
+    Python por célula; esse só é usado para blocos mistos ou com erros.
+    """
+    n = len(celulas)
+    if formato is None:
+        formato = detetar_formato(celulas[:AMOSTRA_FORMATO])
+        if formato in (None, FORMATO_ESPANHOL):
+            #a amostra não chega: um só "390032.0" no resto muda a leitura dos pontos
+            formato = detetar_formato(celulas) or FORMATO_DECIMAL
+
+    textos = celulas
+    if formato == FORMATO_ESPANHOL:
+        #tirar os separadores de milhares do bloco inteiro de uma vez
+        textos = _SEP.join(celulas).replace(".", "").replace(",", ".").split(_SEP) if n else []
+
+    validos = None
+    try:
+        if formato == FORMATO_MISTO:
+            raise ValueError(formato)
+        valores = np.fromiter(map(float, textos), dtype=np.float64, count=n)
+    except ValueError:
+        valores = np.zeros(n, dtype=np.float64)
+        validos = np.ones(n, dtype=bool)
+        #se a amostra disse decimal, o resto do bloco pode ter células espanholas
+        por_celula = FORMATO_MISTO if formato == FORMATO_DECIMAL else formato
+        for i, texto in enumerate(celulas):
+            try:
+                valores[i] = _converter_texto(texto, por_celula)
+            except ValueError:
+                validos[i] = False
+
+    #"nan" e "inf" são aceites pelo float() mas não são populações
+    finitos = np.isfinite(valores)
+    if validos is None:
+        validos = finitos
+    else:
+        validos &= finitos
+    valores[~validos] = 0
+    return np.rint(valores).astype(np.int64), validos
+
+def converter_celula(x):
+    """
+    Converte uma célula do CSV do INE para inteiro.
+    Aceita "390032.0", "4.6572132E7" e "1.234.567"; vazio vale 0.
+    Levanta ValueError se não for um número.
+    """
+    valores, validos = converter_celulas([x])
+    if not validos[0]:
+        raise ValueError(f"valor inválido: {x!r}")
+    return int(valores[0])
+
+def _codigo_e_nome(celula):
+    """
+    Separa "02 Albacete" em ("02", "Albacete"). O Total Nacional fica com
+    o código cod_nacional. Devolve None se a linha não for de dados
+    (títulos, cabeçalhos, notas de rodapé).
+    """
+    nome_completo = celula.strip()
+    if "Total Nacional" in nome_completo:
+        return cod_nacional, "Total Nacional"
+    partes = nome_completo.split(" ", 1)
+    cod = partes[0].strip()
+    if not cod.isdigit():
+        return None
+    return cod, (partes[1].strip() if len(partes) > 1 else cod)
+
+class CabecalhoCSV:
+    """
+    Estrutura das colunas do CSV, deduzida das duas linhas de cabeçalho
+    (";Total;;...;Hombres;;..." e ";2017;2016;..."): os sexos e anos
+    presentes e, para cada coluna da matriz (sexo x ano), a coluna do CSV
+    de onde vem.
+    """
+    def __init__(self, sexos_csv, anos_csv, origem):
+        self.sexos = sexos_csv
+        self.anos = anos_csv
+        self.origem = origem #índices das colunas do CSV, pela ordem da matriz
+        self.n_colunas = max(origem) + 1
+
+def _cabecalho_por_omissao():
+    n = len(sexos) * len(anos)
+    return CabecalhoCSV(list(sexos), list(anos), list(range(1, n + 1)))
+
+def _montar_cabecalho(linha_sexos, linha_anos):
+    #o nome do sexo só aparece na primeira coluna do seu bloco
+    colunas = {}
+    sexo = None
+    for j in range(1, max(len(linha_sexos), len(linha_anos))):
+        rotulo = linha_sexos[j].strip() if j < len(linha_sexos) else ""
+        if rotulo:
+            sexo = rotulo
+        ano = linha_anos[j].strip() if j < len(linha_anos) else ""
+        if sexo and ano.isdigit():
+            colunas[(sexo, int(ano))] = j
+
+    sexos_csv = list(dict.fromkeys(s for s, _ in colunas))
+    #a matriz fica sempre com o ano mais recente primeiro, seja qual for a ordem do CSV
+    anos_csv = sorted({a for _, a in colunas}, reverse=True)
+    origem = []
+    for s in sexos_csv:
+        for a in anos_csv:
+            if (s, a) not in colunas:
+                raise ValueError(f"cabeçalho do CSV incompleto: falta {s} {a}")
+            origem.append(colunas[(s, a)])
+    return CabecalhoCSV(sexos_csv, anos_csv, origem)
+
+def ler_cabecalho_csv(linhas):
+    """
+    Consome as linhas do csv.reader até à primeira linha de dados e deduz
+    o CabecalhoCSV. Devolve (cabecalho, primeira_linha_de_dados ou None).
+    Sem cabeçalho reconhecível assume o formato fixo de `sexos` x `anos`.
+    """
+    linha_sexos = linha_anos = None
+    for linha in linhas:
+        if not linha:
+            continue
+        if _codigo_e_nome(linha[0]) is not None and len(linha) > 1:
+            break
+        celulas = [c.strip() for c in linha[1:] if c.strip()]
+        if not celulas:
+            continue
+        if all(c.isdigit() and len(c) == 4 for c in celulas):
+            linha_anos = linha
+        elif linha[0].strip() == "":
+            linha_sexos = linha
+    else:
+        linha = None
+
+    if linha_sexos is not None and linha_anos is not None:
+        return _montar_cabecalho(linha_sexos, linha_anos), linha
+    return _cabecalho_por_omissao(), linha
+
+def ler_blocos_csv(ficheiro, tamanho_bloco=TAMANHO_BLOCO_CSV):
+    """
+    Gerador que lê o CSV em blocos de até `tamanho_bloco` linhas de dados.
+    Devolve primeiro o CabecalhoCSV e depois, por cada bloco,
+    (codigos, nomes, matriz int64 (linhas x (sexo x ano))).
+    A memória usada depende do tamanho do bloco, não do ficheiro.
+    """
+    with open(ficheiro, 'r', encoding='utf-8', newline='') as f:
+        leitor = csv.reader(f, delimiter=';')
+        cabecalho, primeira = ler_cabecalho_csv(leitor)
+        yield cabecalho
+
+        origem = cabecalho.origem
+        n_colunas = len(origem)
+        #células de cada linha pela ordem da matriz, tiradas em C
+        if n_colunas == 1:
+            celulas_da_linha = lambda linha: (linha[origem[0]],)
+        else:
+            celulas_da_linha = operator.itemgetter(*origem)
+        codigos, nomes, celulas = [], [], []
+        invalidas = []
+
+        def bloco():
+            #converte as células do bloco numa só chamada; as linhas com
+            #células inválidas ficam de fora (e são avisadas no fim)
+            valores, validos = converter_celulas(celulas)
+            matriz = valores.reshape(len(codigos), n_colunas)
+            boas = validos.reshape(len(codigos), n_colunas).all(axis=1)
+            if boas.all():
+                return codigos, nomes, matriz
+            invalidas.extend(c for c, boa in zip(codigos, boas.tolist()) if not boa)
+            return ([c for c, boa in zip(codigos, boas.tolist()) if boa],
+                    [n for n, boa in zip(nomes, boas.tolist()) if boa], matriz[boas])
+
+        def linhas_de_dados():
+            if primeira is not None:
+                yield primeira
+            yield from leitor
+
+        for linha in linhas_de_dados():
+            if not linha or len(linha) < cabecalho.n_colunas:
+                continue
+            cod_nome = _codigo_e_nome(linha[0])
+            if cod_nome is None:
+                continue
+
+            codigos.append(cod_nome[0])
+            nomes.append(cod_nome[1])
+            celulas.extend(celulas_da_linha(linha))
+
+            if len(codigos) >= tamanho_bloco:
+                yield bloco()
+                codigos, nomes, celulas = [], [], []
+
+        if codigos:
+            yield bloco()
+        if invalidas:
+            print(f"AVISO: {len(invalidas)} linha(s) com valores inválidos ignorada(s): {', '.join(invalidas[:10])}"
+                  + (" ..." if len(invalidas) > 10 else ""))
+
+def ler_poblacion(ficheiro, tamanho_bloco=TAMANHO_BLOCO_CSV):
+    """
+    Lê o CSV de população e devolve um objeto Poblacion.
+    Anos e sexos vêm do cabeçalho; cabeçalhos, linhas vazias e notas
+    de rodapé são ignorados.
+    """
+    blocos = ler_blocos_csv(ficheiro, tamanho_bloco)
+    cabecalho = next(blocos)
+    codigos, nomes, matrizes = [], [], []
+    for cods, noms, matriz in blocos:
+        codigos.extend(cods)
+        nomes.extend(noms)
+        matrizes.append(matriz)
+
+    n_colunas = len(cabecalho.origem)
+    matriz = np.concatenate(matrizes) if matrizes else np.zeros((0, n_colunas), dtype=np.int64)
+    return Poblacion(codigos, nomes, matriz, cabecalho.anos, cabecalho.sexos)
+
+def agregar_csv(ficheiro, dic_mapa, codigos_ccaa, tamanho_bloco=TAMANHO_BLOCO_CSV):
+    """
+    Soma o CSV por CCAA sem o carregar inteiro: cada bloco é agregado
+    e descartado, por isso a memória fica constante para qualquer
+    tamanho de ficheiro (ex: o padrón municipal completo).
+    Devolve (cabecalho, por_ccaa, nacional, codigos_sem_ccaa).
+    """
+    blocos = ler_blocos_csv(ficheiro, tamanho_bloco)
+    cabecalho = next(blocos)
+    por_ccaa = np.zeros((len(codigos_ccaa), len(cabecalho.origem)), dtype=np.int64)
+    sem_ccaa = []
+    for cods, _, matriz in blocos:
+        agregacao = Agregacao(cods, dic_mapa, codigos_ccaa)
+        parcial, _ = agregacao.somar(matriz)
+        por_ccaa += parcial
+        sem_ccaa.extend(agregacao.sem_grupo)
+    return cabecalho, por_ccaa, por_ccaa.sum(axis=0), sem_ccaa
+
+def variacao(matriz, lag=1):
+    """
+    Calcula de uma só vez a variação absoluta e relativa (%) de cada ano
+    face ao ano `lag` posições antes, para todas as regiões.
+    O último eixo são os anos pela ordem de `anos` (mais recente primeiro),
+    por isso a coluna j é comparada com a coluna j+lag; aceita tanto
+    (regiões x anos) como (regiões x sexo x anos).
+    Devolve (absoluta, relativa), cada uma com len(anos)-lag colunas.
+    Quando o valor anterior é 0 a variação relativa fica a 0.
+    """
+    m = np.asarray(matriz, dtype=float)
+    if not 0 < lag < m.shape[-1]:
+        raise ValueError(f"lag inválido ({lag}) para {m.shape[-1]} anos")
+
+    atual = m[..., :-lag]
+    anterior = m[..., lag:]
+
+    absoluta = atual - anterior
+    relativa = np.divide(absoluta, anterior, out=np.zeros_like(absoluta), where=anterior != 0)
+    relativa *= 100
+    return absoluta, relativa
+
+class EscritorRelatorio:
+    """
+    Escreve um relatório HTML por partes diretamente no ficheiro:
+    o cabeçalho ao abrir, cada linha da tabela quando é produzida
+    e o rodapé ao fechar. O documento nunca está todo em memória.
+    `modelo_linha` é um texto com um {} por célula, preparado uma vez.
+    `destino` pode ser um caminho (escrita atómica) ou um ficheiro já aberto.
+    """
+    TAMANHO_BUFFER = 1 << 16
+
+    def __init__(self, destino, cabecalho, rodape, modelo_linha):
+        self.destino = destino
+        self.cabecalho = cabecalho
+        self.rodape = rodape
+        self._formatar = modelo_linha.format
+        self.linhas = 0
+        self.celulas = 0
+        self._contexto = None
+        self._f = None
+
+    def __enter__(self):
+        if isinstance(self.destino, (str, os.PathLike)):
+            self._contexto = escrita_atomica(self.destino, buffering=self.TAMANHO_BUFFER)
+            self._f = self._contexto.__enter__()
+        else:
+            self._f = self.destino
+        self._f.write(self.cabecalho)
+        return self
+
+    def linha(self, *celulas):
+        self._f.write(self._formatar(*celulas))
+        self.linhas += 1
+        self.celulas += len(celulas)
+
+    def __exit__(self, tipo, erro, tb):
+        if tipo is None:
+            self._f.write(self.rodape)
+        if self._contexto is not None:
+            return self._contexto.__exit__(tipo, erro, tb)
+        return False
+
+#troca os separadores do estilo inglês (1,234.56) para o europeu (1.234,56)
+_separadores_europeus = str.maketrans(",.", ".,")
 
 def formatar_numero(numero):
     """
@@ -32,12 +549,39 @@ def formatar_numero(numero):
     """
     try:
         val = float(numero)
-        # Formata primeiro no estilo inglês (1,234.56)
-        texto = "{:,.2f}".format(val)
-        # Troca os caracteres para o estilo europeu
-        return texto.replace(",", "X").replace(".", ",").replace("X", ".")
-    except:
+    except (TypeError, ValueError):
         return str(numero)
+    # Formata primeiro no estilo inglês (1,234.56) e troca os separadores
+    return "{:,.2f}".format(val).translate(_separadores_europeus)
+
+def formatar_numeros(valores, memo=None):
+    """
+    Versão em lote de formatar_numero: recebe um array (ou lista) de números
+    e devolve um array de textos com a mesma forma.
+    Se todos os valores são inteiros (populações) evita a formatação em float.
+    `memo` é um dicionário opcional {valor: texto} reaproveitado entre chamadas,
+    útil quando os mesmos valores se repetem muito.
+    """
+    arr = np.asarray(valores, dtype=float)
+    lista = arr.ravel().tolist()
+
+    if memo is not None:
+        em_falta = [v for v in dict.fromkeys(lista) if v not in memo]
+        if em_falta:
+            memo.update(zip(em_falta, formatar_numeros(em_falta).tolist()))
+        #nan não é encontrado no dicionário: formatado à parte
+        textos = [memo[v] if v in memo else formatar_numero(v) for v in lista]
+    elif lista and np.isfinite(arr).all() and (arr == np.trunc(arr)).all() and np.abs(arr).max() < 2 ** 53:
+        textos = [f"{v:,}.00" for v in arr.ravel().astype(np.int64).tolist()]
+    else:
+        textos = [f"{v:,.2f}" for v in lista]
+
+    if memo is None:
+        #uma só tradução para o lote inteiro (\x1f nunca aparece num número)
+        textos = "\x1f".join(textos).translate(_separadores_europeus).split("\x1f") if textos else []
+    resultado = np.empty(len(textos), dtype=object)
+    resultado[:] = textos
+    return resultado.reshape(arr.shape)
 
 def ler_comunidades(ficheiro):
     """
@@ -45,20 +589,11 @@ def ler_comunidades(ficheiro):
     Preserva a ordem de leitura.
     """
     dic_comunidades = {}
-    # Tenta abrir com utf-8, se der erro tenta latin-1 (comum em ficheiros do INE)
-    try:
-        with open(ficheiro, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f, 'html.parser')
-    except UnicodeDecodeError:
-        with open(ficheiro, 'r', encoding='latin-1') as f:
-            soup = BeautifulSoup(f, 'html.parser')
-
-    rows = soup.find_all('tr')
-    for row in rows:
-        cols = row.find_all('td')
+    # A codificação (utf-8 ou latin-1, comum em ficheiros do INE) é detetada logo à cabeça
+    for _, cols in tabelas_html.ler_linhas(ficheiro):
         if len(cols) >= 2:
-            codigo = cols[0].get_text(strip=True)
-            nome = cols[1].get_text(strip=True)
+            codigo = cols[0]
+            nome = cols[1]
             # Verifica se o código é numérico para evitar cabeçalhos
             if codigo.isdigit(): 
                 dic_comunidades[codigo] = nome
@@ -69,24 +604,103 @@ def ler_relacao_prov_cca(ficheiro):
     Lê o HTML e devolve dicionário {codigo_provincia: codigo_ccaa}
     """
     dic_prov_ccaa = {}
-    try:
-        with open(ficheiro, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f, 'html.parser')
-    except UnicodeDecodeError:
-        with open(ficheiro, 'r', encoding='latin-1') as f:
-            soup = BeautifulSoup(f, 'html.parser')
-
-    rows = soup.find_all('tr')
-    for row in rows:
-        cols = row.find_all('td')
-        # Col 0 = Cod CCAA, Col 2 = Cod Provincia (segundo o enunciado/HTML)
+    for _, cols in tabelas_html.ler_linhas(ficheiro):
+        # No ficheiro fornecido: 
+        # col[0]=CODAUTO, col[1]=NomeAut, col[2]=CPRO, col[3]=Provincia
         if len(cols) >= 3:
-            cod_ccaa = cols[0].get_text(strip=True)
-            # Por vezes o código da província está na coluna 2 ou 3, depende da formatação
-            # No ficheiro fornecido: 
-            # col[0]=CODAUTO, col[1]=NomeAut, col[2]=CPRO, col[3]=Provincia
-            if len(cols) >= 3:
-                cod_prov = cols[2].get_text(strip=True)
-                if cod_prov.isdigit():
-                    dic_prov_ccaa[cod_prov] = cod_ccaa
+            cod_ccaa = cols[0]
+            cod_prov = cols[2]
+            if cod_prov.isdigit():
+                dic_prov_ccaa[cod_prov] = cod_ccaa
     return dic_prov_ccaa
+
+def _dic_para_arrays(dic):
+    return {"chaves": np.array(list(dic.keys()), dtype=str),
+            "valores": np.array(list(dic.values()), dtype=str)}
+
+def _arrays_para_dic(arrays):
+    return dict(zip(arrays["chaves"].tolist(), arrays["valores"].tolist()))
+
+def _poblacion_para_arrays(dados):
+    return {"codigos": dados.codigos, "nomes": dados.nomes, "matriz": dados.matriz,
+            "anos": np.array(dados.anos), "sexos": np.array(dados.sexos)}
+
+def _arrays_para_poblacion(arrays):
+    return Poblacion(arrays["codigos"], arrays["nomes"], arrays["matriz"],
+                     arrays["anos"].tolist(), arrays["sexos"].tolist())
+
+def _carregar(tipo, ficheiro, ler, para_arrays, de_arrays, usar_cache):
+    """
+    Lê cada entrada uma só vez por execução e, entre execuções,
+    a partir da cache em disco (ver cache.py).
+    """
+    if os.environ.get(VAR_PARTILHADO):
+        _anexar_partilhado()
+    chave = (tipo, os.path.abspath(ficheiro))
+    if chave not in _entradas_lidas:
+        _entradas_lidas[chave] = cache.obter(ficheiro, tipo, ler, para_arrays,
+                                             de_arrays, usar_cache)
+    return _entradas_lidas[chave]
+
+def carregar_comunidades(ficheiro=file_comunidades, usar_cache=None):
+    """
+    Igual a ler_comunidades, mas partilhado entre relatórios e guardado em cache.
+    """
+    return _carregar("comunidades", ficheiro, ler_comunidades,
+                     _dic_para_arrays, _arrays_para_dic, usar_cache)
+
+def carregar_relacao(ficheiro=file_relacao, usar_cache=None):
+    """
+    Igual a ler_relacao_prov_cca, mas partilhado entre relatórios e guardado em cache.
+    """
+    return _carregar("relacao", ficheiro, ler_relacao_prov_cca,
+                     _dic_para_arrays, _arrays_para_dic, usar_cache)
+
+def carregar_poblacion(ficheiro=file_csv, usar_cache=None):
+    """
+    Devolve os dados do CSV, lidos uma só vez por execução (ou da cache
+    em disco se o ficheiro não mudou). Todos os relatórios partilham o mesmo objeto.
+    """
+    return _carregar("poblacion", ficheiro, ler_poblacion,
+                     _poblacion_para_arrays, _arrays_para_poblacion, usar_cache)
+
+#origem dos dados dos relatórios, escolhida pelo main.py (chega também aos processos do pool):
+#PTC_HISTORICO = pasta do histórico (ver historico.py) em vez do CSV, PTC_ANOS = janela "2012-2017"
+#e PTC_PARTILHADO = segmento de memória partilhada com as entradas já lidas (ver partilhado.py)
+VAR_HISTORICO = "PTC_HISTORICO"
+VAR_ANOS = "PTC_ANOS"
+VAR_PARTILHADO = "PTC_PARTILHADO"
+
+def _anexar_partilhado():
+    import partilhado #aqui e não no topo: o partilhado importa o funciones
+    return partilhado.anexar(os.environ[VAR_PARTILHADO])
+
+def carregar_dados(ficheiro=file_csv, minimo_anos=1):
+    """
+    Dados dos relatórios: da memória partilhada, se PTC_PARTILHADO estiver
+    definido, do histórico, se PTC_HISTORICO estiver definido, ou do CSV;
+    só com os anos da janela PTC_ANOS, se definida. Levanta ValueError se
+    ficarem menos de `minimo_anos` anos.
+    """
+    janela = ler_janela(os.environ.get(VAR_ANOS))
+    pasta = os.environ.get(VAR_HISTORICO)
+    if os.environ.get(VAR_PARTILHADO):
+        #já lidos (com a janela e a origem pedidas) por quem publicou o segmento
+        dados = _anexar_partilhado().dados
+    elif pasta:
+        chave = ("historico", os.path.abspath(pasta), janela)
+        if chave not in _entradas_lidas:
+            import historico #aqui e não no topo: o historico importa o funciones
+            _entradas_lidas[chave] = historico.carregar_historico(pasta, janela)
+        dados = _entradas_lidas[chave]
+    else:
+        dados = carregar_poblacion(ficheiro)
+        if janela is not None:
+            chave = ("janela", os.path.abspath(ficheiro), janela)
+            if chave not in _entradas_lidas:
+                escolhidos = [ano for ano in dados.anos if janela[0] <= ano <= janela[1]]
+                _entradas_lidas[chave] = dados.recortar(anos_escolhidos=escolhidos)
+            dados = _entradas_lidas[chave]
+    if len(dados.anos) < minimo_anos:
+        raise ValueError(f"são precisos pelo menos {minimo_anos} anos com dados (há {len(dados.anos)})")
+    return dados
@@ -0,0 +1,187 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from funciones import (escrita_atomica, caminho, carregar_comunidades, carregar_relacao,
+                       carregar_poblacion, agregacao_ccaa, cod_nacional)
+
+#gráficos desenhados com Figure + Agg: sem o estado global do pyplot,
+#por isso podem ser gerados em paralelo em vários processos
+
+TAMANHO_FIGURA = (10, 6)
+
+#pastas dos gráficos por região
+pasta_graficos_ccaa = caminho("imagenes/ccaa")
+pasta_graficos_provincias = caminho("imagenes/provincias")
+
+#uma figura por tamanho em cada processo, limpa e reaproveitada entre gráficos
+_figuras = {}
+
+def _figura(tamanho):
+    fig = _figuras.get(tamanho)
+    if fig is None:
+        fig = Figure(figsize=tamanho)
+        FigureCanvasAgg(fig)
+        _figuras[tamanho] = fig
+    else:
+        fig.clear()
+    return fig
+
+def desenhar_barras(fig, nomes, hombres, mujeres, titulo):
+    """
+    Barras de homens e mulheres lado a lado por região (gráfico do R3).
+    """
+    x = np.arange(len(nomes))
+    width = 0.35  #largura barras
+
+    ax = fig.add_subplot()
+    ax.bar(x - width/2, hombres, width, label='Hombres', color='blue')
+    ax.bar(x + width/2, mujeres, width, label='Mujeres', color='red')
+
+    ax.set_ylabel('1e6') #escalha em milhoes
+    ax.set_title(titulo)
+    ax.set_xticks(x)
+    ax.set_xticklabels(nomes, rotation=90) #rotacao vertical
+    ax.legend()
+
+    #n cortar nomes em baixo
+    fig.tight_layout()
+
+def desenhar_linhas(fig, anos, series, titulo):
+    """
+    Uma linha com marcadores por série (gráfico do R5).
+    `series` é uma lista de (rotulo, valores), com os valores na mesma ordem de `anos`.
+    """
+    ax = fig.add_subplot()
+    for rotulo, valores in series:
+        ax.plot(anos, valores, marker='o', label=rotulo)
+
+    ax.set_title(titulo)
+    ax.set_ylabel("1e6")
+    ax.grid(True, linestyle='--', alpha=0.5)
+    ax.legend(bbox_to_anchor=(1.02, 1), loc='upper left', borderaxespad=0.)
+
+    fig.tight_layout()
+
+_desenhos = {"barras": desenhar_barras, "linhas": desenhar_linhas}
+
+def renderizar(tarefa):
+    """
+    Desenha e grava um gráfico. `tarefa` é (tipo, destino, argumentos),
+    com tipo "barras" ou "linhas" e os argumentos da função de desenho
+    correspondente. `destino` pode ser um caminho (escrita atómica) ou um
+    ficheiro binário já aberto (ex: io.BytesIO). Devolve (destino, segundos).
+    """
+    tipo, destino, argumentos = tarefa
+    inicio = time.perf_counter()
+
+    fig = _figura(TAMANHO_FIGURA)
+    _desenhos[tipo](fig, **argumentos)
+
+    if isinstance(destino, (str, os.PathLike)):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with escrita_atomica(destino, "wb") as f:
+            fig.savefig(f, format="png")
+    else:
+        fig.savefig(destino, format="png")
+    return destino, time.perf_counter() - inicio
+
+def renderizar_lote(tarefas, jobs=None):
+    """
+    Gera todos os gráficos de `tarefas`, repartidos por um pool de `jobs`
+    processos (jobs=1 desenha tudo no próprio processo).
+    Devolve a lista de (destino, segundos) pela ordem das tarefas.
+    """
+    tarefas = list(tarefas)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(tarefas) <= 1:
+        return [renderizar(t) for t in tarefas]
+
+    #blocos de tarefas por processo para não pagar o envio de cada uma em separado
+    bloco = max(1, len(tarefas) // (4 * jobs))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(renderizar, tarefas, chunksize=bloco))
+
+def tarefa_evolucao(destino, titulo, anos, por_sexo, sexos):
+    """
+    Tarefa de linhas com a evolução de cada sexo de uma região.
+    `por_sexo` é (sexo x ano) com os anos do mais recente ao mais antigo.
+    """
+    cronologico = list(anos)[::-1]
+    series = [(sexo, por_sexo[i][::-1].tolist()) for i, sexo in enumerate(sexos)]
+    return ("linhas", destino, {"anos": cronologico, "series": series, "titulo": titulo})
+
+def tarefa_provincias(destino, titulo, nomes, hombres, mujeres):
+    """
+    Tarefa de barras com os homens e as mulheres de cada província (como o R3).
+    """
+    return ("barras", destino, {"nomes": list(nomes), "hombres": list(hombres),
+                                "mujeres": list(mujeres), "titulo": titulo})
+
+def tarefas_regioes(dados, dic_ccaa, dic_mapa):
+    """
+    Uma tarefa por CCAA e uma por província com a evolução da população por
+    sexo e, por CCAA, as barras de homens e mulheres das suas províncias no
+    ano mais recente.
+    """
+    periodo = f"{min(dados.anos)}-{max(dados.anos)}"
+    cubo = dados.cubo()
+
+    codigos_ccaa = sorted(dic_ccaa)
+    agregacao = agregacao_ccaa(dados, dic_mapa, codigos_ccaa)
+    por_ccaa, _ = agregacao.somar(cubo)
+    com_sexos = "Hombres" in dados.sexos and "Mujeres" in dados.sexos
+    if com_sexos:
+        i_homens, i_mulheres = dados.sexos.index("Hombres"), dados.sexos.index("Mujeres")
+
+    tarefas = []
+    for k, (cod, valores) in enumerate(zip(codigos_ccaa, por_ccaa)):
+        destino = os.path.join(pasta_graficos_ccaa, f"{cod}.png")
+        tarefas.append(tarefa_evolucao(destino, f"{cod} {dic_ccaa[cod]}: población {periodo}",
+                                       dados.anos, valores, dados.sexos))
+        provincias = np.flatnonzero(agregacao.indices == k)
+        if com_sexos and len(provincias):
+            destino = os.path.join(pasta_graficos_ccaa, f"{cod}-provincias.png")
+            tarefas.append(tarefa_provincias(destino, f"{cod} {dic_ccaa[cod]}: población por sexo en {dados.anos[0]}",
+                                             dados.nomes[provincias].tolist(),
+                                             cubo[provincias, i_homens, 0].tolist(),
+                                             cubo[provincias, i_mulheres, 0].tolist()))
+
+    for cod, i in sorted(dados.indice.items()):
+        if cod == cod_nacional:
+            continue
+        destino = os.path.join(pasta_graficos_provincias, f"{cod}.png")
+        tarefas.append(tarefa_evolucao(destino, f"{cod} {dados.nomes[i]}: población {periodo}",
+                                       dados.anos, cubo[i], dados.sexos))
+    return tarefas
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera os gráficos por CCAA e por província.")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="número de processos (por omissão, um por CPU)")
+    args = parser.parse_args(argv)
+
+    print("A iniciar os gráficos por CCAA e província...")
+    try:
+        dic_ccaa = carregar_comunidades()
+        dic_mapa = carregar_relacao()
+        dados = carregar_poblacion()
+    except FileNotFoundError as e:
+        print(f"ERRO: ficheiro de entrada em falta: {e}")
+        return
+
+    inicio = time.perf_counter()
+    tempos = renderizar_lote(tarefas_regioes(dados, dic_ccaa, dic_mapa), jobs=args.jobs)
+    total = time.perf_counter() - inicio
+
+    segundos = [s for _, s in tempos]
+    if segundos:
+        print(f"{len(tempos)} gráficos em {total:.2f} s "
+              f"(por gráfico: média {np.mean(segundos):.3f} s, máx {max(segundos):.3f} s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import numpy as np
+from caminhos import pasta_historico
+import funciones
+from funciones import Poblacion, escrita_atomica, carregar_poblacion
+
+#histórico persistente das publicações anuais do INE. Cada publicação repete
+#todos os anos anteriores; aqui só se acrescenta o que é novo:
+# - um ano novo é um ficheiro ano-AAAA.npy (regiões x sexos), lido com mmap
+# - células de anos já guardados que o INE reviu vão para o fim de
+#   revisoes.bin (registos de tamanho fixo, só acrescentados)
+# - indice.json (regiões, sexos, anos e número de revisões) é gravado no fim,
+#   de forma atómica: o que não está no índice ainda não existe
+#Ler uma janela de anos só toca nos ficheiros desses anos.
+
+VERSAO_HISTORICO = 1
+
+#célula sem valor (região que ainda não existia nesse ano ou não veio nele)
+AUSENTE = np.iinfo(np.int64).min
+
+#um registo por célula revista; o último registo de uma célula prevalece
+REGISTO_REVISAO = np.dtype([("linha", "<i8"), ("ano", "<i4"), ("sexo", "<i4"), ("valor", "<i8")])
+
+def _ultimas(chave):
+    #posição do último registo de cada chave: a última revisão de uma célula prevalece
+    _, ultimas = np.unique(chave[::-1], return_index=True)
+    return len(chave) - 1 - ultimas
+
+class Historico:
+    """
+    Histórico guardado em `pasta`. `anos` (do mais recente para o mais
+    antigo), `sexos`, `codigos` e `nomes` vêm do índice; os valores são lidos
+    por ano, com os ficheiros abertos em mmap.
+    """
+    def __init__(self, pasta=pasta_historico):
+        self.pasta = pasta
+        self.ficheiro_indice = os.path.join(pasta, "indice.json")
+        self.ficheiro_revisoes = os.path.join(pasta, "revisoes.bin")
+        self._ler_indice()
+
+    def _ler_indice(self):
+        if os.path.exists(self.ficheiro_indice):
+            with open(self.ficheiro_indice, encoding="utf-8") as f:
+                indice = json.load(f)
+            if indice.get("versao") != VERSAO_HISTORICO:
+                raise ValueError(f"histórico em {self.pasta} tem outra versão ({indice.get('versao')})")
+        else:
+            indice = {"versao": VERSAO_HISTORICO, "sexos": [], "codigos": [], "nomes": [],
+                      "anos": {}, "revisoes": 0, "publicacoes": []}
+        self.indice = indice
+        self.sexos = indice["sexos"]
+        self.codigos = indice["codigos"]
+        self.nomes = indice["nomes"]
+        self.anos = sorted((int(a) for a in indice["anos"]), reverse=True)
+        self.linhas = {cod: i for i, cod in enumerate(self.codigos)}
+        self._colunas = {}
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def existe(self):
+        return os.path.exists(self.ficheiro_indice)
+
+    def _coluna(self, ano):
+        #valores guardados de um ano (sem as revisões), em mmap
+        if ano not in self._colunas:
+            ficheiro = os.path.join(self.pasta, self.indice["anos"][str(ano)]["ficheiro"])
+            self._colunas[ano] = np.load(ficheiro, mmap_mode="r")
+        return self._colunas[ano]
+
+    def revisoes(self):
+        """
+        Registos de revisão confirmados no índice (vista em mmap; vazia se não há).
+        """
+        n = self.indice["revisoes"]
+        if n == 0:
+            return np.zeros(0, dtype=REGISTO_REVISAO)
+        return np.memmap(self.ficheiro_revisoes, dtype=REGISTO_REVISAO, mode="r", shape=(n,))
+
+    def cubo(self, anos_escolhidos):
+        """
+        Array (regiões x sexos x anos) dos anos pedidos (pela ordem dada),
+        com as revisões aplicadas e AUSENTE onde não há valor.
+        """
+        n, n_sexos = len(self.codigos), len(self.sexos)
+        cubo = np.full((n, n_sexos, len(anos_escolhidos)), AUSENTE, dtype=np.int64)
+        for j, ano in enumerate(anos_escolhidos):
+            coluna = self._coluna(ano)
+            cubo[:len(coluna), :, j] = coluna
+
+        revisoes = self.revisoes()
+        if len(revisoes):
+            posicao = {ano: j for j, ano in enumerate(anos_escolhidos)}
+            anos_registo = revisoes["ano"]
+            na_janela = np.isin(anos_registo, anos_escolhidos)
+            if na_janela.any():
+                escolhidas = np.asarray(revisoes[na_janela])
+                j = np.array([posicao[a] for a in escolhidas["ano"].tolist()], dtype=np.intp)
+                ultimas = _ultimas((escolhidas["linha"] * n_sexos + escolhidas["sexo"]) * len(anos_escolhidos) + j)
+                cubo[escolhidas["linha"][ultimas], escolhidas["sexo"][ultimas], j[ultimas]] = escolhidas["valor"][ultimas]
+        return cubo
+
+    def anos_da_janela(self, janela=None):
+        """
+        Anos guardados dentro de `janela` ((inicio, fim), lista ou None = todos),
+        do mais recente para o mais antigo.
+        """
+        if janela is None:
+            escolhidos = list(self.anos)
+        elif isinstance(janela, tuple) and len(janela) == 2:
+            escolhidos = [a for a in self.anos if janela[0] <= a <= janela[1]]
+        else:
+            em_falta = [a for a in janela if a not in self.anos]
+            if em_falta:
+                raise ValueError(f"ano(s) fora do histórico: {', '.join(map(str, em_falta))}")
+            escolhidos = sorted(set(janela), reverse=True)
+        if not escolhidos:
+            raise ValueError(f"nenhum ano do histórico em {janela}")
+        return escolhidos
+
+    def poblacion(self, janela=None):
+        """
+        Poblacion com os anos da janela, como se viesse de um CSV: as regiões
+        pela ordem em que entraram no histórico, só as que têm valor em
+        todos os anos pedidos.
+        """
+        if not self.existe():
+            raise FileNotFoundError(self.ficheiro_indice)
+        escolhidos = self.anos_da_janela(janela)
+        cubo = self.cubo(escolhidos)
+        completas = np.flatnonzero((cubo != AUSENTE).all(axis=(1, 2)))
+        if len(completas) != len(cubo):
+            cubo = cubo[completas]
+        return Poblacion(np.asarray(self.codigos)[completas], np.asarray(self.nomes)[completas],
+                         cubo.reshape(len(completas), -1), escolhidos, self.sexos)
+
+    def ingerir(self, dados, origem=""):
+        """
+        Acrescenta uma publicação (um Poblacion com todos os anos): regiões
+        novas no fim, anos novos como ficheiros novos e só as células que
+        mudaram nos anos já guardados como revisões. Devolve um resumo.
+        """
+        sexos = self.sexos or list(dados.sexos)
+        em_falta = [s for s in sexos if s not in dados.sexos]
+        if em_falta:
+            raise ValueError(f"a publicação não tem o(s) sexo(s) {', '.join(em_falta)}")
+        blocos = [dados.sexos.index(s) for s in sexos]
+
+        #regiões: as novas vão para o fim; os nomes ficam os mais recentes
+        codigos, nomes = list(self.codigos), list(self.nomes)
+        posicoes = dict(self.linhas)
+        linhas = np.empty(len(dados), dtype=np.int64)
+        for i, (cod, nome) in enumerate(zip(dados.codigos.tolist(), dados.nomes.tolist())):
+            linha = posicoes.get(cod)
+            if linha is None:
+                linha = len(codigos)
+                posicoes[cod] = linha
+                codigos.append(cod)
+                nomes.append(nome)
+            else:
+                nomes[linha] = nome
+            linhas[i] = linha
+        regioes_novas = len(codigos) - len(self.codigos)
+
+        os.makedirs(self.pasta, exist_ok=True)
+        cubo = dados.cubo()[:, blocos]
+        anos_indice = dict(self.indice["anos"])
+        anos_novos = []
+        revistas = []
+        #revisões já guardadas, lidas uma vez e separadas por ano (pela ordem em que foram gravadas)
+        revisoes = self.revisoes()
+        ordem = np.argsort(revisoes["ano"], kind="stable")
+        anos_revistos, inicios = np.unique(revisoes["ano"][ordem], return_index=True)
+        por_ano = dict(zip(anos_revistos.tolist(), np.split(revisoes[ordem], inicios[1:])))
+        del revisoes
+        for j, ano in enumerate(dados.anos):
+            valores = cubo[:, :, j]
+            if ano not in self.anos:
+                coluna = np.full((len(codigos), len(sexos)), AUSENTE, dtype=np.int64)
+                coluna[linhas] = valores
+                nome_ficheiro = f"ano-{ano}.npy"
+                with escrita_atomica(os.path.join(self.pasta, nome_ficheiro), "wb") as f:
+                    np.save(f, coluna)
+                anos_indice[str(ano)] = {"ficheiro": nome_ficheiro, "linhas": len(coluna)}
+                anos_novos.append(ano)
+                continue
+            #ano já guardado: comparar com os valores atuais (com revisões)
+            atuais = np.full((len(codigos), len(sexos)), AUSENTE, dtype=np.int64)
+            guardados = self._coluna(ano)
+            atuais[:len(guardados)] = guardados
+            registos = por_ano.get(ano)
+            if registos is not None:
+                ultimas = _ultimas(registos["linha"] * len(sexos) + registos["sexo"])
+                atuais[registos["linha"][ultimas], registos["sexo"][ultimas]] = registos["valor"][ultimas]
+            diferentes = np.nonzero(atuais[linhas] != valores)
+            if len(diferentes[0]):
+                registos = np.empty(len(diferentes[0]), dtype=REGISTO_REVISAO)
+                registos["linha"] = linhas[diferentes[0]]
+                registos["ano"] = ano
+                registos["sexo"] = diferentes[1]
+                registos["valor"] = valores[diferentes]
+                revistas.append(registos)
+
+        n_revisoes = self.indice["revisoes"]
+        if revistas:
+            registos = np.concatenate(revistas)
+            with open(self.ficheiro_revisoes, "ab") as f:
+                #descartar registos de uma ingestão que não chegou ao índice
+                f.truncate(n_revisoes * REGISTO_REVISAO.itemsize)
+                f.write(registos.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            n_revisoes += len(registos)
+
+        resumo = {
+            "origem": origem,
+            "data": datetime.datetime.now().isoformat(timespec="seconds"),
+            "regioes_novas": regioes_novas,
+            "anos_novos": sorted(anos_novos),
+            "celulas_revistas": n_revisoes - self.indice["revisoes"],
+        }
+        indice = dict(self.indice, sexos=sexos, codigos=codigos, nomes=nomes, anos=anos_indice,
+                      revisoes=n_revisoes, publicacoes=self.indice["publicacoes"] + [resumo])
+        with escrita_atomica(self.ficheiro_indice) as f:
+            json.dump(indice, f, ensure_ascii=False, indent=1)
+        self._ler_indice()
+        return resumo
+
+    def compactar(self):
+        """
+        Reescreve os anos com revisões já aplicadas e esvazia o registo de revisões.
+        """
+        revisoes = self.revisoes()
+        if not len(revisoes):
+            return 0
+        anos_revistos = sorted(set(revisoes["ano"].tolist()))
+        anos_indice = dict(self.indice["anos"])
+        for ano in anos_revistos:
+            coluna = self.cubo([ano])[:, :, 0]
+            with escrita_atomica(os.path.join(self.pasta, f"ano-{ano}.npy"), "wb") as f:
+                np.save(f, coluna)
+            anos_indice[str(ano)] = {"ficheiro": f"ano-{ano}.npy", "linhas": len(coluna)}
+        n = len(revisoes)
+        del revisoes
+        self._colunas.clear()
+        with escrita_atomica(self.ficheiro_indice) as f:
+            json.dump(dict(self.indice, anos=anos_indice, revisoes=0), f, ensure_ascii=False, indent=1)
+        os.remove(self.ficheiro_revisoes)
+        self._ler_indice()
+        return n
+
+def carregar_historico(pasta=pasta_historico, janela=None):
+    """
+    Poblacion da janela de anos pedida, lida do histórico em `pasta`.
+    """
+    return Historico(pasta).poblacion(janela)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Histórico das publicações do INE (só acrescenta o que é novo).")
+    parser.add_argument("--pasta", default=pasta_historico, help="pasta do histórico")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    ingerir = sub.add_parser("ingerir", help="acrescenta uma ou mais publicações (CSV), pela ordem dada")
+    ingerir.add_argument("csv", nargs="+")
+    sub.add_parser("mostrar", help="anos, regiões, revisões e publicações guardados")
+    sub.add_parser("compactar", help="aplica as revisões aos ficheiros dos anos")
+    args = parser.parse_args(argv)
+
+    try:
+        historico = Historico(args.pasta)
+    except ValueError as e:
+        print(f"ERRO: {e}")
+        return 2
+
+    if args.comando == "ingerir":
+        for ficheiro in args.csv:
+            try:
+                #cada publicação é lida uma vez: sem cache em disco nem cópia na memória
+                dados = carregar_poblacion(ficheiro, usar_cache=False)
+                if not len(dados):
+                    raise ValueError("o CSV não tem linhas de dados")
+                resumo = historico.ingerir(dados, origem=os.path.abspath(ficheiro))
+            except FileNotFoundError:
+                print(f"ERRO: ficheiro não encontrado: {ficheiro}")
+                return 1
+            except ValueError as e:
+                print(f"ERRO: {ficheiro}: {e}")
+                return 2
+            finally:
+                funciones._entradas_lidas.pop(("poblacion", os.path.abspath(ficheiro)), None)
+            anos_novos = ", ".join(map(str, resumo["anos_novos"])) or "nenhum"
+            print(f"SUCESSO! {os.path.basename(ficheiro)}: anos novos {anos_novos}, "
+                  f"{resumo['celulas_revistas']} célula(s) revista(s), {resumo['regioes_novas']} região(ões) nova(s)")
+    elif args.comando == "compactar":
+        print(f"SUCESSO! {historico.compactar()} revisão(ões) aplicada(s).")
+    else:
+        if not historico.existe():
+            print(f"AVISO: ainda não há histórico em {args.pasta}")
+            return 0
+        print(f"{len(historico)} regiões, sexos {', '.join(historico.sexos)}, "
+              f"anos {min(historico.anos)}-{max(historico.anos)} ({len(historico.anos)}), "
+              f"{historico.indice['revisoes']} revisão(ões) por compactar")
+        for publicacao in historico.indice["publicacoes"]:
+            print(f"  {publicacao['data']} {os.path.basename(publicacao['origem'])}: "
+                  f"anos novos {publicacao['anos_novos'] or '-'}, {publicacao['celulas_revistas']} revista(s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import csv
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+#medição de cada etapa dos relatórios: tempo real, tempo de CPU, pico de memória
+#(tracemalloc) e linhas/células processadas. Desligada por omissão; ligada pelas
+#variáveis de ambiente abaixo para chegar também aos processos do pool
+
+#ficheiro (JSON lines) onde cada processo acrescenta as suas medições
+VAR_TRACE = "PTC_TRACE"
+#pasta onde gravar o cProfile de cada relatório
+VAR_PERFIL = "PTC_PERFIL"
+
+#colunas do trace, pela ordem em que aparecem no CSV
+CAMPOS = ["relatorio", "etapa", "segundos", "cpu_segundos", "pico_memoria",
+          "linhas", "celulas", "erro", "pid", "inicio"]
+
+class _SemMedicao:
+    """
+    Medição desligada: um único objeto reutilizado que não faz nada.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, erro, tb):
+        return False
+
+    def contar(self, linhas=0, celulas=0):
+        pass
+
+_sem_medicao = _SemMedicao()
+
+#medições abertas neste processo (para etapas dentro de etapas)
+_abertas = []
+
+class Medicao:
+    """
+    Mede o bloco `with` e acrescenta o registo ao ficheiro de trace ao sair.
+    O pico de memória é o máximo alocado acima do que já estava em uso
+    no início da etapa, incluindo as etapas internas. Com memoria=False só
+    mede os tempos (sem tracemalloc, que atrasaria tudo o que corre dentro)
+    e o pico fica vazio.
+    """
+    def __init__(self, relatorio, etapa, ficheiro, memoria=True):
+        self.relatorio = relatorio
+        self.etapa = etapa
+        self.ficheiro = ficheiro
+        self.memoria = memoria
+        self.linhas = 0
+        self.celulas = 0
+        self._pico_internas = 0
+
+    def contar(self, linhas=0, celulas=0):
+        self.linhas += linhas
+        self.celulas += celulas
+
+    def __enter__(self):
+        self._iniciou_tracemalloc = self.memoria and not tracemalloc.is_tracing()
+        if self._iniciou_tracemalloc:
+            tracemalloc.start()
+        if self.memoria:
+            self._memoria_inicio, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            _abertas.append(self)
+        self._data_inicio = time.time()
+        self._cpu_inicio = time.process_time()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, erro, tb):
+        segundos = time.perf_counter() - self._inicio
+        cpu = time.process_time() - self._cpu_inicio
+        pico_memoria = None
+        if self.memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            pico = max(pico, self._pico_internas)
+            pico_memoria = max(0, pico - self._memoria_inicio)
+
+            _abertas.pop()
+            if _abertas:
+                #o reset_peak desta etapa apagou o pico da etapa de fora
+                exterior = _abertas[-1]
+                exterior._pico_internas = max(exterior._pico_internas, pico)
+            if self._iniciou_tracemalloc:
+                tracemalloc.stop()
+
+        _acrescentar(self.ficheiro, {
+            "relatorio": self.relatorio,
+            "etapa": self.etapa,
+            "segundos": segundos,
+            "cpu_segundos": cpu,
+            "pico_memoria": pico_memoria,
+            "linhas": self.linhas,
+            "celulas": self.celulas,
+            "erro": tipo.__name__ if tipo is not None else None,
+            "pid": os.getpid(),
+            "inicio": self._data_inicio,
+        })
+        return False
+
+def _acrescentar(ficheiro, registo):
+    #uma só escrita em modo append: linhas de vários processos não se misturam
+    linha = (json.dumps(registo, ensure_ascii=False) + "\n").encode("utf-8")
+    fd = os.open(ficheiro, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, linha)
+    finally:
+        os.close(fd)
+
+def medir(relatorio, etapa, memoria=True):
+    """
+    Context manager que mede uma etapa:
+
+        with medir("R1", "html") as m:
+            ...
+            m.contar(linhas=n, celulas=k)
+
+    Sem PTC_TRACE devolve um objeto que não faz nada. memoria=False mede só
+    os tempos (para blocos que contêm outras etapas medidas).
+    """
+    ficheiro = os.environ.get(VAR_TRACE)
+    if not ficheiro:
+        return _sem_medicao
+    return Medicao(relatorio, etapa, ficheiro, memoria)
+
+@contextmanager
+def perfil(nome):
+    """
+    Corre o bloco com o cProfile e grava `<nome>.prof` na pasta de PTC_PERFIL
+    (ver com `python -m pstats`). Sem PTC_PERFIL não faz nada.
+    """
+    pasta = os.environ.get(VAR_PERFIL)
+    if not pasta:
+        yield
+        return
+
+    import cProfile
+    perfilador = cProfile.Profile()
+    perfilador.enable()
+    try:
+        yield
+    finally:
+        perfilador.disable()
+        os.makedirs(pasta, exist_ok=True)
+        perfilador.dump_stats(os.path.join(pasta, f"{nome}.prof"))
+
+def ler_registos(ficheiro):
+    """
+    Lê as medições acrescentadas em `ficheiro` (JSON lines).
+    """
+    if not os.path.exists(ficheiro):
+        return []
+    with open(ficheiro, "r", encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+def exportar(registos, destino):
+    """
+    Grava as medições em `destino`: CSV se terminar em .csv, senão JSON.
+    """
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    try:
+        with open(temporario, "w", encoding="utf-8", newline="") as f:
+            if destino.lower().endswith(".csv"):
+                escritor = csv.DictWriter(f, fieldnames=CAMPOS)
+                escritor.writeheader()
+                escritor.writerows(registos)
+            else:
+                json.dump(registos, f, indent=1, ensure_ascii=False)
+        os.replace(temporario, destino)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
@@ -0,0 +1,227 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import funciones
+from funciones import (escrita_atomica, caminho, carregar_comunidades, carregar_relacao, carregar_poblacion,
+                       file_comunidades, file_relacao, file_saida_R1, file_saida_R2, file_saida_R3,
+                       file_saida_R4, file_saida_R5, cod_nacional)
+from exportar import exportar
+import R1
+import R2
+import R3
+import R4
+import R5
+
+#processa muitos CSV do INE (uma revisão do padrão cada) numa só execução:
+#as tabelas de códigos são lidas uma vez e enviadas uma vez a cada processo,
+#cada CSV gera R1-R5 na sua pasta e no fim grava-se um resumo comparativo
+
+pasta_lotes = caminho("resultados/lotes")
+
+#tabelas de códigos de cada processo (recebidas uma vez no arranque)
+_tabelas = None
+
+def _iniciar(dic_ccaa, dic_mapa, formatos):
+    global _tabelas
+    _tabelas = (dic_ccaa, dic_mapa, formatos)
+
+def listar_csv(padroes):
+    """
+    CSV de cada padrão (uma pasta ou um glob), ordenados e sem repetidos.
+    Levanta ValueError se dois tiverem o mesmo nome (iriam para a mesma pasta).
+    """
+    ficheiros = []
+    for padrao in padroes:
+        if os.path.isdir(padrao):
+            ficheiros += glob.glob(os.path.join(padrao, "*.csv"))
+        else:
+            ficheiros += glob.glob(padrao)
+    ficheiros = sorted(set(os.path.abspath(f) for f in ficheiros))
+
+    nomes = {}
+    for ficheiro in ficheiros:
+        nome = nome_snapshot(ficheiro)
+        if nome in nomes:
+            raise ValueError(f"dois CSV com o mesmo nome: {nomes[nome]} e {ficheiro}")
+        nomes[nome] = ficheiro
+    return ficheiros
+
+def nome_snapshot(ficheiro):
+    return os.path.splitext(os.path.basename(ficheiro))[0]
+
+def _destinos(pasta):
+    #a mesma estrutura do projeto (resultados/ e imagenes/), para os
+    #"../imagenes/R3.png" dos HTML continuarem a funcionar
+    html = os.path.join(pasta, "resultados")
+    imagens = os.path.join(pasta, "imagenes")
+    os.makedirs(html, exist_ok=True)
+    os.makedirs(imagens, exist_ok=True)
+    return {
+        "R1": os.path.join(html, os.path.basename(file_saida_R1)),
+        "R2": os.path.join(html, os.path.basename(file_saida_R2)),
+        "R3": os.path.join(imagens, os.path.basename(file_saida_R3)),
+        "R4": os.path.join(html, os.path.basename(file_saida_R4)),
+        "R5": os.path.join(imagens, os.path.basename(file_saida_R5)),
+        "dados": os.path.join(pasta, "dados"),
+    }
+
+def processar(tarefa):
+    """
+    Gera R1-R5 de um CSV em `pasta`. Devolve um dicionário com o resumo
+    (totais nacionais por ano) ou com o erro.
+    """
+    ficheiro, pasta = tarefa
+    dic_ccaa, dic_mapa, formatos = _tabelas
+    inicio = time.perf_counter()
+    resumo = {"snapshot": nome_snapshot(ficheiro), "ficheiro": ficheiro, "pasta": pasta, "erro": None}
+    try:
+        #sem a cache em disco: cada snapshot é lido uma só vez, um .npz por
+        #snapshot só faria crescer a .cache (e custaria o hash e a escrita)
+        dados = carregar_poblacion(ficheiro, usar_cache=False)
+        if not len(dados):
+            raise ValueError("o CSV não tem linhas de dados")
+        destinos = _destinos(pasta)
+
+        var_abs, var_rel = R1.calcular(dados)
+        R1.escrever(dados, var_abs, var_rel, destinos["R1"])
+
+        chaves, agregados = R2.agregar(dados, dic_ccaa, dic_mapa)
+        R2.escrever(dados, dic_ccaa, chaves, agregados, destinos["R2"])
+
+        por_ccaa = R3.agregar(dados, dic_ccaa, dic_mapa)
+        R3.desenhar(dados, *R3.calcular(dados, dic_ccaa, por_ccaa), destinos["R3"])
+        R5.desenhar(dados, R5.calcular(dados, dic_ccaa, por_ccaa), destinos["R5"])
+
+        codigos_ccaa, por_sexo = R4.agregar(dados, dic_ccaa, dic_mapa)
+        vari_abs, vari_rel = R4.calcular(por_sexo)
+        R4.escrever(dados, dic_ccaa, codigos_ccaa, vari_abs, vari_rel, destinos["R4"])
+
+        if formatos:
+            exportar("R1", R1.resultados(dados, var_abs, var_rel), formatos, destinos["dados"])
+            exportar("R2", R2.resultados(dados, dic_ccaa, chaves, agregados), formatos, destinos["dados"])
+            exportar("R4", R4.resultados(dados, dic_ccaa, codigos_ccaa, vari_abs, vari_rel), formatos, destinos["dados"])
+
+        #total nacional por sexo e ano (a linha do CSV ou a soma das províncias)
+        if cod_nacional in dados.indice:
+            nacional = dados.cubo()[dados.indice[cod_nacional]]
+        else:
+            nacional = dados.cubo().sum(axis=0)
+        resumo.update({
+            "regioes": len(dados),
+            "anos": dados.anos,
+            "sexos": dados.sexos,
+            "nacional": nacional.tolist(),
+        })
+    except Exception as e:
+        #um CSV com problemas não pára o lote
+        resumo["erro"] = f"{type(e).__name__}: {e}"
+    finally:
+        #cada CSV é lido uma vez; não guardar todos na memória do processo
+        funciones._entradas_lidas.pop(("poblacion", os.path.abspath(ficheiro)), None)
+    resumo["segundos"] = time.perf_counter() - inicio
+    return resumo
+
+def processar_lote(ficheiros, dic_ccaa, dic_mapa, pasta_saida=pasta_lotes, jobs=None, formatos=()):
+    """
+    Processa todos os `ficheiros` (um snapshot cada) com `jobs` processos.
+    Devolve a lista dos resumos pela ordem dos ficheiros.
+    """
+    tarefas = [(f, os.path.join(pasta_saida, nome_snapshot(f))) for f in ficheiros]
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(tarefas)))
+
+    resumos = {}
+    if jobs == 1:
+        _iniciar(dic_ccaa, dic_mapa, list(formatos))
+        for tarefa in tarefas:
+            resumos[tarefa[0]] = _mostrar(processar(tarefa))
+    else:
+        #as tabelas de códigos vão uma vez para cada processo, não uma vez por CSV
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_iniciar,
+                                 initargs=(dic_ccaa, dic_mapa, list(formatos))) as pool:
+            futuros = [pool.submit(processar, tarefa) for tarefa in tarefas]
+            for futuro in as_completed(futuros):
+                resumo = _mostrar(futuro.result())
+                resumos[resumo["ficheiro"]] = resumo
+    return [resumos[f] for f in ficheiros]
+
+def _mostrar(resumo):
+    if resumo["erro"]:
+        print(f"ERRO: {resumo['snapshot']}: {resumo['erro']}")
+    else:
+        print(f"{resumo['snapshot']}: {resumo['regioes']} regiões, "
+              f"{min(resumo['anos'])}-{max(resumo['anos'])} em {resumo['segundos']:.2f} s")
+    return resumo
+
+def gravar_resumo(resumos, destino):
+    """
+    Resumo comparativo dos snapshots em CSV: uma linha por (snapshot, ano)
+    com o total nacional de cada sexo, para ver o que cada revisão mudou.
+    """
+    sexos = []
+    for resumo in resumos:
+        for sexo in resumo.get("sexos", []):
+            if sexo not in sexos:
+                sexos.append(sexo)
+
+    with escrita_atomica(destino, newline="") as f:
+        escritor = csv.writer(f, lineterminator="\n")
+        escritor.writerow(["snapshot", "regioes", "ano"] + sexos + ["erro"])
+        for resumo in resumos:
+            if resumo["erro"]:
+                escritor.writerow([resumo["snapshot"], "", ""] + [""] * len(sexos) + [resumo["erro"]])
+                continue
+            por_sexo = dict(zip(resumo["sexos"], resumo["nacional"]))
+            for j, ano in enumerate(resumo["anos"]):
+                valores = [por_sexo[s][j] if s in por_sexo else "" for s in sexos]
+                escritor.writerow([resumo["snapshot"], resumo["regioes"], ano] + valores + [""])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera R1-R5 para vários CSV do INE (snapshots) numa só execução.")
+    parser.add_argument("entradas", nargs="+", help="pastas com CSV ou padrões glob (ex: 'arquivo/*.csv')")
+    parser.add_argument("--saida", default=pasta_lotes, help="pasta dos resultados (uma subpasta por CSV)")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="número de processos (por omissão, um por CPU)")
+    parser.add_argument("--exportar", default=None, metavar="FORMATOS",
+                        help="exporta também os dados de R1, R2 e R4 de cada CSV (ver main.py --exportar)")
+    args = parser.parse_args(argv)
+
+    try:
+        ficheiros = listar_csv(args.entradas)
+        formatos = []
+        if args.exportar:
+            from caminhos import resolver_formatos
+            formatos = resolver_formatos(args.exportar)
+    except ValueError as e:
+        print(f"ERRO: {e}")
+        return 2
+    if not ficheiros:
+        print("ERRO: nenhum CSV encontrado.")
+        return 2
+
+    try:
+        dic_ccaa = carregar_comunidades(file_comunidades)
+        dic_mapa = carregar_relacao(file_relacao)
+    except FileNotFoundError as e:
+        print(f"ERRO: ficheiro de entrada em falta: {e}")
+        return 1
+
+    print(f"A processar {len(ficheiros)} CSV...")
+    inicio = time.perf_counter()
+    resumos = processar_lote(ficheiros, dic_ccaa, dic_mapa, args.saida, args.jobs, formatos)
+    os.makedirs(args.saida, exist_ok=True)
+    destino = os.path.join(args.saida, "resumo.csv")
+    gravar_resumo(resumos, destino)
+
+    erros = sum(1 for r in resumos if r["erro"])
+    print(f"SUCESSO! {len(resumos) - erros} de {len(resumos)} CSV em {time.perf_counter() - inicio:.2f} s; "
+          f"resumo em {destino}")
+    return 1 if erros else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
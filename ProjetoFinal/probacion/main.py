@@ -1,19 +1,278 @@
-import R1
-import R2
-import R3
-import R4
-import R5
+import time
+_inicio_importacao = time.perf_counter()
+
+#só módulos leves aqui: numpy, matplotlib e os relatórios são importados
+#por cada etapa quando corre, por isso --help e --list arrancam logo
+import argparse
+import os
+import sys
+import instrumentacao
+import pipeline
+from caminhos import (base_dir, pasta_cache, file_csv, file_comunidades, file_relacao, file_saida_R1,
+                      file_saida_R2, file_saida_R3, file_saida_R4, file_saida_R5,
+                      resolver_formatos, ficheiros_exportacao, MODOS_HTML, indice_paginas,
+                      pasta_historico, ler_janela)
+
+tempo_importacao = time.perf_counter() - _inicio_importacao
+
+#entradas comuns a todos os relatórios por CCAA
+_entradas_ccaa = [file_csv, file_comunidades, file_relacao]
+
+#código partilhado por todos os relatórios (entra no hash de cada etapa)
+_codigo_comum = [os.path.join(base_dir, f) for f in ("funciones.py", "caminhos.py", "tabelas_html.py", "cache.py",
+                                                     "paginacao.py", "partilhado.py")]
+
+#os gráficos dependem também do graficos.py e do consultas.py (top 10)
+_codigo_graficos = _codigo_comum + [os.path.join(base_dir, f) for f in ("graficos.py", "consultas.py")]
+
+#o HTML do R2 inclui o gráfico do R3 e o do R4 inclui o do R5
+ETAPAS = [
+    pipeline.Etapa("R1", "R1", [file_csv], [file_saida_R1], _codigo_comum),
+    pipeline.Etapa("R2", "R2", _entradas_ccaa + [file_saida_R3], [file_saida_R2], _codigo_comum),
+    pipeline.Etapa("R3", "R3", _entradas_ccaa, [file_saida_R3], _codigo_graficos),
+    pipeline.Etapa("R4", "R4", _entradas_ccaa + [file_saida_R5], [file_saida_R4], _codigo_comum),
+    pipeline.Etapa("R5", "R5", _entradas_ccaa, [file_saida_R5], _codigo_graficos),
+]
+
+#relatórios com resultados numéricos exportáveis (--exportar)
+RELATORIOS_EXPORTAVEIS = ("R1", "R2", "R4")
+
+#relatórios em tabela HTML (--html)
+RELATORIOS_HTML = ("R1", "R2", "R4")
+
+#hashes da última execução de cada etapa (para saltar as que não mudaram)
+file_manifesto = os.path.join(pasta_cache, "manifesto.json")
+
+def ler_argumentos(argv):
+    parser = argparse.ArgumentParser(description="Gera os relatórios R1-R5 de população.")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="número de processos em paralelo (por omissão, um por CPU; 1 = sequencial)")
+    parser.add_argument("--only", default=None,
+                        help="relatórios a gerar, separados por vírgula (ex: R1,R4)")
+    parser.add_argument("--sem-cache", action="store_true",
+                        help="ignora a cache de entradas em disco")
+    parser.add_argument("--limpar-cache", action="store_true",
+                        help="apaga a cache de entradas antes de começar")
+    parser.add_argument("--forcar", action="store_true",
+                        help="gera todos os relatórios mesmo que nada tenha mudado")
+    parser.add_argument("--trace", default=None, metavar="FICHEIRO",
+                        help="grava o tempo, CPU, pico de memória e linhas/células de cada etapa "
+                             "(CSV se terminar em .csv, senão JSON); implica --forcar")
+    parser.add_argument("--profile", nargs="?", const=os.path.join(pasta_cache, "perfis"), default=None,
+                        metavar="PASTA", help="grava o cProfile de cada relatório (<relatório>.prof); implica --forcar")
+    parser.add_argument("--exportar", default=None, metavar="FORMATOS",
+                        help="exporta também os resultados de R1, R2 e R4 para resultados/dados "
+                             "(parquet, arrow, npz, npy, csv, jsonl ou auto; separados por vírgula)")
+    parser.add_argument("--html", choices=MODOS_HTML, default="completo",
+                        help="R1, R2 e R4 numa só página (completo), com a primeira página e o resto "
+                             "carregado ao descer (paginado) ou em várias páginas HTML (estatico)")
+    parser.add_argument("--linhas-pagina", type=int, default=500, metavar="N",
+                        help="linhas por página nos modos paginado e estatico")
+    parser.add_argument("--historico", nargs="?", const=pasta_historico, default=None, metavar="PASTA",
+                        help="lê os dados do histórico (ver historico.py) em vez do CSV")
+    parser.add_argument("--anos", default=None, metavar="INICIO-FIM",
+                        help="só os anos desta janela (ex: 2012-2017), do CSV ou do histórico")
+    parser.add_argument("--sem-partilha", action="store_true",
+                        help="cada processo do pool lê as entradas em vez de as receber em memória partilhada")
+    parser.add_argument("--watch", action="store_true",
+                        help="depois de gerar, fica a observar 'entradas' e atualiza só o que mudou")
+    parser.add_argument("--list", action="store_true",
+                        help="mostra os relatórios disponíveis e sai (sem importar numpy/matplotlib)")
+    return parser.parse_args(argv)
+
+def listar(etapas):
+    deps = pipeline.dependencias(etapas)
+    for etapa in etapas:
+        saidas = ", ".join(os.path.relpath(s, os.path.dirname(base_dir)) for s in etapa.saidas)
+        depende = ", ".join(sorted(deps[etapa.nome])) or "-"
+        print(f"{etapa.nome}: {saidas} (depende de: {depende})")
+
+def com_exportacao(etapas, formatos):
+    """
+    Acrescenta os ficheiros exportados às saídas dos relatórios exportáveis
+    (e os formatos aos parâmetros, para o manifesto saber que mudaram).
+    """
+    novas = []
+    for etapa in etapas:
+        if etapa.nome in RELATORIOS_EXPORTAVEIS:
+            saidas = etapa.saidas + list(ficheiros_exportacao(etapa.nome, formatos).values())
+            etapa = pipeline.Etapa(etapa.nome, etapa.modulo, etapa.entradas, saidas,
+                                   etapa.codigo + [os.path.join(base_dir, "exportar.py")],
+                                   dict(etapa.parametros, exportar=formatos), etapa.indices)
+        novas.append(etapa)
+    return novas
+
+def com_html(etapas, modo, linhas):
+    """
+    Regista o modo HTML nos parâmetros dos relatórios HTML, para o manifesto
+    os gerar de novo quando o modo muda. Fora do modo completo, o índice das
+    páginas geradas entra nas saídas (e as páginas que lista também contam).
+    """
+    novas = []
+    for etapa in etapas:
+        if etapa.nome in RELATORIOS_HTML:
+            indices = []
+            if modo != "completo":
+                indices = [indice_paginas(s) for s in etapa.saidas if s.endswith(".html")]
+            etapa = pipeline.Etapa(etapa.nome, etapa.modulo, etapa.entradas, etapa.saidas + indices, etapa.codigo,
+                                   dict(etapa.parametros, html=modo, linhas_pagina=linhas),
+                                   etapa.indices + indices)
+        novas.append(etapa)
+    return novas
+
+def com_historico(etapas, pasta, janela):
+    """
+    Troca o CSV pelo índice do histórico nas entradas (o índice muda a cada
+    publicação acrescentada) e regista a pasta e a janela nos parâmetros.
+    """
+    novas = []
+    for etapa in etapas:
+        entradas, codigo = etapa.entradas, etapa.codigo
+        if pasta is not None:
+            indice = os.path.join(pasta, "indice.json")
+            entradas = [indice if e == file_csv else e for e in entradas]
+            codigo = codigo + [os.path.join(base_dir, "historico.py")]
+        novas.append(pipeline.Etapa(etapa.nome, etapa.modulo, entradas, etapa.saidas, codigo,
+                                    dict(etapa.parametros, historico=pasta, anos=janela), etapa.indices))
+    return novas
+
+def publicar_entradas():
+    """
+    Lê as entradas uma vez e publica-as em memória partilhada para os processos
+    do pool (ver partilhado.py). None se não for possível: cada relatório lê
+    então as suas e mostra o erro, se houver.
+    """
+    import partilhado #traz o numpy, só quando há um pool
+    try:
+        return partilhado.publicar_entradas()
+    except (OSError, ValueError) as e:
+        print(f"AVISO: entradas não partilhadas ({e}); cada processo lê as suas.")
+        return None
+
+def gravar_trace(parcial, destino):
+    registos = instrumentacao.ler_registos(parcial)
+    registos.sort(key=lambda r: r["inicio"])
+    instrumentacao.exportar(registos, destino)
+    if os.path.exists(parcial):
+        os.remove(parcial)
+
+def main(argv=None):
+    args = ler_argumentos(argv)
+
+    if args.list:
+        listar(ETAPAS)
+        return 0
+
+    if args.sem_cache:
+        #variável de ambiente para chegar também aos processos do pool
+        os.environ["PTC_SEM_CACHE"] = "1"
+    #o trace e os perfis também passam aos processos por variáveis de ambiente
+    trace_parcial = None
+    if args.trace:
+        trace_parcial = f"{os.path.abspath(args.trace)}.{os.getpid()}.partes"
+        if os.path.exists(trace_parcial):
+            os.remove(trace_parcial)
+        os.environ[instrumentacao.VAR_TRACE] = trace_parcial
+    if args.profile:
+        os.environ[instrumentacao.VAR_PERFIL] = os.path.abspath(args.profile)
+    #etapas saltadas não seriam medidas
+    forcar = args.forcar or bool(args.trace or args.profile)
+
+    if args.limpar_cache:
+        import cache #traz o numpy, só quando é preciso
+        cache.limpar_cache()
+
+    etapas = ETAPAS
+    if args.exportar:
+        try:
+            formatos = resolver_formatos(args.exportar)
+        except ValueError as e:
+            print(f"ERRO: {e}")
+            return 2
+        #os relatórios leem os formatos no seu processo
+        os.environ["PTC_EXPORTAR"] = ",".join(formatos)
+        etapas = com_exportacao(etapas, formatos)
+
+    if args.html != "completo":
+        if args.linhas_pagina < 1:
+            print("ERRO: --linhas-pagina tem de ser pelo menos 1.")
+            return 2
+        os.environ["PTC_HTML"] = args.html
+        os.environ["PTC_HTML_LINHAS"] = str(args.linhas_pagina)
+        etapas = com_html(etapas, args.html, args.linhas_pagina)
+
+    if args.watch and (args.historico or args.anos):
+        #o --watch atualiza a partir do CSV completo: as atualizações desfariam a janela
+        print("ERRO: o --watch observa o CSV completo e não pode ser usado com --historico ou --anos.")
+        return 2
+
+    if args.historico or args.anos:
+        try:
+            janela = ler_janela(args.anos)
+        except ValueError as e:
+            print(f"ERRO: {e}")
+            return 2
+        pasta = os.path.abspath(args.historico) if args.historico else None
+        if pasta is not None and not os.path.exists(os.path.join(pasta, "indice.json")):
+            print(f"ERRO: não há histórico em {pasta} (crie-o com: python historico.py ingerir <CSV>)")
+            return 2
+        if pasta is not None:
+            os.environ["PTC_HISTORICO"] = pasta
+        if janela is not None:
+            os.environ["PTC_ANOS"] = f"{janela[0]}-{janela[1]}"
+        etapas = com_historico(etapas, pasta, janela)
+
+    if args.only:
+        try:
+            etapas = pipeline.selecionar(etapas, [n.strip().upper() for n in args.only.split(",") if n.strip()])
+        except ValueError as e:
+            print(f"ERRO: {e}")
+            return 2
 
-def main():
     print("\n===== INICIAR PROJETO POBLACION =====\n")
 
-    R1.main()
-    R2.main()
-    R3.main()
-    R4.main()
-    R5.main()
+    #com mais de um processo, as entradas são lidas aqui uma vez e partilhadas,
+    #mas só se houver mais de uma etapa para correr (sem alterações não se lê nada)
+    jobs = args.jobs if args.jobs is not None else (os.cpu_count() or 1)
+    manifesto = pipeline.Manifesto(file_manifesto)
+    publicacao = None
+    if (jobs > 1 and len(etapas) > 1 and not args.sem_partilha
+            and len(pipeline.a_correr(etapas, manifesto, forcar)) > 1):
+        publicacao = publicar_entradas()
+
+    try:
+        importacoes = {}
+        tempos = pipeline.executar(etapas, jobs=args.jobs, manifesto=manifesto, forcar=forcar,
+                                   importacoes=importacoes)
+    except RuntimeError as e:
+        print(f"\nERRO: {e}")
+        return 1
+    finally:
+        if publicacao is not None:
+            publicacao.fechar()
+        if trace_parcial:
+            gravar_trace(trace_parcial, args.trace)
+
+    print()
+    print(f"importação do CLI: {tempo_importacao * 1000:.1f} ms")
+    for nome, segundos in tempos.items():
+        if segundos is None:
+            print(f"{nome}: sem alterações (saltado)")
+        else:
+            print(f"{nome}: {segundos:.2f} s (importação {importacoes[nome]:.2f} s)")
+
+    if args.trace:
+        print(f"trace gravado em {args.trace}")
+    if args.profile:
+        print(f"perfis cProfile gravados em {args.profile}")
+
+    if args.watch:
+        import observar #traz o numpy, o matplotlib e os relatórios
+        #o modo HTML e os formatos a exportar seguem pelas variáveis de ambiente
+        return observar.observar(saidas=[etapa.nome for etapa in etapas], gerar=False)
 
     print("\n===== FIM DO PROJETO =====\n")
+    return 0
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import funciones
+from funciones import (carregar_comunidades, carregar_relacao, carregar_poblacion, agregacao_ccaa, formatar_numeros,
+                       file_csv, file_comunidades, file_relacao)
+from consultas import Selecao
+from exportar import exportar, formatos_pedidos
+import R1
+import R2
+import R3
+import R4
+import R5
+
+#modo --watch: observa os ficheiros de 'entradas' e, quando o CSV muda, compara
+#a nova matriz com a anterior e recalcula só as províncias alteradas, as CCAA a
+#que pertencem e as linhas e gráficos dos relatórios que dependem delas.
+#O modo HTML (PTC_HTML) e as exportações (PTC_EXPORTAR) valem também para as atualizações
+
+#segundos entre verificações e sem alterações antes de processar (debounce)
+INTERVALO = 0.5
+ESPERA = 0.3
+
+SAIDAS = ("R1", "R2", "R3", "R4", "R5")
+
+class Incremental:
+    """
+    Estado dos relatórios mantido entre alterações: agregados por CCAA
+    (CCAA x sexo x ano), variações e células já formatadas de R1, R2 e R4,
+    e os dados dos gráficos do R3 e do R5.
+    """
+    def __init__(self, dados, dic_ccaa, dic_mapa):
+        self.dados = dados
+        self.dic_ccaa = dic_ccaa
+        self.dic_mapa = dic_mapa
+        self.codigos_ccaa = sorted(dic_ccaa)
+        self.agregacao = agregacao_ccaa(dados, dic_mapa, self.codigos_ccaa)
+        self.i_sexos = [dados.sexos.index("Hombres"), dados.sexos.index("Mujeres")]
+
+        self.var_abs, self.var_rel = R1.calcular(dados)
+        self.celulas_R1 = R1.formatar(self.var_abs, self.var_rel)
+
+        self.por_ccaa, _ = self.agregacao.somar(dados.cubo())
+        self.celulas_R2 = formatar_numeros(self._matriz_R2())
+
+        self.vari_abs, self.vari_rel = R4.calcular(self.por_ccaa[:, self.i_sexos])
+        self.celulas_R4 = R4.formatar(self.vari_abs, self.vari_rel)
+
+        #cópias (em tuplos) dos dados do último gráfico gravado
+        self.grafico_R3 = self.grafico_R5 = None
+
+    def _matriz_R2(self, ccaa=slice(None)):
+        return self.por_ccaa[ccaa].reshape(len(self.por_ccaa[ccaa]), -1)
+
+    def compativel(self, novos):
+        """
+        Só é possível atualizar por diferenças se as regiões, anos e sexos são os mesmos.
+        """
+        return (np.array_equal(novos.codigos, self.dados.codigos) and np.array_equal(novos.nomes, self.dados.nomes)
+                and novos.anos == self.dados.anos and novos.sexos == self.dados.sexos)
+
+    def atualizar(self, novos):
+        """
+        Aplica os dados novos (compatíveis) e devolve (províncias alteradas,
+        CCAA alteradas). Só as linhas afetadas são recalculadas e formatadas.
+        """
+        linhas = np.flatnonzero((novos.matriz != self.dados.matriz).any(axis=1))
+        antigos, self.dados = self.dados, novos
+        if not len(linhas):
+            return linhas, np.zeros(0, dtype=np.intp)
+
+        #R1: variação e células só das províncias alteradas
+        var_abs, var_rel = R1.calcular(novos, linhas)
+        self.var_abs[linhas] = var_abs
+        self.var_rel[linhas] = var_rel
+        self.celulas_R1[linhas] = R1.formatar(var_abs, var_rel)
+
+        #CCAA: somar a diferença das províncias alteradas ao agregado de cada uma
+        grupos = self.agregacao.indices[linhas]
+        com_grupo = grupos >= 0
+        diferenca = novos.cubo()[linhas[com_grupo]] - antigos.cubo()[linhas[com_grupo]]
+        np.add.at(self.por_ccaa, grupos[com_grupo], diferenca)
+        ccaa = np.unique(grupos[com_grupo])
+        if len(ccaa):
+            self.celulas_R2[ccaa] = formatar_numeros(self._matriz_R2(ccaa))
+            vari_abs, vari_rel = R4.calcular(self.por_ccaa[ccaa][:, self.i_sexos])
+            self.vari_abs[ccaa] = vari_abs
+            self.vari_rel[ccaa] = vari_rel
+            self.celulas_R4[ccaa] = R4.formatar(vari_abs, vari_rel)
+        return linhas, ccaa
+
+    def _selecao(self):
+        #a mesma Selecao ao nível das CCAA que R3.agregar / R5.agregar devolvem
+        return Selecao(None, "ccaa", self.codigos_ccaa, [self.dic_ccaa[c] for c in self.codigos_ccaa],
+                       self.dados.anos, self.dados.sexos, self.por_ccaa)
+
+    def _graficos(self, saidas):
+        #dados dos gráficos pedidos: {"R3": ..., "R5": ...}
+        graficos = {}
+        if "R3" in saidas or "R5" in saidas:
+            selecao = self._selecao()
+            if "R3" in saidas:
+                graficos["R3"] = R3.calcular(self.dados, self.dic_ccaa, selecao)
+            if "R5" in saidas:
+                graficos["R5"] = R5.calcular(self.dados, self.dic_ccaa, selecao)
+        return graficos
+
+    def ja_gravadas(self, saidas=SAIDAS):
+        """
+        As saídas já estão gravadas com este estado (pelo pipeline): só guarda
+        os dados dos gráficos, para não os desenhar outra vez sem mudanças.
+        """
+        graficos = self._graficos(saidas)
+        if "R3" in graficos:
+            self.grafico_R3 = _valores(graficos["R3"])
+        if "R5" in graficos:
+            self.grafico_R5 = _valores(graficos["R5"])
+
+    def escrever(self, saidas=SAIDAS):
+        """
+        Grava as saídas pedidas (e as suas exportações, se PTC_EXPORTAR
+        estiver definido); os gráficos só quando os seus dados mudaram.
+        Devolve a lista das saídas gravadas.
+        """
+        formatos = formatos_pedidos()
+        gravadas = []
+        if "R1" in saidas:
+            R1.escrever(self.dados, self.var_abs, self.var_rel, celulas=self.celulas_R1)
+            if formatos:
+                exportar("R1", R1.resultados(self.dados, self.var_abs, self.var_rel), formatos)
+            gravadas.append("R1")
+        if "R2" in saidas:
+            R2.escrever(self.dados, self.dic_ccaa, self.codigos_ccaa, self._matriz_R2(), celulas=self.celulas_R2)
+            if formatos:
+                exportar("R2", R2.resultados(self.dados, self.dic_ccaa, self.codigos_ccaa, self._matriz_R2()),
+                         formatos)
+            gravadas.append("R2")
+        if "R4" in saidas:
+            #só as CCAA com pelo menos uma província nos dados (como em R4.agregar)
+            com_dados = self.agregacao.membros > 0
+            codigos = [cod for cod, tem in zip(self.codigos_ccaa, com_dados) if tem]
+            R4.escrever(self.dados, self.dic_ccaa, codigos, self.vari_abs[com_dados], self.vari_rel[com_dados],
+                        celulas=self.celulas_R4[com_dados])
+            if formatos:
+                exportar("R4", R4.resultados(self.dados, self.dic_ccaa, codigos, self.vari_abs[com_dados],
+                                             self.vari_rel[com_dados]), formatos)
+            gravadas.append("R4")
+
+        graficos = self._graficos(saidas)
+        if "R3" in graficos and _valores(graficos["R3"]) != self.grafico_R3:
+            R3.desenhar(self.dados, *graficos["R3"])
+            self.grafico_R3 = _valores(graficos["R3"])
+            gravadas.append("R3")
+        if "R5" in graficos and _valores(graficos["R5"]) != self.grafico_R5:
+            R5.desenhar(self.dados, graficos["R5"])
+            self.grafico_R5 = _valores(graficos["R5"])
+            gravadas.append("R5")
+        return gravadas
+
+def _valores(grafico):
+    #dados de um gráfico numa forma comparável e independente dos arrays
+    #do estado (as séries do R5 são vistas de por_ccaa)
+    if isinstance(grafico, (list, tuple)):
+        return tuple(_valores(g) for g in grafico)
+    if isinstance(grafico, np.ndarray):
+        return tuple(grafico.tolist())
+    return grafico
+
+def _assinatura(ficheiros):
+    #(tamanho, mtime) de cada ficheiro; None enquanto estiver a ser substituído
+    assinatura = []
+    for ficheiro in ficheiros:
+        try:
+            st = os.stat(ficheiro)
+            assinatura.append((st.st_size, st.st_mtime_ns))
+        except OSError:
+            assinatura.append(None)
+    return assinatura
+
+def _carregar(csv, comunidades, relacao):
+    #esquecer o que já foi lido neste processo; a cache em disco decide se relê
+    funciones._entradas_lidas.clear()
+    return carregar_poblacion(csv), carregar_comunidades(comunidades), carregar_relacao(relacao)
+
+def observar(csv=file_csv, comunidades=file_comunidades, relacao=file_relacao,
+             intervalo=INTERVALO, espera=ESPERA, ciclos=None, saidas=SAIDAS, gerar=True):
+    """
+    Gera os relatórios `saidas` e depois atualiza-os sempre que os ficheiros
+    de entrada mudam. `ciclos` limita o número de verificações (None = sempre).
+    gerar=False quando as saídas acabaram de ser geradas (pelo main.py).
+    """
+    ficheiros = [csv, comunidades, relacao]
+    assinatura = _assinatura(ficheiros)
+    try:
+        dados, dic_ccaa, dic_mapa = _carregar(*ficheiros)
+    except FileNotFoundError as e:
+        print(f"ERRO: ficheiro de entrada em falta: {e}")
+        return 1
+    estado = Incremental(dados, dic_ccaa, dic_mapa)
+    if gerar:
+        estado.escrever(saidas)
+    else:
+        estado.ja_gravadas(saidas)
+    print(f"A observar {', '.join(os.path.basename(f) for f in ficheiros)} (Ctrl+C para parar)")
+
+    verificacoes = 0
+    try:
+        while ciclos is None or verificacoes < ciclos:
+            verificacoes += 1
+            time.sleep(intervalo)
+            nova = _assinatura(ficheiros)
+            if nova == assinatura:
+                continue
+            #esperar que o ficheiro deixe de mudar (cópias e gravações por partes)
+            while True:
+                time.sleep(espera)
+                seguinte = _assinatura(ficheiros)
+                if seguinte == nova:
+                    break
+                nova = seguinte
+            if None in nova:
+                continue
+            tabelas_mudaram = nova[1:] != assinatura[1:]
+            assinatura = nova
+
+            inicio = time.perf_counter()
+            try:
+                dados, dic_ccaa, dic_mapa = _carregar(*ficheiros)
+            except (OSError, ValueError) as e:
+                print(f"ERRO: não consegui ler as entradas: {e}")
+                continue
+            leitura = time.perf_counter() - inicio
+
+            if tabelas_mudaram or not estado.compativel(dados):
+                #outras regiões, anos ou tabelas de códigos: recalcular tudo
+                estado = Incremental(dados, dic_ccaa, dic_mapa)
+                gravadas = estado.escrever(saidas)
+                resumo = "recálculo completo"
+            else:
+                linhas, ccaa = estado.atualizar(dados)
+                if not len(linhas):
+                    print("CSV alterado sem mudanças nos valores.")
+                    continue
+                #sem CCAA alteradas (só o Total Nacional) apenas o R1 muda
+                afetadas = [s for s in saidas if s == "R1" or len(ccaa)]
+                gravadas = estado.escrever(afetadas)
+                resumo = f"{len(linhas)} região(ões), {len(ccaa)} CCAA"
+            total = time.perf_counter() - inicio
+            print(f"SUCESSO! {resumo}: {', '.join(gravadas) or 'nada'} atualizado(s) em {total:.2f} s "
+                  f"(leitura {leitura:.2f} s)")
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Atualiza os relatórios sempre que os ficheiros de entrada mudam.")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO, help="segundos entre verificações")
+    parser.add_argument("--espera", type=float, default=ESPERA,
+                        help="segundos sem alterações antes de processar (junta gravações seguidas)")
+    args = parser.parse_args(argv)
+    return observar(intervalo=args.intervalo, espera=args.espera)
+
+if __name__ == "__main__":
+    sys.exit(main())
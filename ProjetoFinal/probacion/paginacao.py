@@ -0,0 +1,252 @@
+import glob
+import json
+import os
+import re
+import shutil
+from caminhos import MODOS_HTML, indice_paginas
+from funciones import EscritorRelatorio, escrita_atomica
+
+#tabelas HTML grandes sem uma página monolítica. Dois modos, com a mesma
+#interface do EscritorRelatorio, escolhidos com PTC_HTML:
+# - "paginado": o HTML traz só a primeira página de linhas e o resto fica em
+#   blocos .js ao lado (<relatorio>_dados/0002.js ...), carregados com
+#   <script> à medida que se desce (funciona também aberto como file://)
+# - "estatico": várias páginas HTML completas (<relatorio>-2.html ...) com
+#   ligações para a anterior e a seguinte
+#em ambos, <relatorio>.paginas.json lista as páginas geradas, para o pipeline
+#saber que saídas verificar
+
+VAR_HTML = "PTC_HTML"
+VAR_LINHAS = "PTC_HTML_LINHAS"
+LINHAS_POR_PAGINA = 500
+
+#carregador dos blocos: cada bloco chama __pagina(k, linhas) e cada linha é
+#montada intercalando as células com as partes do modelo de linha
+_CARREGADOR = """<script>
+(function () {
+  var partes = %(partes)s, total = %(total)d, pasta = %(pasta)s;
+  var corpo = document.querySelector("tbody"), proxima = 2, aCarregar = false;
+  window.__pagina = function (k, linhas) {
+    var html = [];
+    for (var i = 0; i < linhas.length; i++) {
+      var l = linhas[i], s = partes[0];
+      for (var j = 0; j < l.length; j++) s += l[j] + partes[j + 1];
+      html.push(s);
+    }
+    corpo.insertAdjacentHTML("beforeend", html.join(""));
+    proxima = k + 1;
+    aCarregar = false;
+    verificar();
+  };
+  function verificar() {
+    if (aCarregar || proxima > total) return;
+    if (corpo.getBoundingClientRect().bottom > window.innerHeight * 2) return;
+    aCarregar = true;
+    var s = document.createElement("script");
+    s.src = pasta + ("000" + proxima).slice(-4) + ".js";
+    document.head.appendChild(s);
+  }
+  window.addEventListener("scroll", verificar, {passive: true});
+  window.addEventListener("resize", verificar);
+  verificar();
+})();
+</script>
+"""
+
+def linhas_por_pagina():
+    try:
+        return max(1, int(os.environ.get(VAR_LINHAS, LINHAS_POR_PAGINA)))
+    except ValueError:
+        return LINHAS_POR_PAGINA
+
+def _antes_de(texto, marca, inserir):
+    #insere `inserir` antes da última `marca` (ou no fim, se não existir)
+    i = texto.rfind(marca)
+    if i < 0:
+        return texto + inserir
+    return texto[:i] + inserir + texto[i:]
+
+class EscritorPaginado(EscritorRelatorio):
+    """
+    O HTML leva o cabeçalho, a primeira página de linhas e o rodapé com o
+    carregador; as outras páginas vão para <destino sem .html>_dados/NNNN.js
+    só com as células (o modelo de linha é enviado uma vez).
+    """
+    def __init__(self, destino, cabecalho, rodape, modelo_linha, tamanho=None):
+        super().__init__(destino, cabecalho, rodape, modelo_linha)
+        self.tamanho = tamanho or linhas_por_pagina()
+        self.partes = modelo_linha.split("{}")
+        self.pasta = _pasta_blocos(destino)
+        self.pasta_relativa = os.path.basename(self.pasta) + "/"
+        self.paginas = 1
+        self._pagina = []
+
+    def linha(self, *celulas):
+        if self.linhas < self.tamanho:
+            super().linha(*celulas)
+            return
+        self._pagina.append([str(c) for c in celulas])
+        self.linhas += 1
+        self.celulas += len(celulas)
+        if len(self._pagina) >= self.tamanho:
+            self._gravar_pagina()
+
+    def _gravar_pagina(self):
+        self.paginas += 1
+        os.makedirs(self.pasta, exist_ok=True)
+        texto = json.dumps(self._pagina, ensure_ascii=False, separators=(",", ":"))
+        with escrita_atomica(os.path.join(self.pasta, f"{self.paginas:04d}.js")) as f:
+            f.write(f"__pagina({self.paginas},{texto});\n")
+        self._pagina = []
+
+    def __exit__(self, tipo, erro, tb):
+        if tipo is None:
+            if self._pagina:
+                self._gravar_pagina()
+            carregador = ""
+            if self.paginas > 1:
+                carregador = _CARREGADOR % {
+                    "partes": json.dumps(self.partes, ensure_ascii=False),
+                    "total": self.paginas,
+                    "pasta": json.dumps(self.pasta_relativa, ensure_ascii=False),
+                }
+            self.rodape = _antes_de(self.rodape, "</body>", carregador)
+        resultado = super().__exit__(tipo, erro, tb)
+        #só depois de o novo HTML estar no lugar se apagam as páginas antigas
+        if tipo is None:
+            for ficheiro in glob.glob(os.path.join(glob.escape(self.pasta), "*.js")):
+                k = _numero_bloco(ficheiro)
+                if k is not None and k > self.paginas:
+                    os.remove(ficheiro)
+            _gravar_indice(self.destino, [f"{self.pasta_relativa}{k:04d}.js" for k in range(2, self.paginas + 1)])
+            limpar_paginas(self.destino, "paginado")
+        return resultado
+
+class EscritorCompleto(EscritorRelatorio):
+    """
+    O EscritorRelatorio de sempre, que no fim apaga as páginas que os outros
+    modos tinham deixado (só se o relatório novo ficou escrito).
+    """
+    def __exit__(self, tipo, erro, tb):
+        resultado = super().__exit__(tipo, erro, tb)
+        if tipo is None:
+            limpar_paginas(self.destino, "completo")
+        return resultado
+
+def _pasta_blocos(destino):
+    return os.path.splitext(destino)[0] + "_dados"
+
+def _paginas_estaticas(destino):
+    base = os.path.splitext(destino)[0]
+    padrao = re.compile(re.escape(os.path.basename(base)) + r"-\d+\.html$")
+    return [f for f in glob.glob(f"{glob.escape(base)}-*.html") if padrao.match(os.path.basename(f))]
+
+def _gravar_indice(destino, paginas):
+    with escrita_atomica(indice_paginas(destino)) as f:
+        json.dump(paginas, f, ensure_ascii=False)
+
+def limpar_paginas(destino, modo):
+    """
+    Apaga o que os outros modos deixaram ao lado de `destino` (blocos do
+    paginado, páginas do estatico e o índice delas), para não ficarem
+    páginas antigas.
+    """
+    if modo == "completo" and os.path.exists(indice_paginas(destino)):
+        os.remove(indice_paginas(destino))
+    if modo != "paginado" and os.path.isdir(_pasta_blocos(destino)):
+        shutil.rmtree(_pasta_blocos(destino))
+    if modo != "estatico":
+        for ficheiro in _paginas_estaticas(destino):
+            os.remove(ficheiro)
+
+def _numero_bloco(ficheiro):
+    nome = os.path.splitext(os.path.basename(ficheiro))[0]
+    return int(nome) if nome.isdigit() else None
+
+class EscritorEstatico:
+    """
+    Divide a tabela em páginas HTML completas de `tamanho` linhas: a primeira
+    em `destino` e as seguintes em <destino sem .html>-2.html, -3.html, ...
+    Cada página tem ligações para a anterior e a seguinte.
+    """
+    def __init__(self, destino, cabecalho, rodape, modelo_linha, tamanho=None):
+        self.destino = destino
+        self.cabecalho = cabecalho
+        self.rodape = rodape
+        self._formatar = modelo_linha.format
+        self.tamanho = tamanho or linhas_por_pagina()
+        self.base = os.path.splitext(destino)[0]
+        self.linhas = 0
+        self.celulas = 0
+        self.paginas = 0
+        self._pagina = []
+        self._completa = None #página cheia à espera de saber se há uma seguinte
+
+    def caminho_pagina(self, k):
+        return self.destino if k == 1 else f"{self.base}-{k}.html"
+
+    def _nome_pagina(self, k):
+        return os.path.basename(self.caminho_pagina(k))
+
+    def __enter__(self):
+        return self
+
+    def linha(self, *celulas):
+        if self._completa is not None:
+            self._gravar(self._completa, ha_seguinte=True)
+            self._completa = None
+        self._pagina.append(self._formatar(*celulas))
+        self.linhas += 1
+        self.celulas += len(celulas)
+        if len(self._pagina) >= self.tamanho:
+            self._completa, self._pagina = self._pagina, []
+
+    def _gravar(self, linhas, ha_seguinte):
+        self.paginas += 1
+        k = self.paginas
+        ligacoes = []
+        if k > 1:
+            ligacoes.append(f"<a href='{self._nome_pagina(k - 1)}'>&laquo; anterior</a>")
+        ligacoes.append(f"página {k}")
+        if ha_seguinte:
+            ligacoes.append(f"<a href='{self._nome_pagina(k + 1)}'>seguinte &raquo;</a>")
+        navegacao = f"<p style='text-align:center'>{' | '.join(ligacoes)}</p>\n"
+
+        with escrita_atomica(self.caminho_pagina(k), buffering=EscritorRelatorio.TAMANHO_BUFFER) as f:
+            f.write(self.cabecalho)
+            f.writelines(linhas)
+            f.write(_antes_de(self.rodape, "</body>", navegacao))
+
+    def __exit__(self, tipo, erro, tb):
+        if tipo is None:
+            if self._completa is not None:
+                self._gravar(self._completa, ha_seguinte=bool(self._pagina))
+            if self._pagina or self.paginas == 0:
+                self._gravar(self._pagina, ha_seguinte=False)
+            for ficheiro in _paginas_estaticas(self.destino):
+                if int(ficheiro[:-len(".html")].rsplit("-", 1)[1]) > self.paginas:
+                    os.remove(ficheiro)
+            _gravar_indice(self.destino, [self._nome_pagina(k) for k in range(2, self.paginas + 1)])
+            limpar_paginas(self.destino, "estatico")
+        return False
+
+def modo_html():
+    return os.environ.get(VAR_HTML) or "completo"
+
+def escritor_relatorio(destino, cabecalho, rodape, modelo_linha, modo=None):
+    """
+    Escritor de um relatório para o modo HTML pedido (por omissão o de
+    PTC_HTML). Destinos que não são caminhos (ficheiros já abertos, como os
+    do servidor) são sempre escritos completos.
+    """
+    modo = modo or modo_html()
+    if not isinstance(destino, (str, os.PathLike)):
+        return EscritorRelatorio(destino, cabecalho, rodape, modelo_linha)
+    if modo not in MODOS_HTML:
+        raise ValueError(f"modo HTML desconhecido: {modo} (use {', '.join(MODOS_HTML)})")
+    destino = os.fspath(destino)
+    if modo == "completo":
+        return EscritorCompleto(destino, cabecalho, rodape, modelo_linha)
+    if modo == "paginado":
+        return EscritorPaginado(destino, cabecalho, rodape, modelo_linha)
+    return EscritorEstatico(destino, cabecalho, rodape, modelo_linha)
@@ -0,0 +1,194 @@
+import atexit
+import json
+import os
+import numpy as np
+from multiprocessing import shared_memory
+import funciones
+from funciones import (Agregacao, Poblacion, agregacao_ccaa, file_comunidades, file_relacao, file_csv,
+                       VAR_PARTILHADO)
+
+#entradas dos relatórios publicadas uma vez em memória partilhada para os
+#processos do pool: a matriz da população, os códigos e nomes das regiões, as
+#duas tabelas de códigos e o índice província -> CCAA já compilado. Cada
+#processo vê os arrays diretamente no segmento (vistas só de leitura do numpy),
+#sem reler a cache nem receber cópias por pickle.
+#
+#Segmento: 8 bytes com o tamanho do cabeçalho, o cabeçalho em JSON (forma,
+#dtype e posição de cada array) e os arrays, cada um alinhado a 64 bytes.
+#Quem publica apaga o segmento ao sair (com `with`, no atexit e, se o processo
+#morrer sem passar por aí, o resource_tracker do multiprocessing apaga-o).
+
+ALINHAMENTO = 64
+
+#segmentos já anexados neste processo: nome -> Entradas
+_anexados = {}
+
+def _alinhar(posicao):
+    return -(-posicao // ALINHAMENTO) * ALINHAMENTO
+
+def _dic_para_arrays(dic):
+    return np.array(list(dic.keys()), dtype=str), np.array(list(dic.values()), dtype=str)
+
+class Entradas:
+    """
+    Entradas lidas de um segmento: `dados` (Poblacion sobre a matriz partilhada),
+    `dic_ccaa`, `dic_mapa` e `ficheiros` (de onde vieram as tabelas).
+    O `segmento` fica aberto enquanto o processo existir (as vistas apontam para ele).
+    """
+    def __init__(self, dados, dic_ccaa, dic_mapa, ficheiros, segmento=None):
+        self.dados = dados
+        self.dic_ccaa = dic_ccaa
+        self.dic_mapa = dic_mapa
+        self.ficheiros = ficheiros
+        self.segmento = segmento
+
+class Publicacao:
+    """
+    Segmento criado por este processo. Use com `with` (ou chame fechar()):
+    enquanto está aberto, PTC_PARTILHADO tem o seu nome.
+    """
+    def __init__(self, dados, dic_ccaa, dic_mapa, ficheiros=None):
+        codigos_ccaa = sorted(dic_ccaa)
+        agregacao = agregacao_ccaa(dados, dic_mapa, codigos_ccaa)
+        ccaa_chaves, ccaa_valores = _dic_para_arrays(dic_ccaa)
+        mapa_chaves, mapa_valores = _dic_para_arrays(dic_mapa)
+        arrays = {
+            "matriz": dados.matriz,
+            "codigos": np.asarray(dados.codigos, dtype=str),
+            "nomes": np.asarray(dados.nomes, dtype=str),
+            "ccaa_chaves": ccaa_chaves,
+            "ccaa_valores": ccaa_valores,
+            "mapa_chaves": mapa_chaves,
+            "mapa_valores": mapa_valores,
+            "indices_ccaa": agregacao.indices,
+        }
+
+        descricao, posicao = {}, 0
+        for nome, array in arrays.items():
+            descricao[nome] = {"dtype": array.dtype.str, "forma": list(array.shape), "posicao": posicao}
+            posicao = _alinhar(posicao + array.nbytes)
+        cabecalho = json.dumps({
+            "arrays": descricao,
+            "anos": list(dados.anos),
+            "sexos": list(dados.sexos),
+            "codigos_ccaa": codigos_ccaa,
+            "ficheiros": ficheiros or {},
+        }).encode("utf-8")
+        inicio = _alinhar(8 + len(cabecalho))
+
+        self._variavel_anterior = os.environ.get(VAR_PARTILHADO)
+        self.segmento = shared_memory.SharedMemory(create=True, size=max(1, inicio + posicao))
+        self.nome = self.segmento.name
+        self.tamanho = inicio + posicao
+        #o segmento só desaparece com unlink(): apagá-lo se o preenchimento falhar
+        atexit.register(self.fechar)
+        destino = None
+        try:
+            buf = self.segmento.buf
+            buf[:8] = len(cabecalho).to_bytes(8, "little")
+            buf[8:8 + len(cabecalho)] = cabecalho
+            for nome, array in arrays.items():
+                destino = np.ndarray(array.shape, dtype=array.dtype, buffer=buf,
+                                     offset=inicio + descricao[nome]["posicao"])
+                destino[...] = array
+                del destino
+            del buf
+        except BaseException:
+            destino = buf = None
+            self.fechar()
+            raise
+
+        os.environ[VAR_PARTILHADO] = self.nome
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, erro, tb):
+        self.fechar()
+        return False
+
+    def fechar(self):
+        """
+        Fecha e apaga o segmento (pode ser chamado mais de uma vez).
+        """
+        if self.segmento is None:
+            return
+        if os.environ.get(VAR_PARTILHADO) == self.nome:
+            if self._variavel_anterior is None:
+                del os.environ[VAR_PARTILHADO]
+            else:
+                os.environ[VAR_PARTILHADO] = self._variavel_anterior
+        segmento, self.segmento = self.segmento, None
+        segmento.close()
+        try:
+            segmento.unlink()
+        except FileNotFoundError:
+            pass
+        atexit.unregister(self.fechar)
+
+def publicar(dados, dic_ccaa, dic_mapa, ficheiros=None):
+    """
+    Copia as entradas para um segmento novo e devolve a Publicacao.
+    `ficheiros` ({"comunidades": ..., "relacao": ...}) diz aos processos
+    que leituras destes ficheiros são servidas pelo segmento.
+    """
+    return Publicacao(dados, dic_ccaa, dic_mapa, ficheiros)
+
+def publicar_entradas(csv=file_csv, comunidades=file_comunidades, relacao=file_relacao):
+    """
+    Lê as entradas dos relatórios (com a janela e o histórico pedidos,
+    ver funciones.carregar_dados) e publica-as.
+    """
+    dados = funciones.carregar_dados(csv)
+    dic_ccaa = funciones.carregar_comunidades(comunidades)
+    dic_mapa = funciones.carregar_relacao(relacao)
+    ficheiros = {"comunidades": os.path.abspath(comunidades), "relacao": os.path.abspath(relacao)}
+    return publicar(dados, dic_ccaa, dic_mapa, ficheiros)
+
+def _abrir(nome):
+    #o segmento é de quem o publicou: este processo não o deve apagar ao sair
+    try:
+        return shared_memory.SharedMemory(name=nome, track=False)
+    except TypeError:
+        #Python < 3.13: sem `track`; o registo no resource_tracker (partilhado
+        #com quem publicou) não o apaga enquanto quem publicou não sair
+        return shared_memory.SharedMemory(name=nome)
+
+def anexar(nome):
+    """
+    Entradas do segmento `nome`, com os arrays como vistas só de leitura.
+    Anexa uma vez por processo e deixa as tabelas na memória de entradas
+    do funciones, para carregar_comunidades / carregar_relacao as usarem.
+    """
+    if nome in _anexados:
+        return _anexados[nome]
+
+    segmento = _abrir(nome)
+    buf = segmento.buf
+    tamanho = int.from_bytes(buf[:8], "little")
+    cabecalho = json.loads(bytes(buf[8:8 + tamanho]).decode("utf-8"))
+    inicio = _alinhar(8 + tamanho)
+
+    arrays = {}
+    for chave, d in cabecalho["arrays"].items():
+        array = np.ndarray(tuple(d["forma"]), dtype=np.dtype(d["dtype"]), buffer=buf, offset=inicio + d["posicao"])
+        array.flags.writeable = False
+        arrays[chave] = array
+
+    dados = Poblacion(arrays["codigos"], arrays["nomes"], arrays["matriz"], cabecalho["anos"], cabecalho["sexos"])
+    dic_ccaa = dict(zip(arrays["ccaa_chaves"].tolist(), arrays["ccaa_valores"].tolist()))
+    dic_mapa = dict(zip(arrays["mapa_chaves"].tolist(), arrays["mapa_valores"].tolist()))
+    #o índice província -> CCAA vem compilado (o agregacao_ccaa não o refaz);
+    #as províncias sem CCAA já foram avisadas por quem publicou
+    codigos_ccaa = cabecalho["codigos_ccaa"]
+    agregacao = Agregacao.de_indices(codigos_ccaa, arrays["indices_ccaa"])
+    dados._agregacoes[(id(dic_mapa), tuple(codigos_ccaa))] = (dic_mapa, agregacao)
+
+    ficheiros = cabecalho["ficheiros"]
+    if "comunidades" in ficheiros:
+        funciones._entradas_lidas[("comunidades", ficheiros["comunidades"])] = dic_ccaa
+    if "relacao" in ficheiros:
+        funciones._entradas_lidas[("relacao", ficheiros["relacao"])] = dic_mapa
+
+    _anexados[nome] = Entradas(dados, dic_ccaa, dic_mapa, ficheiros, segmento)
+    return _anexados[nome]
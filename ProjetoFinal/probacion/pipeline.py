@@ -0,0 +1,328 @@
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import time
+import instrumentacao
+
+class Etapa:
+    """
+    Uma etapa do pipeline: o módulo cujo main() gera as saídas,
+    os ficheiros que lê (entradas) e os que escreve (saidas).
+    As dependências entre etapas saem das entradas/saídas:
+    uma etapa que lê a saída de outra só corre depois dela.
+    `codigo` são ficheiros .py partilhados de que a etapa depende (além
+    do próprio módulo) e `parametros` tudo o resto que muda o resultado;
+    ambos entram no hash usado para saltar etapas sem alterações.
+    `indices` são saídas que listam (em JSON, relativos à sua pasta) outros
+    ficheiros gerados cujo número só se sabe ao correr, como as páginas de
+    um relatório paginado: os ficheiros listados contam também como saídas.
+    """
+    def __init__(self, nome, modulo, entradas, saidas, codigo=(), parametros=None, indices=()):
+        self.nome = nome
+        self.modulo = modulo
+        self.entradas = list(entradas)
+        self.saidas = list(saidas)
+        self.codigo = list(codigo)
+        self.parametros = parametros or {}
+        self.indices = list(indices)
+
+    def __repr__(self):
+        return f"Etapa({self.nome})"
+
+class Manifesto:
+    """
+    Regista, para cada etapa, o hash das suas entradas, código e parâmetros
+    na última vez que correu com sucesso (como o make, mas por conteúdo).
+    Uma etapa cujo hash não mudou e cujas saídas existem pode ser saltada.
+    Os hashes dos ficheiros ficam guardados por (tamanho, mtime) para que
+    ficheiros não alterados não sejam lidos outra vez.
+    """
+    def __init__(self, caminho):
+        self.caminho = caminho
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+        except (OSError, ValueError):
+            dados = {}
+        self.etapas = dados.get("etapas", {})
+        self.ficheiros = dados.get("ficheiros", {})
+
+    def hash_ficheiro(self, ficheiro):
+        chave = os.path.abspath(ficheiro)
+        try:
+            st = os.stat(chave)
+        except FileNotFoundError:
+            return "ausente"
+
+        guardado = self.ficheiros.get(chave)
+        if guardado and guardado[0] == st.st_size and guardado[1] == st.st_mtime_ns:
+            return guardado[2]
+
+        h = hashlib.sha256()
+        with open(chave, "rb") as f:
+            for bloco in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloco)
+        self.ficheiros[chave] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def assinatura(self, etapa):
+        h = hashlib.sha256()
+        h.update(json.dumps([etapa.nome, etapa.modulo, etapa.parametros], sort_keys=True).encode("utf-8"))
+        origem = importlib.util.find_spec(etapa.modulo).origin
+        for ficheiro in etapa.entradas + [origem] + etapa.codigo:
+            h.update(os.path.abspath(ficheiro).encode("utf-8"))
+            h.update(self.hash_ficheiro(ficheiro).encode("ascii"))
+        return h.hexdigest()
+
+    def atualizada(self, etapa, assinatura):
+        return self.etapas.get(etapa.nome) == assinatura and saidas_existem(etapa)
+
+    def registar(self, etapa, assinatura):
+        self.etapas[etapa.nome] = assinatura
+
+    def esquecer(self, etapa):
+        self.etapas.pop(etapa.nome, None)
+
+    def gravar(self):
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        temporario = f"{self.caminho}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"etapas": self.etapas, "ficheiros": self.ficheiros}, f, indent=1)
+        os.replace(temporario, self.caminho)
+
+def _listados(indice):
+    #ficheiros listados num índice de saídas (None se não existe ou não se lê)
+    try:
+        with open(indice, "r", encoding="utf-8") as f:
+            nomes = json.load(f)
+    except (OSError, ValueError):
+        return None
+    pasta = os.path.dirname(indice)
+    return [os.path.join(pasta, nome) for nome in nomes]
+
+def saidas_existem(etapa):
+    """
+    Todas as saídas da etapa existem, incluindo os ficheiros listados nos índices.
+    """
+    if not all(os.path.exists(s) for s in etapa.saidas):
+        return False
+    for indice in etapa.indices:
+        listados = _listados(indice)
+        if listados is None or not all(os.path.exists(f) for f in listados):
+            return False
+    return True
+
+def dependencias(etapas):
+    """
+    Devolve {nome: conjunto de etapas de que depende}.
+    """
+    produtor = {}
+    for etapa in etapas:
+        for saida in etapa.saidas:
+            produtor[os.path.abspath(saida)] = etapa.nome
+
+    deps = {}
+    for etapa in etapas:
+        deps[etapa.nome] = {produtor[os.path.abspath(e)] for e in etapa.entradas
+                            if os.path.abspath(e) in produtor} - {etapa.nome}
+    return deps
+
+def ordenar(etapas, deps):
+    """
+    Ordem topológica das etapas (mantém a ordem declarada entre etapas independentes).
+    Levanta ValueError se houver um ciclo.
+    """
+    ordem = []
+    feitas = set()
+    por_fazer = list(etapas)
+    while por_fazer:
+        prontas = [e for e in por_fazer if deps[e.nome] <= feitas]
+        if not prontas:
+            raise ValueError(f"ciclo entre etapas: {', '.join(e.nome for e in por_fazer)}")
+        for etapa in prontas:
+            por_fazer.remove(etapa)
+            feitas.add(etapa.nome)
+            ordem.append(etapa)
+    return ordem
+
+def selecionar(etapas, nomes):
+    """
+    Escolhe as etapas pedidas e junta as etapas de que dependem
+    cujas saídas ainda não existem (sem elas a saída ficaria incompleta).
+    """
+    por_nome = {etapa.nome: etapa for etapa in etapas}
+    desconhecidas = [n for n in nomes if n not in por_nome]
+    if desconhecidas:
+        raise ValueError(f"etapa(s) desconhecida(s): {', '.join(desconhecidas)}")
+
+    deps = dependencias(etapas)
+    escolhidas = set()
+    pendentes = list(nomes)
+    while pendentes:
+        nome = pendentes.pop()
+        if nome in escolhidas:
+            continue
+        escolhidas.add(nome)
+        for dep in deps[nome]:
+            if not saidas_existem(por_nome[dep]):
+                pendentes.append(dep)
+
+    return [etapa for etapa in etapas if etapa.nome in escolhidas]
+
+def a_correr(etapas, manifesto=None, forcar=False):
+    """
+    Etapas que executar() vai correr: as que não estão atualizadas no
+    manifesto e as que dependem delas (a saída de uma dependência que corre
+    pode mudar). Só lê os hashes já guardados dos ficheiros não alterados.
+    """
+    if manifesto is None or forcar:
+        return list(etapas)
+    nomes = {etapa.nome for etapa in etapas}
+    deps = {nome: d & nomes for nome, d in dependencias(etapas).items()}
+    correm = set()
+    for etapa in ordenar(etapas, deps):
+        if deps[etapa.nome] & correm or not manifesto.atualizada(etapa, manifesto.assinatura(etapa)):
+            correm.add(etapa.nome)
+    return [etapa for etapa in etapas if etapa.nome in correm]
+
+def _executar_etapa(modulo):
+    """
+    Importa o módulo e corre o seu main() (num processo do pool ou no próprio processo).
+    Devolve (tempo da importação, tempo total, estado devolvido pelo main()).
+    A importação só pesa na primeira etapa de cada processo que traz numpy/matplotlib.
+    O total só mede tempos: o tracemalloc fica nas etapas internas do relatório.
+    """
+    inicio = time.perf_counter()
+    mod = importlib.import_module(modulo)
+    importacao = time.perf_counter() - inicio
+    with instrumentacao.perfil(modulo), instrumentacao.medir(modulo, "total", memoria=False):
+        estado = mod.main()
+    return importacao, time.perf_counter() - inicio, estado
+
+def _estado_saidas(etapa):
+    #(inode, mtime em ns) de cada saída antes de a etapa correr (None se não existe)
+    estado = {}
+    for saida in etapa.saidas:
+        try:
+            st = os.stat(saida)
+            estado[saida] = (st.st_ino, st.st_mtime_ns)
+        except FileNotFoundError:
+            estado[saida] = None
+    return estado
+
+def _verificar_saidas(etapa, antes):
+    """
+    Uma saída que não existe ou que ficou igual ao que era antes da etapa
+    (mesmo inode e mesmo mtime) não foi (re)escrita: conta como falha.
+    Os ficheiros listados nos índices têm de existir.
+    """
+    depois = _estado_saidas(etapa)
+    for saida in etapa.saidas:
+        if depois[saida] is None or depois[saida] == antes.get(saida):
+            raise RuntimeError(f"{etapa.nome} não gerou {saida}")
+    for indice in etapa.indices:
+        for ficheiro in _listados(indice) or [indice]:
+            if not os.path.exists(ficheiro):
+                raise RuntimeError(f"{etapa.nome} não gerou {ficheiro}")
+
+def executar(etapas, jobs=None, manifesto=None, forcar=False, importacoes=None):
+    """
+    Corre as etapas respeitando as dependências. As que não dependem
+    umas das outras correm ao mesmo tempo num pool de `jobs` processos
+    (jobs=1 corre tudo em sequência no próprio processo).
+    Com um Manifesto, as etapas sem alterações desde a última execução
+    são saltadas (tempo None no resultado), a não ser com forcar=True.
+    Devolve {nome: tempo em segundos} das etapas concluídas e
+    levanta RuntimeError se alguma falhar (as dependentes não correm).
+    Se `importacoes` for um dict, recebe {nome: tempo de importação do módulo}.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    deps = dependencias(etapas)
+    nomes = {etapa.nome for etapa in etapas}
+    #dependências fora da seleção já estão feitas (as saídas existem)
+    deps = {nome: d & nomes for nome, d in deps.items()}
+
+    por_fazer = ordenar(etapas, deps)
+    feitas = {}
+    falhadas = {}
+    assinaturas = {}
+
+    def saltar(etapa):
+        #a assinatura só é calculada quando as dependências já correram
+        if manifesto is None:
+            return False
+        assinaturas[etapa.nome] = manifesto.assinatura(etapa)
+        if not forcar and manifesto.atualizada(etapa, assinaturas[etapa.nome]):
+            feitas[etapa.nome] = None
+            return True
+        return False
+
+    def correu(etapa, antes, obter_resultado):
+        try:
+            importacao, feitas[etapa.nome], estado = obter_resultado()
+            if importacoes is not None:
+                importacoes[etapa.nome] = importacao
+            if estado:
+                raise RuntimeError(f"{etapa.nome} terminou com erro (estado {estado})")
+            _verificar_saidas(etapa, antes)
+            #só um sucesso declarado (main() devolveu 0) fica no manifesto;
+            #sem estado a etapa conta como feita, mas corre outra vez da próxima
+            if manifesto is not None:
+                if estado == 0:
+                    manifesto.registar(etapa, assinaturas[etapa.nome])
+                else:
+                    manifesto.esquecer(etapa)
+        except Exception as e:
+            feitas.pop(etapa.nome, None)
+            falhadas[etapa.nome] = e
+            if manifesto is not None:
+                manifesto.esquecer(etapa)
+
+    try:
+        _correr(por_fazer, deps, jobs, feitas, falhadas, saltar, correu)
+    finally:
+        if manifesto is not None:
+            manifesto.gravar()
+
+    if falhadas:
+        detalhe = "; ".join(f"{nome}: {erro}" for nome, erro in falhadas.items())
+        raise RuntimeError(f"etapas falhadas: {detalhe}")
+    return feitas
+
+def _correr(por_fazer, deps, jobs, feitas, falhadas, saltar, correu):
+    """
+    Percorre as etapas (já em ordem topológica), em sequência ou no pool.
+    """
+    if jobs <= 1:
+        for etapa in por_fazer:
+            if deps[etapa.nome] & falhadas.keys():
+                falhadas[etapa.nome] = "dependência falhou"
+            elif not saltar(etapa):
+                correu(etapa, _estado_saidas(etapa), lambda: _executar_etapa(etapa.modulo))
+    else:
+        #o pool (e o multiprocessing) só é importado quando há mais de um processo
+        from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            a_correr = {}
+            while por_fazer or a_correr:
+                for etapa in list(por_fazer):
+                    if deps[etapa.nome] & falhadas.keys():
+                        por_fazer.remove(etapa)
+                        falhadas[etapa.nome] = "dependência falhou"
+                    elif deps[etapa.nome] <= feitas.keys():
+                        por_fazer.remove(etapa)
+                        if not saltar(etapa):
+                            antes = _estado_saidas(etapa)
+                            futuro = pool.submit(_executar_etapa, etapa.modulo)
+                            a_correr[futuro] = (etapa, antes)
+
+                if not a_correr:
+                    continue
+                concluidos, _ = wait(a_correr, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    etapa, antes = a_correr.pop(futuro)
+                    correu(etapa, antes, futuro.result)
@@ -0,0 +1,462 @@
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from caminhos import ler_janela
+import funciones
+from funciones import (carregar_comunidades, carregar_relacao, carregar_poblacion, procurar_ccaa,
+                       file_csv, file_comunidades, file_relacao, cod_nacional)
+import R1
+import R2
+import R3
+import R4
+import R5
+
+#servidor dos relatórios: lê o CSV e as tabelas de códigos uma vez e mantém-nos
+#em memória; cada página ou gráfico é gerado quando é pedido (com filtros de
+#anos e CCAA) e guardado numa cache LRU com ETag e gzip. A cache é esquecida
+#quando algum ficheiro de entradas muda
+
+#páginas servidas: rota -> (relatorio, tipo de conteúdo)
+ROTAS = {
+    "/R1": ("R1", "text/html; charset=utf-8"),
+    "/R2": ("R2", "text/html; charset=utf-8"),
+    "/R3.png": ("R3", "image/png"),
+    "/R4": ("R4", "text/html; charset=utf-8"),
+    "/R5.png": ("R5", "image/png"),
+    #os HTML do R2 e do R4 incluem os gráficos por "../imagenes/..."
+    "/imagenes/R3.png": ("R3", "image/png"),
+    "/imagenes/R5.png": ("R5", "image/png"),
+}
+
+#respostas mais pequenas do que isto não compensa comprimir
+MIN_GZIP = 1024
+
+class ErroPedido(Exception):
+    """
+    Pedido inválido: `estado` é o código HTTP a devolver.
+    """
+    def __init__(self, estado, mensagem):
+        super().__init__(mensagem)
+        self.estado = estado
+
+class Entradas:
+    """
+    O CSV e as tabelas de códigos residentes em memória. `atuais()` confirma
+    (no máximo uma vez por `intervalo` segundos) se algum ficheiro mudou de
+    tamanho ou mtime e, se sim, volta a carregá-los e incrementa `versao`.
+    """
+    def __init__(self, ficheiros=(file_csv, file_comunidades, file_relacao), intervalo=1.0):
+        self.ficheiros = list(ficheiros)
+        self.intervalo = intervalo
+        self.versao = 0
+        self._assinatura = None
+        self._verificado = 0.0
+        self._trinco = threading.Lock()
+        self._estado = None
+
+    def _assinatura_atual(self):
+        assinatura = []
+        for ficheiro in self.ficheiros:
+            st = os.stat(ficheiro)
+            assinatura.append((ficheiro, st.st_size, st.st_mtime_ns))
+        return tuple(assinatura)
+
+    def _carregar(self):
+        #esquecer o que já foi lido neste processo; a cache em disco decide se relê
+        funciones._entradas_lidas.clear()
+        csv, comunidades, relacao = self.ficheiros
+        dic_ccaa = carregar_comunidades(comunidades)
+        dic_mapa = carregar_relacao(relacao)
+        dados = carregar_poblacion(csv)
+        self._estado = (dados, dic_ccaa, dic_mapa)
+
+    def atuais(self):
+        """
+        Devolve (versao, dados, dic_ccaa, dic_mapa).
+        """
+        with self._trinco:
+            agora = time.monotonic()
+            if self._estado is None or agora - self._verificado >= self.intervalo:
+                assinatura = self._assinatura_atual()
+                if assinatura != self._assinatura:
+                    inicio = time.perf_counter()
+                    self._carregar()
+                    self._assinatura = assinatura
+                    self.versao += 1
+                    print(f"entradas carregadas (versão {self.versao}) em {time.perf_counter() - inicio:.2f} s")
+                self._verificado = agora
+            return (self.versao,) + self._estado
+
+class Resposta:
+    """
+    Corpo de uma resposta já gerada, com o ETag (hash do conteúdo)
+    e a versão comprimida com gzip quando compensa.
+    """
+    def __init__(self, corpo, tipo):
+        self.corpo = corpo
+        self.tipo = tipo
+        self.etag = '"' + hashlib.blake2b(corpo, digest_size=12).hexdigest() + '"'
+        #o PNG já vem comprimido
+        self.gzip = None
+        if len(corpo) >= MIN_GZIP and not tipo.startswith("image/"):
+            self.gzip = gzip.compress(corpo, compresslevel=6)
+
+    def tamanho(self):
+        return len(self.corpo) + (len(self.gzip) if self.gzip is not None else 0)
+
+class CacheRespostas:
+    """
+    Cache LRU das respostas, limitada em bytes. Pedidos iguais em simultâneo
+    esperam pela mesma geração em vez de gerarem a página várias vezes.
+    """
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+        self._respostas = OrderedDict()
+        self._trinco = threading.Lock()
+        self._a_gerar = {}
+
+    def obter(self, chave, gerar):
+        """
+        Devolve (Resposta, acertou) para `chave`, chamando `gerar()` se não estiver em cache.
+        """
+        with self._trinco:
+            resposta = self._respostas.get(chave)
+            if resposta is not None:
+                self._respostas.move_to_end(chave)
+                self.acertos += 1
+                return resposta, True
+            trinco_chave = self._a_gerar.setdefault(chave, threading.Lock())
+
+        with trinco_chave:
+            with self._trinco:
+                resposta = self._respostas.get(chave)
+                if resposta is not None:
+                    #outro pedido gerou-a enquanto esperávamos
+                    self._respostas.move_to_end(chave)
+                    self.acertos += 1
+                    return resposta, True
+            try:
+                resposta = gerar()
+                with self._trinco:
+                    self.falhas += 1
+                    self._guardar(chave, resposta)
+            finally:
+                with self._trinco:
+                    self._a_gerar.pop(chave, None)
+            return resposta, False
+
+    def _guardar(self, chave, resposta):
+        if resposta.tamanho() > self.max_bytes:
+            return
+        anterior = self._respostas.pop(chave, None)
+        if anterior is not None:
+            self.bytes -= anterior.tamanho()
+        self._respostas[chave] = resposta
+        self.bytes += resposta.tamanho()
+        while self.bytes > self.max_bytes:
+            _, antiga = self._respostas.popitem(last=False)
+            self.bytes -= antiga.tamanho()
+
+    def limpar(self):
+        with self._trinco:
+            self._respostas.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._respostas)
+
+def ler_filtros(parametros):
+    """
+    Filtros normalizados da query string: (anos, ccaa), com anos um
+    intervalo (inicio, fim) e ccaa um tuplo ordenado de códigos (ou None).
+    """
+    anos = parametros.get("anos", [""])[-1]
+    ccaa = parametros.get("ccaa", [""])[-1]
+    try:
+        anos = ler_janela(anos)
+    except ValueError:
+        raise ErroPedido(400, f"anos inválidos: {anos} (ex: anos=2013-2016)")
+    ccaa = tuple(sorted({c.strip().zfill(2) for c in ccaa.split(",") if c.strip()})) or None
+    return anos, ccaa
+
+def _recortar(dados, dic_ccaa, dic_mapa, anos, ccaa, minimo_anos):
+    #dados só com os anos pedidos e as províncias das CCAA pedidas
+    #(sem o Total Nacional), dic_ccaa só com essas CCAA
+    linhas = escolhidos = None
+    if ccaa is not None:
+        desconhecidas = [c for c in ccaa if c not in dic_ccaa]
+        if desconhecidas:
+            raise ErroPedido(404, f"CCAA desconhecida(s): {', '.join(desconhecidas)}")
+        dic_ccaa = {c: dic_ccaa[c] for c in ccaa}
+        linhas = [i for i, cod in enumerate(dados.codigos.tolist())
+                  if cod != cod_nacional and procurar_ccaa(cod, dic_mapa) in dic_ccaa]
+    if anos is not None:
+        escolhidos = [ano for ano in dados.anos if anos[0] <= ano <= anos[1]]
+        if len(escolhidos) < minimo_anos:
+            raise ErroPedido(400, f"são precisos pelo menos {minimo_anos} ano(s) com dados em {anos[0]}-{anos[1]}")
+    if linhas is not None or escolhidos is not None:
+        dados = dados.recortar(linhas, escolhidos)
+    return dados, dic_ccaa
+
+def _filtros_query(anos, ccaa):
+    #filtros normalizados de volta a query string ("" sem filtros), já escapada para HTML
+    partes = []
+    if anos is not None:
+        partes.append(f"anos={anos[0]}-{anos[1]}")
+    if ccaa is not None:
+        partes.append(f"ccaa={','.join(ccaa)}")
+    return "?" + "&amp;".join(partes) if partes else ""
+
+def etag_corresponde(etag, if_none_match):
+    """
+    If-None-Match: "*" ou uma lista de entity tags separadas por vírgulas,
+    comparadas uma a uma (comparação fraca: W/ é ignorado).
+    """
+    if not if_none_match:
+        return False
+    for candidata in if_none_match.split(","):
+        candidata = candidata.strip()
+        if candidata == "*":
+            return True
+        if candidata.startswith("W/"):
+            candidata = candidata[2:]
+        if candidata == etag:
+            return True
+    return False
+
+def aceita_gzip(accept_encoding):
+    """
+    Accept-Encoding aceita gzip com q>0: "gzip" (ou "x-gzip") com o seu q ou,
+    se não aparece, "*". Sem cabeçalho responde-se sem compressão.
+    """
+    pesos = {}
+    for parte in (accept_encoding or "").split(","):
+        codificacao, *parametros = [p.strip() for p in parte.split(";")]
+        q = 1.0
+        for parametro in parametros:
+            nome, _, valor = parametro.partition("=")
+            if nome.strip().lower() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        if codificacao:
+            pesos[codificacao.lower()] = q
+    for codificacao in ("gzip", "x-gzip", "*"):
+        if codificacao in pesos:
+            return pesos[codificacao] > 0
+    return False
+
+#matplotlib não é seguro entre threads e a figura de graficos.py é partilhada
+_trinco_graficos = threading.Lock()
+
+def gerar(relatorio, dados, dic_ccaa, dic_mapa, anos=None, ccaa=None):
+    """
+    Gera o relatório em memória e devolve o corpo em bytes.
+    """
+    minimo_anos = 2 if relatorio in ("R1", "R4") else 1
+    dados, dic_ccaa = _recortar(dados, dic_ccaa, dic_mapa, anos, ccaa, minimo_anos)
+    #os gráficos incluídos no R2 e no R4 são pedidos com os mesmos filtros
+    filtros = _filtros_query(anos, ccaa)
+
+    if relatorio == "R1":
+        saida = io.StringIO()
+        R1.escrever(dados, *R1.calcular(dados), destino=saida)
+    elif relatorio == "R2":
+        saida = io.StringIO()
+        R2.escrever(dados, dic_ccaa, *R2.agregar(dados, dic_ccaa, dic_mapa), destino=saida,
+                    grafico=f"../imagenes/R3.png{filtros}")
+    elif relatorio == "R4":
+        codigos_ccaa, por_sexo = R4.agregar(dados, dic_ccaa, dic_mapa)
+        saida = io.StringIO()
+        R4.escrever(dados, dic_ccaa, codigos_ccaa, *R4.calcular(por_sexo), destino=saida,
+                    grafico=f"../imagenes/R5.png{filtros}")
+    elif relatorio == "R3":
+        top = R3.calcular(dados, dic_ccaa, R3.agregar(dados, dic_ccaa, dic_mapa))
+        saida = io.BytesIO()
+        with _trinco_graficos:
+            R3.desenhar(dados, *top, destino=saida)
+    elif relatorio == "R5":
+        series = R5.calcular(dados, dic_ccaa, R5.agregar(dados, dic_ccaa, dic_mapa))
+        saida = io.BytesIO()
+        with _trinco_graficos:
+            R5.desenhar(dados, series, destino=saida)
+    else:
+        raise ErroPedido(404, f"relatório desconhecido: {relatorio}")
+
+    corpo = saida.getvalue()
+    return corpo.encode("utf-8") if isinstance(corpo, str) else corpo
+
+class Aplicacao:
+    """
+    Liga as entradas residentes à cache de respostas: cada pedido é
+    identificado por (rota, filtros, versão das entradas).
+    """
+    def __init__(self, entradas=None, cache=None):
+        self.entradas = entradas if entradas is not None else Entradas()
+        self.cache = cache if cache is not None else CacheRespostas()
+        self._versao_cache = None
+
+    def responder(self, url):
+        """
+        Devolve (Resposta, acertou na cache) ou levanta ErroPedido.
+        """
+        partes = urlsplit(url)
+        rota = partes.path.rstrip("/") or "/"
+        if rota.endswith(".html"):
+            rota = rota[:-len(".html")]
+
+        if rota == "/":
+            return Resposta(self._indice().encode("utf-8"), "text/html; charset=utf-8"), False
+        if rota == "/estado":
+            return Resposta(json.dumps(self.estado()).encode("utf-8"), "application/json"), False
+        if rota not in ROTAS:
+            raise ErroPedido(404, f"página desconhecida: {partes.path}")
+
+        relatorio, tipo = ROTAS[rota]
+        anos, ccaa = ler_filtros(parse_qs(partes.query))
+        try:
+            versao, dados, dic_ccaa, dic_mapa = self.entradas.atuais()
+        except FileNotFoundError as e:
+            raise ErroPedido(503, f"ficheiro de entrada em falta: {e}")
+        if versao != self._versao_cache:
+            #entradas novas: as respostas guardadas já não valem
+            self.cache.limpar()
+            self._versao_cache = versao
+
+        chave = (relatorio, anos, ccaa, versao)
+        return self.cache.obter(chave, lambda: Resposta(gerar(relatorio, dados, dic_ccaa, dic_mapa, anos, ccaa), tipo))
+
+    def estado(self):
+        return {
+            "versao": self.entradas.versao,
+            "respostas_em_cache": len(self.cache),
+            "bytes_em_cache": self.cache.bytes,
+            "acertos": self.cache.acertos,
+            "falhas": self.cache.falhas,
+        }
+
+    def _indice(self):
+        ligacoes = "".join(f"<li><a href='{rota}'>{relatorio}</a></li>"
+                           for rota, (relatorio, _) in ROTAS.items() if not rota.startswith("/imagenes"))
+        return ("<!DOCTYPE html><html lang='es'><head><meta charset='UTF-8'><title>Relatórios</title></head>"
+                f"<body><h2>Relatórios de população</h2><ul>{ligacoes}</ul>"
+                "<p>Filtros: <code>?anos=2013-2016&amp;ccaa=01,13</code></p></body></html>")
+
+class PedidoRelatorio(BaseHTTPRequestHandler):
+    """
+    GET/HEAD com ETag (If-None-Match -> 304) e gzip (Accept-Encoding).
+    HTTP/1.1 para os clientes poderem reutilizar a ligação.
+    """
+    protocol_version = "HTTP/1.1"
+    server_version = "probacion/1.0"
+
+    def do_GET(self):
+        self._responder(com_corpo=True)
+
+    def do_HEAD(self):
+        self._responder(com_corpo=False)
+
+    def _responder(self, com_corpo):
+        inicio = time.perf_counter()
+        try:
+            resposta, acertou = self.server.aplicacao.responder(self.path)
+        except ErroPedido as e:
+            self._erro(e.estado, str(e), com_corpo)
+            return
+        except Exception as e:
+            self._erro(500, f"{type(e).__name__}: {e}", com_corpo)
+            return
+
+        if etag_corresponde(resposta.etag, self.headers.get("If-None-Match")):
+            self.send_response(304)
+            self.send_header("ETag", resposta.etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        corpo = resposta.corpo
+        comprimido = resposta.gzip is not None and aceita_gzip(self.headers.get("Accept-Encoding"))
+        if comprimido:
+            corpo = resposta.gzip
+
+        self.send_response(200)
+        self.send_header("Content-Type", resposta.tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.send_header("ETag", resposta.etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if comprimido:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("X-Cache", "HIT" if acertou else "MISS")
+        self.send_header("Server-Timing", f"gerar;dur={(time.perf_counter() - inicio) * 1000:.1f}")
+        self.end_headers()
+        if com_corpo:
+            self.wfile.write(corpo)
+
+    def _erro(self, estado, mensagem, com_corpo):
+        corpo = f"ERRO: {mensagem}\n".encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        if com_corpo:
+            self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        if not self.server.silencioso:
+            super().log_message(formato, *args)
+
+def criar_servidor(host="127.0.0.1", porta=8000, aplicacao=None, silencioso=False):
+    """
+    Servidor com uma thread por ligação. Com porta=0 o sistema escolhe
+    uma porta livre (ver servidor.server_address), útil para testes locais.
+    """
+    servidor = ThreadingHTTPServer((host, porta), PedidoRelatorio)
+    servidor.daemon_threads = True
+    servidor.aplicacao = aplicacao if aplicacao is not None else Aplicacao()
+    servidor.silencioso = silencioso
+    return servidor
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve os relatórios R1-R5 a partir dos dados em memória.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8000)
+    parser.add_argument("--cache-mb", type=int, default=64, help="tamanho máximo da cache de respostas")
+    parser.add_argument("--intervalo", type=float, default=1.0,
+                        help="segundos entre verificações de alterações em 'entradas'")
+    parser.add_argument("--silencioso", action="store_true", help="não regista cada pedido")
+    args = parser.parse_args(argv)
+
+    aplicacao = Aplicacao(Entradas(intervalo=args.intervalo), CacheRespostas(args.cache_mb << 20))
+    try:
+        #carregar já, para o primeiro pedido não pagar a leitura do CSV
+        aplicacao.entradas.atuais()
+    except FileNotFoundError as e:
+        print(f"ERRO: ficheiro de entrada em falta: {e}")
+        return
+
+    servidor = criar_servidor(args.host, args.porta, aplicacao, args.silencioso)
+    host, porta = servidor.server_address[:2]
+    print(f"A servir os relatórios em http://{host}:{porta}/ (Ctrl+C para parar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import os
+import numpy as np
+
+#gera dados no formato dos ficheiros do INE (CSV de população por sexo e ano
+#e as duas páginas HTML de códigos) para testar o desempenho em qualquer escala
+
+#escalas predefinidas: (regiões, anos)
+ESCALAS = {
+    "provincias": (52, 8),
+    "comarcas": (1000, 15),
+    "municipios": (8131, 25),
+}
+
+#número de comunidades autónomas (como no INE)
+N_CCAA = 19
+
+def _notacao_e(valor):
+    """
+    Escreve um inteiro grande como o INE ("46572132" -> "4.6572132E7").
+    """
+    digitos = str(valor)
+    mantissa = digitos[1:].rstrip("0") or "0"
+    return f"{digitos[0]}.{mantissa}E{len(digitos) - 1}"
+
+def _celula(valor):
+    #o INE usa notação científica a partir de 10 milhões
+    return _notacao_e(valor) if valor >= 10_000_000 else f"{valor}.0"
+
+def gerar_matriz(n_regioes, n_anos, semente=0):
+    """
+    Devolve (total, homens, mulheres), arrays int64 (regiões x anos),
+    com o ano mais recente primeiro e Total = Homens + Mulheres.
+    """
+    rng = np.random.default_rng(semente)
+    #população do ano mais antigo e crescimento anual de cada região
+    base = rng.lognormal(mean=9.0, sigma=1.5, size=n_regioes).astype(np.int64) + 100
+    crescimento = rng.normal(1.0, 0.01, size=(n_regioes, n_anos))
+    crescimento[:, 0] = 1.0
+    cronologico = (base[:, None] * np.cumprod(crescimento, axis=1)).astype(np.int64)
+
+    quota_homens = rng.uniform(0.47, 0.51, size=(n_regioes, 1))
+    homens = (cronologico * quota_homens).astype(np.int64)
+    mulheres = cronologico - homens
+
+    #colunas do mais recente para o mais antigo, como no CSV
+    return cronologico[:, ::-1], homens[:, ::-1], mulheres[:, ::-1]
+
+def escrever_csv(ficheiro, codigos, nomes, anos, total, homens, mulheres, semente=0):
+    """
+    Grava o CSV no formato do INE: títulos, as duas linhas de cabeçalho,
+    o Total Nacional, as regiões (por ordem de nome, não de código) e as notas.
+    """
+    n_anos = len(anos)
+    blocos = [("Total", total), ("Hombres", homens), ("Mujeres", mulheres)]
+    ordem = np.random.default_rng(semente + 1).permutation(len(codigos))
+
+    with open(ficheiro, "w", encoding="utf-8", newline="") as f:
+        f.write("Cifras Oficiales de Población de los Municipios Españoles: Revisión del Padrón Municipal\r\n")
+        f.write("Resumen por provincias\r\n")
+        f.write("Población por provincias y sexo.\r\n")
+        f.write("Unidades: Personas\r\n")
+        f.write(";" + "".join(sexo + ";" * n_anos for sexo, _ in blocos) + "\r\n")
+        f.write(";" + "".join(f"{ano};" for _ in blocos for ano in anos) + "\r\n")
+
+        nacional = [_celula(int(v)) for _, matriz in blocos for v in matriz.sum(axis=0)]
+        f.write("Total Nacional;" + ";".join(nacional) + ";\r\n")
+
+        celulas = np.hstack([matriz for _, matriz in blocos])
+        for i in ordem:
+            valores = ";".join(_celula(int(v)) for v in celulas[i])
+            f.write(f"{codigos[i]} {nomes[i]};{valores};\r\n")
+
+        f.write("Notas:\r\n")
+        f.write("Datos sintéticos generados para pruebas de rendimiento.\r\n")
+        f.write("Fuente: Instituto Nacional de Estadística (formato)\r\n")
+
+def _pagina_tabela(titulo, cabecalho, linhas):
+    cabecalho_html = "".join(f"<th>{c}</th>" for c in cabecalho)
+    corpo = "\n".join("<tr>" + "".join(f"<td>{c}</td>" for c in linha) + "</tr>" for linha in linhas)
+    return (f"<html><head><meta charset=\"utf-8\"><title>{titulo}</title></head><body>\n"
+            f"<table>\n<tr>{cabecalho_html}</tr>\n{corpo}\n</table>\n</body></html>\n")
+
+def escrever_comunidades(ficheiro, codigos_ccaa, nomes_ccaa):
+    with open(ficheiro, "w", encoding="utf-8") as f:
+        f.write(_pagina_tabela("Comunidades autónomas", ["Código", "Literal"],
+                               zip(codigos_ccaa, nomes_ccaa)))
+
+def escrever_relacao(ficheiro, codigos, nomes, grupo, codigos_ccaa, nomes_ccaa):
+    linhas = [(codigos_ccaa[g], nomes_ccaa[g], cod, nome) for cod, nome, g in zip(codigos, nomes, grupo)]
+    with open(ficheiro, "w", encoding="utf-8") as f:
+        f.write(_pagina_tabela("Relación de comunidades autónomas y provincias",
+                               ["CODAUTO", "Comunidad Autónoma", "CPRO", "Provincia"], linhas))
+
+def gerar_dados(pasta, n_regioes, n_anos, ano_final=2017, semente=0):
+    """
+    Gera em `pasta` um CSV de população com `n_regioes` regiões e `n_anos` anos
+    (até `ano_final`) e as páginas de CCAA e de relação região -> CCAA.
+    Devolve {"csv": ..., "comunidades": ..., "relacao": ...} com os caminhos.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    largura = max(2, len(str(n_regioes)))
+    codigos = [str(i + 1).zfill(largura) for i in range(n_regioes)]
+    nomes = [f"Región {cod}" for cod in codigos]
+    anos = list(range(ano_final, ano_final - n_anos, -1))
+
+    codigos_ccaa = [str(i + 1).zfill(2) for i in range(N_CCAA)]
+    nomes_ccaa = [f"Comunidad {cod}" for cod in codigos_ccaa]
+    grupo = np.random.default_rng(semente + 2).integers(0, N_CCAA, size=n_regioes)
+
+    total, homens, mulheres = gerar_matriz(n_regioes, n_anos, semente)
+
+    ficheiros = {
+        "csv": os.path.join(pasta, f"poblacion-{n_regioes}x{n_anos}.csv"),
+        "comunidades": os.path.join(pasta, "comunidadesAutonomas.htm"),
+        "relacao": os.path.join(pasta, f"comunidadAutonoma-Region-{n_regioes}.htm"),
+    }
+    escrever_csv(ficheiros["csv"], codigos, nomes, anos, total, homens, mulheres, semente)
+    escrever_comunidades(ficheiros["comunidades"], codigos_ccaa, nomes_ccaa)
+    escrever_relacao(ficheiros["relacao"], codigos, nomes, grupo, codigos_ccaa, nomes_ccaa)
+    return ficheiros
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos no formato do INE.")
+    parser.add_argument("pasta", help="pasta onde gravar os ficheiros")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="provincias")
+    parser.add_argument("--regioes", type=int, default=None, help="número de regiões (substitui a escala)")
+    parser.add_argument("--anos", type=int, default=None, help="número de anos (substitui a escala)")
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    n_regioes, n_anos = ESCALAS[args.escala]
+    ficheiros = gerar_dados(args.pasta, args.regioes or n_regioes, args.anos or n_anos, semente=args.semente)
+    for tipo, ficheiro in ficheiros.items():
+        print(f"{tipo}: {ficheiro}")
+
+if __name__ == "__main__":
+    main()
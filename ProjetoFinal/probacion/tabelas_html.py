@@ -0,0 +1,137 @@
+import codecs
+import re
+from html.parser import HTMLParser
+
+#tamanho dos blocos lidos do ficheiro (o primeiro também serve para detetar o charset)
+TAMANHO_BLOCO = 64 * 1024
+
+_re_meta_charset = re.compile(rb"<meta[^>]*?charset\s*=\s*[\"']?\s*([A-Za-z0-9_.:-]+)", re.I)
+
+_boms = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+def detetar_codificacao(inicio):
+    """
+    Decide a codificação a partir dos primeiros bytes do documento:
+    BOM, depois a tag <meta charset> e, por fim, se os bytes são UTF-8 válido.
+    Os ficheiros do INE sem indicação são latin-1.
+    """
+    for bom, nome in _boms:
+        if inicio.startswith(bom):
+            return nome
+
+    m = _re_meta_charset.search(inicio)
+    if m:
+        nome = m.group(1).decode("ascii").lower()
+        try:
+            return codecs.lookup(nome).name
+        except LookupError:
+            pass
+
+    try:
+        inicio.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        #um carácter multibyte cortado no fim do bloco não conta como erro
+        if e.start >= len(inicio) - 3 and e.reason == "unexpected end of data":
+            return "utf-8"
+        return "latin-1"
+
+class _ExtratorTabelas(HTMLParser):
+    """
+    Percorre o HTML uma vez e guarda em `linhas` cada <tr> terminado,
+    como (numero_da_tabela, [texto das células]).
+    As tabelas são numeradas pela ordem em que abrem (0, 1, ...).
+    """
+    def __init__(self, incluir_th=False):
+        super().__init__(convert_charrefs=True)
+        self.celulas_aceites = ("td", "th") if incluir_th else ("td",)
+        self.linhas = []
+        self._tabelas = [] #pilha de tabelas abertas (para tabelas encaixadas)
+        self._n_tabelas = 0
+        self._linha = None
+        self._celula = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            self._tabelas.append(self._n_tabelas)
+            self._n_tabelas += 1
+        elif tag == "tr":
+            self._fechar_linha()
+            self._linha = []
+        elif tag in ("td", "th"):
+            self._fechar_celula()
+            if self._linha is None:
+                self._linha = []
+            self._celula = [] if tag in self.celulas_aceites else None
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th"):
+            self._fechar_celula()
+        elif tag == "tr":
+            self._fechar_linha()
+        elif tag == "table":
+            self._fechar_linha()
+            if self._tabelas:
+                self._tabelas.pop()
+
+    def handle_data(self, data):
+        if self._celula is not None:
+            self._celula.append(data.strip())
+
+    def _fechar_celula(self):
+        if self._celula is not None and self._linha is not None:
+            self._linha.append("".join(self._celula))
+        self._celula = None
+
+    def _fechar_linha(self):
+        self._fechar_celula()
+        if self._linha:
+            tabela = self._tabelas[-1] if self._tabelas else -1
+            self.linhas.append((tabela, self._linha))
+        self._linha = None
+
+    def close(self):
+        super().close()
+        self._fechar_linha()
+
+def ler_linhas(ficheiro, tabelas=None, incluir_th=False):
+    """
+    Gerador que lê o HTML por blocos e devolve (numero_tabela, celulas)
+    para cada linha de tabela, à medida que vão sendo encontradas.
+    `tabelas` limita a saída a um conjunto de números de tabela.
+    Por omissão só as células <td> são devolvidas (como o get_text(strip=True)).
+    """
+    extrator = _ExtratorTabelas(incluir_th)
+
+    with open(ficheiro, "rb") as f:
+        bloco = f.read(TAMANHO_BLOCO)
+        descodificador = codecs.getincrementaldecoder(detetar_codificacao(bloco))(errors="replace")
+
+        while bloco:
+            extrator.feed(descodificador.decode(bloco))
+            yield from _despejar(extrator, tabelas)
+            bloco = f.read(TAMANHO_BLOCO)
+
+        extrator.feed(descodificador.decode(b"", final=True))
+        extrator.close()
+        yield from _despejar(extrator, tabelas)
+
+def _despejar(extrator, tabelas):
+    linhas, extrator.linhas = extrator.linhas, []
+    for tabela, celulas in linhas:
+        if tabelas is None or tabela in tabelas:
+            yield tabela, celulas
+
+def ler_tabelas(ficheiro, incluir_th=False):
+    """
+    Lê todas as tabelas do documento de uma vez.
+    Devolve {numero_tabela: [linhas]}, cada linha uma lista de textos.
+    """
+    resultado = {}
+    for tabela, celulas in ler_linhas(ficheiro, incluir_th=incluir_th):
+        resultado.setdefault(tabela, []).append(celulas)
+    return resultado
@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+import pytest
+
+#os módulos do probacion são importados como nos scripts, a partir da sua pasta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#nunca usar a cache do projeto nem herdar as variáveis dos relatórios
+os.environ["PTC_CACHE_DIR"] = tempfile.mkdtemp(prefix="ptc-testes-")
+for _variavel in ("PTC_SEM_CACHE", "PTC_EXPORTAR", "PTC_HTML", "PTC_HTML_LINHAS", "PTC_HISTORICO",
+                  "PTC_ANOS", "PTC_PARTILHADO", "PTC_TRACE", "PTC_PERFIL"):
+    os.environ.pop(_variavel, None)
+
+CABECALHO = ("Cifras Oficiales de Población de los Municipios Españoles: Revisión del Padrón Municipal\n"
+             "Unidades: Personas\n"
+             ";Total;;;Hombres;;;Mujeres;;;\n"
+             ";2017;2016;2015;2017;2016;2015;2017;2016;2015;\n")
+
+def escrever_csv(ficheiro, linhas):
+    """
+    CSV no formato do INE com 3 anos por sexo; `linhas` são (rótulo, [9 células]).
+    """
+    with open(ficheiro, "w", encoding="utf-8") as f:
+        f.write(CABECALHO)
+        for rotulo, celulas in linhas:
+            f.write(f"{rotulo};{';'.join(celulas)};\n")
+        f.write("\nNotas:\n1) Fuente: INE\n")
+    return str(ficheiro)
+
+@pytest.fixture
+def csv_pequeno(tmp_path):
+    #valores como o INE os publica: decimais com ".0" e notação científica
+    return escrever_csv(tmp_path / "poblacion.csv", [
+        ("Total Nacional", ["4.6572132E7", "4.6557008E7", "4.6624382E7",
+                            "2.2832861E7", "2.284361E7", "2.2890383E7",
+                            "2.3739271E7", "2.3713398E7", "2.3733999E7"]),
+        ("02 Albacete", ["390032.0", "392118.0", "394580.0", "194743.0", "195841.0", "197014.0",
+                         "195289.0", "196277.0", "197566.0"]),
+        ("28 Madrid", ["6507184.0", "6466996.0", "6436996.0", "3115522.0", "3098631.0", "3087022.0",
+                       "3391662.0", "3368365.0", "3349974.0"]),
+    ])
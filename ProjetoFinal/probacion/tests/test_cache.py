@@ -0,0 +1,87 @@
+import os
+import pytest
+import cache
+import funciones
+from funciones import ler_poblacion, _poblacion_para_arrays, _arrays_para_poblacion
+
+@pytest.fixture
+def pasta_cache(tmp_path, monkeypatch):
+    pasta = tmp_path / "cache"
+    monkeypatch.setattr(cache, "pasta_cache", str(pasta))
+    return pasta
+
+class Leitor:
+    #conta as vezes que o CSV é mesmo lido
+    def __init__(self):
+        self.leituras = 0
+
+    def __call__(self, ficheiro):
+        self.leituras += 1
+        return ler_poblacion(ficheiro)
+
+def obter(ficheiro, leitor, usar_cache=True):
+    return cache.obter(ficheiro, "poblacion", leitor, _poblacion_para_arrays, _arrays_para_poblacion, usar_cache)
+
+def test_segunda_leitura_vem_da_cache(csv_pequeno, pasta_cache):
+    leitor = Leitor()
+    primeira = obter(csv_pequeno, leitor)
+    segunda = obter(csv_pequeno, leitor)
+    assert leitor.leituras == 1
+    assert (segunda.matriz == primeira.matriz).all()
+    assert segunda.codigos.tolist() == primeira.codigos.tolist()
+    assert segunda.anos == primeira.anos
+
+def test_conteudo_alterado_invalida(csv_pequeno, pasta_cache):
+    leitor = Leitor()
+    obter(csv_pequeno, leitor)
+    with open(csv_pequeno, encoding="utf-8") as f:
+        texto = f.read()
+    #mesmo tamanho, outro valor
+    with open(csv_pequeno, "w", encoding="utf-8") as f:
+        f.write(texto.replace("390032.0", "390033.0"))
+    dados = obter(csv_pequeno, leitor)
+    assert leitor.leituras == 2
+    assert dados.linha("02")[0] == 390033
+
+def test_so_mtime_alterado_compara_o_hash(csv_pequeno, pasta_cache, monkeypatch):
+    leitor = Leitor()
+    obter(csv_pequeno, leitor)
+    st = os.stat(csv_pequeno)
+    os.utime(csv_pequeno, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    hashes = []
+    original = cache.hash_ficheiro
+    monkeypatch.setattr(cache, "hash_ficheiro", lambda f: hashes.append(f) or original(f))
+    obter(csv_pequeno, leitor)
+    assert leitor.leituras == 1
+    #o mtime novo fica guardado: a leitura seguinte já não calcula o hash
+    hashes.clear()
+    obter(csv_pequeno, leitor)
+    assert leitor.leituras == 1
+    assert hashes == []
+
+def test_versao_diferente_invalida(csv_pequeno, pasta_cache, monkeypatch):
+    leitor = Leitor()
+    obter(csv_pequeno, leitor)
+    monkeypatch.setattr(cache, "VERSAO_CACHE", cache.VERSAO_CACHE + 1)
+    obter(csv_pequeno, leitor)
+    assert leitor.leituras == 2
+
+def test_cache_corrompida_e_ignorada(csv_pequeno, pasta_cache):
+    leitor = Leitor()
+    obter(csv_pequeno, leitor)
+    with open(cache.caminho_cache(csv_pequeno, "poblacion"), "wb") as f:
+        f.write(b"nao e um npz")
+    dados = obter(csv_pequeno, leitor)
+    assert leitor.leituras == 2
+    assert dados.linha("28")[0] == 6507184
+
+def test_sem_cache_nao_le_nem_grava(csv_pequeno, pasta_cache):
+    leitor = Leitor()
+    obter(csv_pequeno, leitor, usar_cache=False)
+    obter(csv_pequeno, leitor, usar_cache=False)
+    assert leitor.leituras == 2
+    assert not os.path.exists(pasta_cache)
+
+def test_carregar_poblacion_le_uma_vez_por_execucao(csv_pequeno, pasta_cache, monkeypatch):
+    monkeypatch.setattr(funciones, "_entradas_lidas", {})
+    assert funciones.carregar_poblacion(csv_pequeno) is funciones.carregar_poblacion(csv_pequeno)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from conftest import escrever_csv
+from funciones import (converter_celula, converter_celulas, detetar_formato, ler_poblacion,
+                       FORMATO_DECIMAL, FORMATO_ESPANHOL, cod_nacional)
+
+def test_decimal_do_ine_nao_multiplica_por_dez():
+    #"390032.0" sem o ponto seria 3900320
+    assert converter_celula("390032.0") == 390032
+    assert converter_celula("4.6572132E7") == 46572132
+    assert converter_celula("2.284361E7") == 22843610
+
+def test_separadores_espanhois():
+    assert converter_celula("1.234.567") == 1234567
+    assert converter_celula("1.234,6") == 1235
+    assert converter_celula("") == 0
+
+def test_ponto_com_tres_digitos_depende_do_bloco():
+    #sozinho é separador de milhares (as populações são inteiras)...
+    assert detetar_formato(["390.032"]) == FORMATO_ESPANHOL
+    assert converter_celulas(["390.032"])[0].tolist() == [390032]
+    #...mas num bloco com decimais do INE é um decimal
+    assert detetar_formato(["390.032", "390032.0"]) == FORMATO_DECIMAL
+
+def test_decimal_fora_da_amostra_muda_o_formato(monkeypatch):
+    import funciones
+    monkeypatch.setattr(funciones, "AMOSTRA_FORMATO", 2)
+    valores, validos = converter_celulas(["1.500", "2.250", "390032.0"])
+    assert validos.all()
+    assert valores.tolist() == [2, 2, 390032]
+
+def test_celulas_invalidas_ficam_marcadas():
+    valores, validos = converter_celulas(["12.0", "abc", "nan", "7"])
+    assert validos.tolist() == [True, False, False, True]
+    assert valores.tolist() == [12, 0, 0, 7]
+    with pytest.raises(ValueError):
+        converter_celula("abc")
+
+def test_ler_poblacion(csv_pequeno):
+    dados = ler_poblacion(csv_pequeno)
+    assert dados.anos == [2017, 2016, 2015]
+    assert dados.sexos == ["Total", "Hombres", "Mujeres"]
+    assert dados.codigos.tolist() == [cod_nacional, "02", "28"]
+    assert dados.linha("02")[:3].tolist() == [390032, 392118, 394580]
+    assert dados.linha(cod_nacional)[0] == 46572132
+    assert dados.matriz.dtype == np.int64
+
+def test_linha_invalida_e_ignorada(tmp_path, capsys):
+    ficheiro = escrever_csv(tmp_path / "p.csv", [
+        ("02 Albacete", ["1.0"] * 9),
+        ("03 Alicante", ["x"] + ["1.0"] * 8),
+    ])
+    dados = ler_poblacion(ficheiro, tamanho_bloco=1)
+    assert dados.codigos.tolist() == ["02"]
+    assert "AVISO" in capsys.readouterr().out
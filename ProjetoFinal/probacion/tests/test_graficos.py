@@ -0,0 +1,26 @@
+import os
+import graficos
+from funciones import ler_poblacion
+
+DIC_CCAA = {"07": "Castilla-La Mancha", "13": "Madrid"}
+DIC_MAPA = {"02": "07", "28": "13"}
+
+def test_tarefas_regioes_com_linhas_e_barras(csv_pequeno):
+    tarefas = graficos.tarefas_regioes(ler_poblacion(csv_pequeno), DIC_CCAA, DIC_MAPA)
+    tipos = [(tipo, os.path.basename(destino)) for tipo, destino, _ in tarefas]
+    assert tipos == [("linhas", "07.png"), ("barras", "07-provincias.png"),
+                     ("linhas", "13.png"), ("barras", "13-provincias.png"),
+                     ("linhas", "02.png"), ("linhas", "28.png")]
+    #barras: homens e mulheres das províncias da CCAA no ano mais recente
+    barras = tarefas[1][2]
+    assert (barras["nomes"], barras["hombres"], barras["mujeres"]) == (["Albacete"], [194743], [195289])
+    assert "2017" in barras["titulo"]
+
+def test_renderizar_lote_grava_os_dois_tipos(csv_pequeno, tmp_path):
+    tarefas = graficos.tarefas_regioes(ler_poblacion(csv_pequeno), DIC_CCAA, DIC_MAPA)[:2]
+    tarefas = [(tipo, str(tmp_path / os.path.basename(destino)), argumentos) for tipo, destino, argumentos in tarefas]
+    tempos = graficos.renderizar_lote(tarefas, jobs=1)
+    assert [destino for destino, _ in tempos] == [destino for _, destino, _ in tarefas]
+    for destino, _ in tempos:
+        with open(destino, "rb") as f:
+            assert f.read(8) == b"\x89PNG\r\n\x1a\n"
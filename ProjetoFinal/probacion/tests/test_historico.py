@@ -0,0 +1,112 @@
+import os
+import numpy as np
+import pytest
+from funciones import Poblacion, ler_poblacion
+from historico import Historico, REGISTO_REVISAO
+
+SEXOS = ["Total", "Hombres", "Mujeres"]
+
+def publicacao(codigos, anos, valores):
+    #valores: regiões x sexos x anos (anos do mais recente para o mais antigo)
+    cubo = np.asarray(valores, dtype=np.int64)
+    return Poblacion(codigos, [f"Região {c}" for c in codigos], cubo.reshape(len(codigos), -1), anos, SEXOS)
+
+def cubo_aleatorio(n_regioes, n_anos, semente):
+    return np.random.default_rng(semente).integers(1, 10**6, size=(n_regioes, len(SEXOS), n_anos))
+
+def iguais(a, b):
+    return (a.codigos.tolist() == b.codigos.tolist() and a.nomes.tolist() == b.nomes.tolist()
+            and a.anos == b.anos and a.sexos == b.sexos and np.array_equal(a.matriz, b.matriz))
+
+def test_ida_e_volta_do_csv(csv_pequeno, tmp_path):
+    dados = ler_poblacion(csv_pequeno)
+    historico = Historico(str(tmp_path / "h"))
+    resumo = historico.ingerir(dados, origem=csv_pequeno)
+    assert resumo["anos_novos"] == [2015, 2016, 2017]
+    #um objeto novo só lê o que está no disco
+    assert iguais(Historico(str(tmp_path / "h")).poblacion(), dados)
+
+def test_publicacao_seguinte_so_acrescenta_o_novo(tmp_path):
+    pasta = str(tmp_path / "h")
+    anos_1 = [2016, 2015, 2014]
+    cubo_1 = cubo_aleatorio(3, 3, 1)
+    Historico(pasta).ingerir(publicacao(["01", "02", "03"], anos_1, cubo_1))
+
+    #a publicação seguinte traz 2017, uma região nova e uma célula de 2015 revista
+    anos_2 = [2017] + anos_1
+    cubo_2 = np.concatenate([cubo_aleatorio(4, 1, 2), np.concatenate([cubo_1, cubo_aleatorio(1, 3, 3)])], axis=2)
+    cubo_2[1, 2, 2] += 7
+    historico = Historico(pasta)
+    ficheiro_2016 = os.path.join(pasta, "ano-2016.npy")
+    antes = os.stat(ficheiro_2016).st_mtime_ns
+    resumo = historico.ingerir(publicacao(["01", "02", "03", "04"], anos_2, cubo_2))
+
+    #os anos já guardados não são reescritos: a célula revista e os 3 anos x 3
+    #sexos da região nova nesses anos vão para o registo de revisões
+    assert resumo == dict(resumo, regioes_novas=1, anos_novos=[2017], celulas_revistas=1 + 9)
+    assert os.stat(ficheiro_2016).st_mtime_ns == antes
+    assert os.path.getsize(os.path.join(pasta, "revisoes.bin")) == 10 * REGISTO_REVISAO.itemsize
+    assert iguais(Historico(pasta).poblacion(), publicacao(["01", "02", "03", "04"], anos_2, cubo_2))
+
+def test_janela_e_regioes_incompletas(tmp_path):
+    pasta = str(tmp_path / "h")
+    cubo_1 = cubo_aleatorio(2, 2, 4)
+    Historico(pasta).ingerir(publicacao(["01", "02"], [2016, 2015], cubo_1))
+    cubo_2 = cubo_aleatorio(3, 1, 5)
+    Historico(pasta).ingerir(publicacao(["01", "02", "03"], [2017], cubo_2))
+    historico = Historico(pasta)
+
+    #a região 03 só existe em 2017: fica de fora quando a janela inclui anos antes dela
+    completa = historico.poblacion()
+    assert completa.codigos.tolist() == ["01", "02"]
+    assert completa.anos == [2017, 2016, 2015]
+    assert historico.poblacion((2017, 2017)).codigos.tolist() == ["01", "02", "03"]
+    assert np.array_equal(historico.poblacion((2015, 2016)).cubo(), cubo_1)
+    with pytest.raises(ValueError):
+        historico.poblacion((2000, 2001))
+
+def test_compactar_mantem_os_valores(tmp_path):
+    pasta = str(tmp_path / "h")
+    cubo = cubo_aleatorio(2, 2, 6)
+    Historico(pasta).ingerir(publicacao(["01", "02"], [2016, 2015], cubo))
+    cubo[0, 1, 1] += 1
+    cubo[1, 0, 0] -= 1
+    Historico(pasta).ingerir(publicacao(["01", "02"], [2016, 2015], cubo))
+    historico = Historico(pasta)
+    antes = historico.poblacion()
+
+    assert historico.compactar() == 2
+    assert not os.path.exists(os.path.join(pasta, "revisoes.bin"))
+    assert iguais(Historico(pasta).poblacion(), antes)
+    assert np.array_equal(antes.cubo(), cubo)
+
+def test_cli_ingerir_nao_guarda_as_publicacoes(csv_pequeno, tmp_path, monkeypatch, capsys):
+    #cada publicação é lida uma vez: nem cache em disco nem cópia na memória do processo
+    import cache
+    import funciones
+    import historico
+
+    def sem_cache(*args):
+        raise AssertionError("a ingestão não deve gravar a cache")
+    monkeypatch.setattr(cache, "gravar_cache", sem_cache)
+
+    assert historico.main(["--pasta", str(tmp_path / "h"), "ingerir", csv_pequeno]) == 0
+    assert "SUCESSO!" in capsys.readouterr().out
+    assert ("poblacion", os.path.abspath(csv_pequeno)) not in funciones._entradas_lidas
+
+def test_comparacao_usa_os_valores_ja_revistos(tmp_path):
+    pasta = str(tmp_path / "h")
+    anos = [2016, 2015]
+    cubo_1 = cubo_aleatorio(2, 2, 7)
+    Historico(pasta).ingerir(publicacao(["01", "02"], anos, cubo_1))
+    cubo_2 = cubo_1.copy()
+    cubo_2[0, 1, 0] += 5
+    cubo_2[1, 2, 1] += 3
+    assert Historico(pasta).ingerir(publicacao(["01", "02"], anos, cubo_2))["celulas_revistas"] == 2
+
+    #a mesma publicação outra vez não traz revisões; voltar ao valor antigo traz uma
+    assert Historico(pasta).ingerir(publicacao(["01", "02"], anos, cubo_2))["celulas_revistas"] == 0
+    cubo_3 = cubo_2.copy()
+    cubo_3[0, 1, 0] = cubo_1[0, 1, 0]
+    assert Historico(pasta).ingerir(publicacao(["01", "02"], anos, cubo_3))["celulas_revistas"] == 1
+    assert iguais(Historico(pasta).poblacion(), publicacao(["01", "02"], anos, cubo_3))
@@ -0,0 +1,41 @@
+import os
+import pytest
+from caminhos import indice_paginas
+from paginacao import escritor_relatorio
+
+CABECALHO = "<table><tbody>"
+RODAPE = "</tbody></table></body>"
+MODELO = "<tr><td>{}</td></tr>"
+
+def escrever(destino, modo, linhas=5, erro=None):
+    with escritor_relatorio(destino, CABECALHO, RODAPE, MODELO, modo=modo) as r:
+        for i in range(linhas):
+            r.linha(i)
+        if erro:
+            raise erro
+
+def test_troca_de_modo_apaga_paginas_do_anterior(tmp_path, monkeypatch):
+    monkeypatch.setenv("PTC_HTML_LINHAS", "2")
+    destino = str(tmp_path / "r.html")
+    escrever(destino, "estatico")
+    assert os.path.exists(tmp_path / "r-3.html")
+
+    escrever(destino, "paginado")
+    assert not os.path.exists(tmp_path / "r-2.html")
+    assert os.path.exists(tmp_path / "r_dados" / "0003.js")
+
+    escrever(destino, "completo")
+    assert sorted(os.listdir(tmp_path)) == ["r.html"]
+    assert not os.path.exists(indice_paginas(destino))
+
+def test_falha_a_meio_mantem_paginas_anteriores(tmp_path, monkeypatch):
+    #as páginas do modo anterior só se apagam depois de o novo relatório ficar escrito
+    monkeypatch.setenv("PTC_HTML_LINHAS", "2")
+    destino = str(tmp_path / "r.html")
+    escrever(destino, "estatico")
+    antes = sorted(os.listdir(tmp_path))
+
+    for modo in ("completo", "paginado"):
+        with pytest.raises(ValueError):
+            escrever(destino, modo, erro=ValueError("falha"))
+        assert set(antes) <= set(os.listdir(tmp_path))
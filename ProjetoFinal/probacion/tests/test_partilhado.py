@@ -0,0 +1,38 @@
+import os
+import pytest
+from multiprocessing import shared_memory
+import partilhado
+from funciones import VAR_PARTILHADO, ler_poblacion
+
+DIC_CCAA = {"07": "Castilla-La Mancha", "13": "Madrid"}
+DIC_MAPA = {"02": "07", "28": "13"}
+
+def test_publicar_e_fechar(csv_pequeno):
+    with partilhado.publicar(ler_poblacion(csv_pequeno), DIC_CCAA, DIC_MAPA) as publicacao:
+        assert os.environ[VAR_PARTILHADO] == publicacao.nome
+        shared_memory.SharedMemory(publicacao.nome).close()
+    assert VAR_PARTILHADO not in os.environ
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(publicacao.nome)
+
+def test_falha_ao_preencher_apaga_o_segmento(csv_pequeno, monkeypatch):
+    criados = []
+
+    class SegmentoSoLeitura(shared_memory.SharedMemory):
+        #o preenchimento falha logo na primeira escrita
+        @property
+        def buf(self):
+            return super().buf.toreadonly()
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            criados.append(self.name)
+
+    monkeypatch.setattr(partilhado.shared_memory, "SharedMemory", SegmentoSoLeitura)
+    with pytest.raises(TypeError):
+        partilhado.publicar(ler_poblacion(csv_pequeno), DIC_CCAA, DIC_MAPA)
+    monkeypatch.undo()
+
+    assert len(criados) == 1 and VAR_PARTILHADO not in os.environ
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(criados[0])
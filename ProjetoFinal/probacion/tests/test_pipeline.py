@@ -0,0 +1,142 @@
+import os
+import sys
+import textwrap
+import pytest
+import pipeline
+
+@pytest.fixture
+def modulos(tmp_path, monkeypatch):
+    """
+    Cria módulos de etapa em tmp_path: modulos(nome, corpo do main()).
+    """
+    pasta = tmp_path / "modulos"
+    pasta.mkdir()
+    monkeypatch.syspath_prepend(str(pasta))
+    criados = []
+
+    def criar(nome, corpo):
+        (pasta / f"{nome}.py").write_text("import os\n\ndef main():\n" + textwrap.indent(textwrap.dedent(corpo), "    "))
+        criados.append(nome)
+        sys.modules.pop(nome, None)
+        return nome
+
+    yield criar
+    for nome in criados:
+        sys.modules.pop(nome, None)
+
+def escrever(caminho, texto="x"):
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write(texto)
+
+@pytest.fixture
+def entrada(tmp_path):
+    caminho = str(tmp_path / "entrada.txt")
+    escrever(caminho, "1")
+    return caminho
+
+def manifesto(tmp_path):
+    return pipeline.Manifesto(str(tmp_path / "manifesto.json"))
+
+def test_sem_alteracoes_salta(tmp_path, modulos, entrada):
+    saida = str(tmp_path / "a.html")
+    modulos("etapa_a", f"open({saida!r}, 'w').write('a')\nreturn 0\n")
+    etapas = [pipeline.Etapa("A", "etapa_a", [entrada], [saida])]
+
+    assert pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path))["A"] is not None
+    assert pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path)) == {"A": None}
+    #com a entrada alterada volta a correr
+    escrever(entrada, "22") #outro tamanho: não depende da resolução do mtime
+    assert pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path))["A"] is not None
+    #e com forcar=True corre sempre
+    assert pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path), forcar=True)["A"] is not None
+
+def test_erro_declarado_falha_e_nao_fica_no_manifesto(tmp_path, modulos, entrada):
+    saida = str(tmp_path / "a.html")
+    escrever(saida, "antiga")
+    modulos("etapa_erro", "print('ERRO: sem dados')\nreturn 1\n")
+    etapas = [pipeline.Etapa("A", "etapa_erro", [entrada], [saida])]
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="A terminou com erro"):
+            pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path))
+    assert "A" not in manifesto(tmp_path).etapas
+
+def test_saida_antiga_nao_reescrita_conta_como_falha(tmp_path, modulos, entrada):
+    #a saída de uma execução anterior, acabada de gravar, não passa por nova
+    saida = str(tmp_path / "a.html")
+    escrever(saida, "antiga")
+    modulos("etapa_preguicosa", "return 0\n")
+    etapas = [pipeline.Etapa("A", "etapa_preguicosa", [entrada], [saida])]
+
+    with pytest.raises(RuntimeError, match="não gerou"):
+        pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path))
+    assert "A" not in manifesto(tmp_path).etapas
+
+def test_sem_estado_corre_mas_nao_fica_no_manifesto(tmp_path, modulos, entrada):
+    saida = str(tmp_path / "a.html")
+    modulos("etapa_sem_estado", f"open({saida!r}, 'w').write('a')\n")
+    etapas = [pipeline.Etapa("A", "etapa_sem_estado", [entrada], [saida])]
+
+    assert pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path))["A"] is not None
+    assert pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path))["A"] is not None
+    assert "A" not in manifesto(tmp_path).etapas
+
+def test_dependente_nao_corre_se_a_dependencia_falha(tmp_path, modulos, entrada):
+    intermedia = str(tmp_path / "b.png")
+    saida = str(tmp_path / "a.html")
+    modulos("etapa_b_falha", "return 1\n")
+    modulos("etapa_a_depende", f"open({saida!r}, 'w').write('a')\nreturn 0\n")
+    etapas = [pipeline.Etapa("A", "etapa_a_depende", [entrada, intermedia], [saida]),
+              pipeline.Etapa("B", "etapa_b_falha", [entrada], [intermedia])]
+
+    with pytest.raises(RuntimeError) as erro:
+        pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path))
+    assert "A: dependência falhou" in str(erro.value)
+    assert not os.path.exists(saida)
+
+def test_a_correr_inclui_as_dependentes(tmp_path, modulos, entrada):
+    intermedia = str(tmp_path / "b.png")
+    saida = str(tmp_path / "a.html")
+    modulos("etapa_b", f"open({intermedia!r}, 'w').write('b')\nreturn 0\n")
+    modulos("etapa_a", f"open({saida!r}, 'w').write('a')\nreturn 0\n")
+    outra = str(tmp_path / "outra.txt")
+    escrever(outra)
+    etapas = [pipeline.Etapa("A", "etapa_a", [outra, intermedia], [saida]),
+              pipeline.Etapa("B", "etapa_b", [entrada], [intermedia])]
+
+    pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path))
+    assert pipeline.a_correr(etapas, manifesto(tmp_path)) == []
+    escrever(entrada, "22") #outro tamanho: não depende da resolução do mtime
+    assert [e.nome for e in pipeline.a_correr(etapas, manifesto(tmp_path))] == ["A", "B"]
+    assert len(pipeline.a_correr(etapas, manifesto(tmp_path), forcar=True)) == 2
+
+def test_ciclo_entre_etapas():
+    etapas = [pipeline.Etapa("A", "a", ["b.txt"], ["a.txt"]), pipeline.Etapa("B", "b", ["a.txt"], ["b.txt"])]
+    with pytest.raises(ValueError, match="ciclo"):
+        pipeline.ordenar(etapas, pipeline.dependencias(etapas))
+
+@pytest.mark.parametrize("modo", ["paginado", "estatico"])
+def test_paginas_apagadas_voltam_a_ser_geradas(tmp_path, modulos, entrada, monkeypatch, modo):
+    #o número de páginas só se sabe ao escrever: as que o índice lista contam como saídas
+    from caminhos import indice_paginas
+    monkeypatch.setenv("PTC_HTML_LINHAS", "2")
+    saida = str(tmp_path / "a.html")
+    modulos(f"etapa_{modo}", f"""
+        from paginacao import escritor_relatorio
+        with escritor_relatorio({saida!r}, "<table><tbody>", "</tbody></table></body>", "<tr><td>{{}}</td></tr>",
+                                modo={modo!r}) as r:
+            for i in range(5):
+                r.linha(i)
+        return 0
+        """)
+    indice = indice_paginas(saida)
+    etapas = [pipeline.Etapa("A", f"etapa_{modo}", [entrada], [saida, indice], indices=[indice])]
+
+    assert pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path))["A"] is not None
+    paginas = pipeline._listados(indice)
+    assert len(paginas) == 2
+    assert pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path)) == {"A": None}
+
+    os.remove(paginas[-1])
+    assert pipeline.executar(etapas, jobs=1, manifesto=manifesto(tmp_path))["A"] is not None
+    assert all(os.path.exists(p) for p in paginas)
@@ -0,0 +1,102 @@
+import gzip
+import re
+import threading
+import urllib.error
+import urllib.request
+import pytest
+import servidor
+
+@pytest.fixture(scope="module")
+def base():
+    #os ficheiros reais de 'entradas', com a cache de respostas deste servidor
+    aplicacao = servidor.Aplicacao(servidor.Entradas(intervalo=60))
+    http = servidor.criar_servidor(porta=0, aplicacao=aplicacao, silencioso=True)
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    host, porta = http.server_address[:2]
+    yield f"http://{host}:{porta}"
+    http.shutdown()
+    http.server_close()
+
+def pedir(url, **cabecalhos):
+    try:
+        resposta = urllib.request.urlopen(urllib.request.Request(url, headers=cabecalhos))
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+    return resposta.status, resposta.headers, resposta.read()
+
+@pytest.mark.parametrize("cabecalho, corresponde", [
+    ('"abc"', True),
+    ('"x", "abc"', True),
+    ('"x","abc" , "y"', True),
+    ('W/"abc"', True),
+    ('*', True),
+    ('"ab"', False),
+    ('"abcd"', False),
+    ('"xabc"', False),
+    ('', False),
+    (None, False),
+])
+def test_etag_corresponde(cabecalho, corresponde):
+    assert servidor.etag_corresponde('"abc"', cabecalho) is corresponde
+
+def test_304_com_o_etag_da_resposta(base):
+    estado, cabecalhos, corpo = pedir(base + "/R1")
+    assert estado == 200 and corpo
+    etag = cabecalhos["ETag"]
+
+    estado, cabecalhos, corpo = pedir(base + "/R1", **{"If-None-Match": etag})
+    assert (estado, corpo) == (304, b"")
+    assert cabecalhos["ETag"] == etag
+    assert pedir(base + "/R1", **{"If-None-Match": f'"outro", {etag}'})[0] == 304
+    #um ETag que só contém parte do atual não serve
+    assert pedir(base + "/R1", **{"If-None-Match": etag[:-3] + '"'})[0] == 200
+
+def test_etag_muda_com_os_filtros_e_cache(base):
+    _, completo, _ = pedir(base + "/R2")
+    _, filtrado, _ = pedir(base + "/R2?anos=2013-2016")
+    assert completo["ETag"] != filtrado["ETag"]
+    #a mesma página com os filtros noutra ordem vem da cache
+    _, outra_ordem, _ = pedir(base + "/R2?ccaa=13,01&anos=2016-2013")
+    _, repetido, _ = pedir(base + "/R2?anos=2013-2016&ccaa=01,13")
+    assert repetido["X-Cache"] == "HIT"
+    assert repetido["ETag"] == outra_ordem["ETag"]
+
+@pytest.mark.parametrize("cabecalho, aceita", [
+    (None, False),
+    ("gzip", True),
+    ("deflate, gzip;q=0.5", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.0, br", False),
+    ("*", True),
+    ("*;q=0", False),
+    ("gzip;q=0, *", False),
+    ("x-gzip", True),
+    ("identity", False),
+    ("gzip;q=abc", False),
+])
+def test_aceita_gzip(cabecalho, aceita):
+    assert servidor.aceita_gzip(cabecalho) is aceita
+
+def test_gzip(base):
+    estado, cabecalhos, corpo = pedir(base + "/R1", **{"Accept-Encoding": "gzip"})
+    assert cabecalhos["Content-Encoding"] == "gzip"
+    assert cabecalhos["Vary"] == "Accept-Encoding"
+    _, simples, original = pedir(base + "/R1", **{"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in simples and simples["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(corpo) == original
+    estado, cabecalhos, _ = pedir(base + "/R1", **{"If-None-Match": simples["ETag"]})
+    assert estado == 304 and cabecalhos["Vary"] == "Accept-Encoding"
+
+def test_grafico_das_paginas_filtradas(base):
+    _, _, corpo = pedir(base + "/R2?ccaa=13,01&anos=2013-2016")
+    imagem = re.search(r'<img src="([^"]+)"', corpo.decode("utf-8")).group(1)
+    assert imagem == "../imagenes/R3.png?anos=2013-2016&amp;ccaa=01,13"
+    estado, cabecalhos, png = pedir(base + "/imagenes/R3.png?anos=2013-2016&ccaa=01,13")
+    assert estado == 200 and cabecalhos["Content-Type"] == "image/png"
+    assert png != pedir(base + "/imagenes/R3.png")[2]
+
+def test_pedidos_invalidos(base):
+    assert pedir(base + "/R1?anos=x-y")[0] == 400
+    assert pedir(base + "/R4?anos=2017")[0] == 400
+    assert pedir(base + "/R2?ccaa=99")[0] == 404
+    assert pedir(base + "/nada")[0] == 404